@@ -23,8 +23,7 @@ mkdir -p "$RESOURCES"
 
 # Copy all project files
 echo "📦 Copying project files..."
-cp gui_app.py "$RESOURCES/"
-cp kling_engine.py "$RESOURCES/"
+cp *.py "$RESOURCES/"
 cp README.md "$RESOURCES/"
 cp GUIDE.md "$RESOURCES/"
 
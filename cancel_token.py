@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Shared stop/pause state for every wait in the engine, and a pausable clock.
+
+stop() must land within a fraction of a second, wherever the browser
+thread happens to be waiting.  All engine waits go through the token:
+plain sleeps wake on the stop event immediately, and Playwright waits are
+cut into short slices with a check in between.  A stop surfaces as
+Cancelled, a BaseException, so the engine's `except Exception` failure
+handling never mistakes it for a job failure.
+
+Pause freezes engine sleeps, and the time spent paused is kept, so
+age-based timeouts (a render is given up after MAX_RENDER_AGE) only count
+running time.
+
+Because every wait passes through the token, seen_at (the last time the
+waiting thread checked in) doubles as a liveness signal: a thread stuck
+in a call that never returns stops advancing it.
+"""
+import threading
+import time
+from typing import List, Optional, Tuple
+
+SLICE = 0.2  # longest uninterruptible piece of a wait
+
+
+class Cancelled(BaseException):
+    """stop() was requested while waiting"""
+
+
+class CancelToken:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.stop_event = threading.Event()
+        self.pause_event = threading.Event()
+        self.lock = threading.Lock()
+        self.paused_since: Optional[float] = None
+        self.paused_intervals: List[Tuple[float, float]] = []
+        self.seen_at = clock()  # last check-in of the waiting thread
+
+    # --- state ---
+
+    def stop(self):
+        self.stop_event.set()
+
+    def pause(self):
+        with self.lock:
+            if not self.pause_event.is_set():
+                self.paused_since = self.clock()
+                self.pause_event.set()
+
+    def resume(self):
+        with self.lock:
+            if self.pause_event.is_set():
+                self.paused_intervals.append((self.paused_since, self.clock()))
+                self.paused_since = None
+                self.pause_event.clear()
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_event.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return self.pause_event.is_set()
+
+    def check(self):
+        self.seen_at = self.clock()
+        if self.stop_event.is_set():
+            raise Cancelled()
+
+    # --- waits ---
+
+    def sleep(self, seconds: float, pausable: bool = True):
+        """Sleep that stop() cuts short (raises Cancelled); with pausable, paused time does not count"""
+        remaining = seconds
+        last = self.clock()
+        while remaining > 0:
+            self.seen_at = self.clock()
+            if self.stop_event.is_set():
+                raise Cancelled()
+            if pausable and self.pause_event.is_set():
+                self.stop_event.wait(SLICE)
+                last = self.clock()
+                continue
+            self.stop_event.wait(min(SLICE, remaining) if pausable else remaining)
+            now = self.clock()
+            remaining -= now - last
+            last = now
+        self.check()
+
+    def wait_while_paused(self, tick=None):
+        """Block while paused (tick() runs every slice, e.g. to serve session saves)"""
+        while self.pause_event.is_set():
+            self.check()
+            if tick:
+                tick()
+            self.stop_event.wait(SLICE)
+        self.check()
+
+    # --- pausable clock ---
+
+    def paused_between(self, start: float, end: float) -> float:
+        with self.lock:
+            intervals = list(self.paused_intervals)
+            if self.paused_since is not None:
+                intervals.append((self.paused_since, end))
+        return sum(max(0.0, min(b, end) - max(a, start)) for a, b in intervals)
+
+    def active_since(self, start: float) -> float:
+        """Seconds since start, not counting time spent paused"""
+        now = self.clock()
+        return now - start - self.paused_between(start, now)
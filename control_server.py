@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""Local HTTP control API around a KlingEngine.
+
+Endpoints (JSON in/out):
+    GET  /status                 engine state, job counts, dead letters
+    GET  /events                 Server-Sent Events stream (log, progress, job, ...)
+    POST /batches                {"root": "...", "folders": ["a", "b"]} -> plan totals
+    POST /pause | /resume | /stop | /save-session
+    POST /priority               {"folder": "a", "priority": 5}  (no priority = move to front)
+    POST /policy                 {"policy": "fifo" | "shortest_prompt" | "deadline"}
+    POST /profiling              {"sampling": true, "trace": "off" | "slow" | "all",
+                                  "slow_seconds": 30, "trace_jobs": ["folder/1.png"]}
+
+Binds to 127.0.0.1 by default.  Listening on another interface requires a
+token, sent by clients as "Authorization: Bearer <token>".
+"""
+import json
+import queue
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from kling_engine import KlingEngine
+from cancel_token import Cancelled
+from job_planner import empty_plan
+from job_scheduler import POLICIES
+from job_tracer import MODES as TRACE_MODES
+
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+SSE_HEARTBEAT_SECONDS = 15.0
+
+
+class EventHub:
+    """Fans engine events out to every connected stream; slow clients lose their oldest events"""
+    def __init__(self, max_queue: int = 1000):
+        self.max_queue = max_queue
+        self.subscribers: List[queue.Queue] = []
+        self.lock = threading.Lock()
+        self.last_progress: Optional[Dict] = None
+
+    def subscribe(self) -> queue.Queue:
+        q = queue.Queue(maxsize=self.max_queue)
+        with self.lock:
+            self.subscribers.append(q)
+            if self.last_progress:
+                q.put_nowait(self.last_progress)
+        return q
+
+    def unsubscribe(self, q: queue.Queue):
+        with self.lock:
+            if q in self.subscribers:
+                self.subscribers.remove(q)
+
+    def publish(self, event: Dict):
+        if event['type'] == 'progress':
+            self.last_progress = event
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                    q.put_nowait(event)
+                except (queue.Empty, queue.Full):
+                    pass
+
+
+class ControlServer:
+    def __init__(self, engine: KlingEngine, host: str = "127.0.0.1", port: int = 8765, token: Optional[str] = None):
+        if host not in LOOPBACK_HOSTS and not token:
+            raise ValueError("A token is required when listening on a non-loopback address")
+        self.engine = engine
+        self.token = token
+        self.hub = EventHub()
+        engine.add_event_listener(self.hub.publish)
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.httpd.server_address[:2]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="kling-control", daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        self.engine.remove_event_listener(self.hub.publish)
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle_command(self, path: str, body: Dict):
+        """Returns (http status, response dict) for a POST"""
+        engine = self.engine
+        if path == "/batches":
+            root = body.get('root')
+            if not root:
+                return 400, {'error': "'root' is required"}
+            plan = engine.submit_batch(root, body.get('folders'))
+            return 202, {'totals': plan['totals'], 'estimated_seconds': plan['estimated_seconds'], 'warnings': plan['warnings']}
+        if path == "/pause":
+            engine.pause()
+            return 200, {'state': 'paused'}
+        if path == "/resume":
+            engine.resume()
+            return 200, {'state': 'running'}
+        if path == "/stop":
+            engine.stop()
+            return 200, {'state': 'stopping'}
+        if path == "/save-session":
+            ok, message = engine.request_save_session()
+            return (200 if ok else 409), {'ok': ok, 'message': message}
+        if path == "/priority":
+            folder = body.get('folder')
+            if not folder:
+                return 400, {'error': "'folder' is required"}
+            if body.get('priority') is None:
+                engine.prioritize_folder(folder)
+            else:
+                engine.set_folder_priority(folder, int(body['priority']))
+            return 200, {'folder': folder}
+        if path == "/profiling":
+            if body.get('trace') is not None and body['trace'] not in TRACE_MODES:
+                return 400, {'error': f"trace must be one of {', '.join(TRACE_MODES)}"}
+            engine.set_profiling(
+                sampling=body.get('sampling'),
+                trace=body.get('trace'),
+                slow_seconds=body.get('slow_seconds'),
+                trace_jobs=body.get('trace_jobs'),
+            )
+            return 202, {'ok': True}
+        if path == "/policy":
+            policy = body.get('policy')
+            if policy not in POLICIES:
+                return 400, {'error': f"policy must be one of {', '.join(POLICIES)}"}
+            engine.set_schedule_policy(policy)
+            return 200, {'policy': policy}
+        return 404, {'error': f"Unknown endpoint {path}"}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass  # requests are not worth a line in the engine log
+
+            def _authorized(self) -> bool:
+                if not server.token:
+                    return True
+                return self.headers.get("Authorization") == f"Bearer {server.token}"
+
+            def _send_json(self, status: int, payload: Dict):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if not self._authorized():
+                    return self._send_json(401, {'error': 'unauthorized'})
+                if self.path == "/status":
+                    return self._send_json(200, server.engine.status_snapshot())
+                if self.path == "/events":
+                    return self._stream_events()
+                self._send_json(404, {'error': f"Unknown endpoint {self.path}"})
+
+            def do_POST(self):
+                if not self._authorized():
+                    return self._send_json(401, {'error': 'unauthorized'})
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    return self._send_json(400, {'error': 'invalid JSON body'})
+                try:
+                    status, payload = server.handle_command(self.path, body)
+                except Exception as e:
+                    status, payload = 500, {'error': str(e)}
+                self._send_json(status, payload)
+
+            def _stream_events(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                events = server.hub.subscribe()
+                try:
+                    while True:
+                        try:
+                            event = events.get(timeout=SSE_HEARTBEAT_SECONDS)
+                        except queue.Empty:
+                            self.wfile.write(b": keep-alive\n\n")
+                            self.wfile.flush()
+                            continue
+                        data = json.dumps(event, ensure_ascii=False)
+                        self.wfile.write(f"event: {event['type']}\ndata: {data}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    server.hub.unsubscribe(events)
+                    self.close_connection = True
+
+        return Handler
+
+
+def run_engine(engine: KlingEngine):
+    """Browser thread: launch, then serve batches until stop()"""
+    try:
+        engine.launch_browser()
+        engine.run(keep_alive=True)
+    except Cancelled:
+        engine.emit_event("finished", **engine.status_snapshot())
+    except Exception as e:
+        engine.log("ERROR", f"Engine crashed: {e}")
+        engine.emit_event("finished", error=str(e))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a headless Kling engine controlled over local HTTP")
+    parser.add_argument("--root", help="Initial root folder (optional - batches can be submitted later)")
+    parser.add_argument("--folders", nargs="*", help="Initial subfolders of --root")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token", help="Bearer token (required for non-loopback hosts)")
+    parser.add_argument("--concurrent", type=int, default=2)
+    parser.add_argument("--poll", type=float, default=10.0)
+    parser.add_argument("--show-browser", action="store_true", help="Do not run the browser headless")
+    parser.add_argument("--watch", action="store_true", help="Queue new folders, images and prompts.txt changes under --root as they appear")
+    parser.add_argument("--sink", action="append", default=[], metavar="SPEC",
+                        help="Also deliver finished videos to local:DIR, mirror:DIR or s3://bucket/prefix (repeatable)")
+    parser.add_argument("--post", nargs="*", default=[], metavar="STEP",
+                        help="Post-process finished videos: poster, manifest, reel (poster/reel need ffmpeg)")
+    args = parser.parse_args()
+    if args.watch and not args.root:
+        parser.error("--watch requires --root")
+
+    engine = KlingEngine(
+        root_folder=args.root or ".",
+        headless=not args.show_browser,
+        max_concurrent=args.concurrent,
+        poll_interval=args.poll,
+        selected_folders=args.folders,
+        plan=None if args.root else empty_plan(),
+        watch=args.watch,
+        sinks=args.sink,
+        post_steps=args.post
+    )
+    server = ControlServer(engine, args.host, args.port, args.token)
+    server.start()
+    print(f"[INFO] Control API on http://{args.host}:{server.address[1]}")
+
+    engine_thread = threading.Thread(target=run_engine, args=(engine,), name="kling-engine")
+    engine_thread.start()
+    try:
+        while engine_thread.is_alive():
+            engine_thread.join(timeout=0.5)
+    except KeyboardInterrupt:
+        engine.stop()
+        engine_thread.join()
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Live slot / throughput dashboard for the GUI.
+
+Fed with the engine's "metrics" events (already batched every few
+seconds); the panel keeps only the latest snapshot and repaints on a timer
+when it changed, so event bursts never turn into redraw bursts.
+"""
+from typing import Dict, List, Optional
+
+from PyQt6.QtWidgets import QGroupBox, QGridLayout, QLabel, QWidget, QSizePolicy
+from PyQt6.QtCore import Qt, QTimer, QPointF
+from PyQt6.QtGui import QPainter, QPen, QColor, QPolygonF
+
+from job_planner import format_duration
+
+REDRAW_MS = 1000
+
+
+class Sparkline(QWidget):
+    """Minimal line chart: one or two series, an optional dashed reference line"""
+    def __init__(self, title: str, color: str, second_color: Optional[str] = None, parent=None):
+        super().__init__(parent)
+        self.title = title
+        self.colors = [QColor(color), QColor(second_color or color)]
+        self.series: List[List[float]] = []
+        self.reference: Optional[float] = None
+        self.caption = ""
+        self.setMinimumHeight(60)
+        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+
+    def set_data(self, series: List[List[float]], reference: Optional[float] = None, caption: str = ""):
+        self.series = series
+        self.reference = reference
+        self.caption = caption
+        self.update()
+
+    def paintEvent(self, event):
+        p = QPainter(self)
+        p.setRenderHint(QPainter.RenderHint.Antialiasing)
+        p.fillRect(self.rect(), QColor("#1E1E1E"))
+        p.setPen(QColor("#888"))
+        p.drawText(self.rect().adjusted(6, 2, -6, 0), Qt.AlignmentFlag.AlignLeft, self.title)
+        p.drawText(self.rect().adjusted(6, 2, -6, 0), Qt.AlignmentFlag.AlignRight, self.caption)
+
+        points = [s for s in self.series if len(s) > 1]
+        if not points:
+            p.end()
+            return
+        top, bottom = 18, self.height() - 4
+        width = self.width() - 8
+        peak = max([max(s) for s in points] + [self.reference or 0, 1])
+        n = max(len(s) for s in points)
+
+        def y(v):
+            return bottom - (bottom - top) * v / peak
+
+        if self.reference is not None:
+            pen = QPen(QColor("#555"))
+            pen.setStyle(Qt.PenStyle.DashLine)
+            p.setPen(pen)
+            p.drawLine(QPointF(4, y(self.reference)), QPointF(4 + width, y(self.reference)))
+        for values, color in zip(self.series, self.colors):
+            if len(values) < 2:
+                continue
+            p.setPen(QPen(color, 1.5))
+            p.drawPolyline(QPolygonF([QPointF(4 + width * i / (n - 1), y(v)) for i, v in enumerate(values)]))
+        p.end()
+
+
+def pct(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.0%}"
+
+
+def seconds(stats: Dict, key: str) -> str:
+    return format_duration(stats[key]) if stats else "-"
+
+
+class DashboardPanel(QGroupBox):
+    def __init__(self, parent=None):
+        super().__init__("📈 Hiệu suất", parent)
+        self.snapshot: Optional[Dict] = None
+        self.dirty = False
+
+        layout = QGridLayout()
+        self.utilization_label = QLabel("Slot bận: -")
+        self.starved_label = QLabel("Trống khi còn job chờ: -")
+        self.render_label = QLabel("Render p50/p95: -")
+        self.download_label = QLabel("Tải p50/p95: -")
+        self.sink_label = QLabel("")
+        for i, label in enumerate((self.utilization_label, self.starved_label, self.render_label, self.download_label, self.sink_label)):
+            label.setStyleSheet("color: #BBB;")
+            layout.addWidget(label, i // 2, i % 2, 1, 2 if label is self.sink_label else 1)
+        self.starved_label.setToolTip("Slot trống trong khi vẫn còn job chờ: lỗi lập lịch, không phải do trang web")
+
+        self.slots_chart = Sparkline("Slot đang dùng / job chờ", "#0D7377", "#E0A040")
+        self.rate_chart = Sparkline("Video/giờ (10 phút gần nhất)", "#14FFEC")
+        layout.addWidget(self.slots_chart, 3, 0, 1, 2)
+        layout.addWidget(self.rate_chart, 4, 0, 1, 2)
+        self.setLayout(layout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.redraw)
+        self.timer.start(REDRAW_MS)
+
+    def set_snapshot(self, snapshot: Dict):
+        """Store the latest metrics; drawing happens on the timer"""
+        self.snapshot = snapshot
+        self.dirty = True
+
+    def redraw(self):
+        if not self.dirty or not self.snapshot:
+            return
+        self.dirty = False
+        s = self.snapshot
+        util = f"Slot bận: {pct(s['utilization'])} (đỉnh {s['peak_active']}/{s['max_concurrent']})"
+        if s['oversubscribed_seconds']:
+            util += f" | vượt {format_duration(s['oversubscribed_seconds'])}"
+        self.utilization_label.setText(util)
+        self.starved_label.setText(f"Trống khi còn job chờ: {pct(s['starved_share'])}")
+        r, d = s['render_seconds'], s['download_seconds']
+        self.render_label.setText(f"Render p50/p95: {seconds(r, 'p50')} / {seconds(r, 'p95')}")
+        self.download_label.setText(f"Tải p50/p95: {seconds(d, 'p50')} / {seconds(d, 'p95')}")
+
+        sinks = s.get('sinks')
+        if sinks:
+            parts = [f"{st['files']} file, {st['mb_per_s'] or '-'} MB/s" + (f", lỗi {st['failures']}" if st['failures'] else "")
+                     for st in sinks['sinks'].values()]
+            self.sink_label.setText(f"Sao chép: {' | '.join(parts)} (chờ {sinks['queued']})")
+
+        series = s.get('series') or {}
+        active, pending = series.get('active', []), series.get('pending', [])
+        self.slots_chart.set_data([active, pending], reference=s['max_concurrent'],
+                                  caption=f"{active[-1] if active else 0} / {pending[-1] if pending else 0}")
+        rates = series.get('jobs_per_hour', [])
+        rate = s['jobs_per_hour']
+        self.rate_chart.set_data([rates], caption=f"{rate:.1f}/giờ" if rate else "")
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Run KlingEngine in its own process, driven over a pair of queues.
+
+The GUI process keeps only the Qt event loop; Playwright, planning
+follow-ups and log formatting run in the engine process, so neither side
+competes with the other for the GIL and an engine crash (or a hung
+browser) cannot take the window down.
+
+Commands (GUI -> engine) are (name, args, kwargs) tuples:
+    start, stop, save_session, pause, resume, set_profiling,
+    prioritize_folder, set_folder_priority, set_schedule_policy
+Messages (engine -> GUI) are (kind, payload) tuples:
+    log (level, message) | progress (current, total) | event {engine event}
+    ready None | reply (command, ok, message) | exited None
+"""
+import queue
+import threading
+import traceback
+import multiprocessing as mp
+from typing import List, Tuple
+
+LOG = "log"
+PROGRESS = "progress"
+EVENT = "event"
+READY = "ready"
+REPLY = "reply"
+EXITED = "exited"
+
+# Engine methods the GUI may call directly (all thread-safe on the engine side)
+FORWARDED_CALLS = ("pause", "resume", "set_profiling", "prioritize_folder", "set_folder_priority", "set_schedule_policy")
+
+
+def command_loop(engine, commands, send, start_event: threading.Event):
+    """Engine process: apply GUI commands from a side thread while the browser thread works"""
+    while True:
+        name, args, kwargs = commands.get()
+        try:
+            if name == "start":
+                start_event.set()
+            elif name == "stop":
+                engine.stop()
+                start_event.set()
+            elif name == "save_session":
+                ok, message = engine.request_save_session()
+                send((REPLY, ("save_session", ok, message)))
+            elif name in FORWARDED_CALLS:
+                getattr(engine, name)(*args, **kwargs)
+            else:
+                send((LOG, ("WARNING", f"Unknown engine command: {name}")))
+        except Exception as e:
+            send((LOG, ("ERROR", f"Command {name} failed: {e}")))
+
+
+def host_main(engine_kwargs, commands, messages):
+    """Engine process entry point: launch the browser, wait for 'start', run"""
+    from kling_engine import KlingEngine
+    from cancel_token import Cancelled
+
+    send = messages.put
+    engine = KlingEngine(**engine_kwargs)
+
+    def log(level, message):
+        send((LOG, (level, message)))
+
+    def progress(current, total):
+        send((PROGRESS, (current, total)))
+
+    # Log lines already travel through log(); forwarding the 'log' events too would double them
+    engine.add_event_listener(lambda event: send((EVENT, event)) if event['type'] != 'log' else None)
+    start_event = threading.Event()
+    threading.Thread(target=command_loop, args=(engine, commands, send, start_event),
+                     name="engine-commands", daemon=True).start()
+    try:
+        log("INFO", "Đang khởi động trình duyệt...")
+        engine.launch_browser(log_callback=log)
+        log("SUCCESS", "Trình duyệt đã sẵn sàng!")
+        send((READY, None))
+
+        log("INFO", "Chờ lệnh bắt đầu xử lý...")
+        while not start_event.is_set() and not engine.is_stopped():
+            engine._handle_save_session()
+            engine.check_session(log)  # Saves state.json on its own once logged in
+            start_event.wait(timeout=0.1)
+
+        if not engine.is_stopped():
+            log("INFO", "Bắt đầu xử lý video...")
+            engine.run(log_callback=log, progress_callback=progress)
+    except Cancelled:
+        log("WARNING", "Đã dừng")
+    except Exception as e:
+        log("ERROR", f"Exception: {e}")
+        log("ERROR", traceback.format_exc())
+    finally:
+        try:
+            engine.close_browser()
+        except Exception:
+            pass
+        send((EXITED, None))
+
+
+class EngineHost:
+    """GUI side: owns the engine process and its two queues (no Qt in here)"""
+    def __init__(self, **engine_kwargs):
+        ctx = mp.get_context("spawn")  # a clean interpreter: no Qt state copied into the engine
+        self.commands = ctx.Queue()
+        self.messages = ctx.Queue()
+        self.process = ctx.Process(target=host_main, args=(engine_kwargs, self.commands, self.messages),
+                                   name="kling-engine")
+
+    def start(self):
+        self.process.start()
+
+    def send(self, name: str, *args, **kwargs):
+        self.commands.put((name, args, kwargs))
+
+    def drain(self, max_items: int = 500) -> List[Tuple[str, object]]:
+        """Messages received so far, without blocking"""
+        out = []
+        while len(out) < max_items:
+            try:
+                out.append(self.messages.get_nowait())
+            except queue.Empty:
+                break
+        return out
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    @property
+    def exitcode(self):
+        return self.process.exitcode
+
+    def terminate(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(timeout=5)
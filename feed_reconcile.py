@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Match articles already in the site's feed to pending jobs.
+
+After a crash or stop the feed still holds the renders of jobs we
+submitted.  The startup scan reads each article's prompt once; this module
+decides which pending job (if any) an article belongs to.  It only accepts
+confident, unambiguous matches:
+
+- the prompts must be near-identical (score >= min_score, where a display
+  truncated to a long enough prefix still counts as a match),
+- the best job must beat the runner-up by `margin`, unless both are the
+  same image + prompt (dedupe key) and one download serves them all,
+- no other job in the store - done, rendering or pending - may carry the
+  same prompt with a different image, since the feed cannot tell those
+  renders apart.
+
+Ambiguous articles are left alone; their jobs are simply rendered again.
+"""
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from job_planner import normalize_prompt_text
+from job_store import Job, JobState
+
+MIN_SCORE = 0.9
+MARGIN = 0.05
+MIN_PREFIX = 40  # A truncated prompt display must show at least this much to count
+TRUNCATED_SCORE = 0.95
+INDEX_PREFIX = 24  # Candidates are looked up by prompt prefix instead of scoring every job
+
+
+class FeedArticle:
+    __slots__ = ('position', 'prompt_norm', 'rendering')
+
+    def __init__(self, position: int, prompt_text: str, rendering: bool):
+        self.position = position  # 1-based, shifted as we submit new renders
+        self.prompt_norm = normalize_prompt_text(prompt_text.rstrip(".… "))
+        self.rendering = rendering
+
+
+def prompt_similarity(a: str, b: str) -> float:
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    if min(len(a), len(b)) >= MIN_PREFIX and (a.startswith(b) or b.startswith(a)):
+        return TRUNCATED_SCORE
+    return SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+def job_identity(job: Job) -> str:
+    """Jobs with the same identity are served by the same render"""
+    return job.dedupe_key or job.image
+
+
+class FeedReconciler:
+    def __init__(self, min_score: float = MIN_SCORE, margin: float = MARGIN):
+        self.min_score = min_score
+        self.margin = margin
+        self.ambiguous = 0  # articles skipped because several images share the prompt
+
+    def _index(self, jobs: Iterable[Job]) -> Dict[str, List[Job]]:
+        index: Dict[str, List[Job]] = {}
+        for job in jobs:
+            index.setdefault(job.prompt_norm[:INDEX_PREFIX], []).append(job)
+        return index
+
+    def best_job(self, article: FeedArticle, index: Dict[str, List[Job]], taken: set) -> Optional[Tuple[Job, float]]:
+        scored = []
+        for job in index.get(article.prompt_norm[:INDEX_PREFIX], ()):
+            score = prompt_similarity(article.prompt_norm, job.prompt_norm)
+            if score >= self.min_score:
+                scored.append((score, job))
+        if not scored:
+            return None
+        scored.sort(key=lambda s: -s[0])
+        pending = [(score, job) for score, job in scored if job.state == JobState.PENDING and job.id not in taken]
+        if not pending:
+            return None
+        best_score, best = pending[0]
+        identity = job_identity(best)
+        for score, other in scored:
+            if job_identity(other) == identity:
+                continue
+            if score > best_score - self.margin or other.state != JobState.PENDING:
+                # Another image with (nearly) the same prompt: this render could be either
+                self.ambiguous += 1
+                return None
+        return best, best_score
+
+    def match(self, articles: List[FeedArticle], jobs: Iterable[Job]) -> List[Tuple[FeedArticle, Job, float]]:
+        """(article, job, score) for every confident match; newest article first, one article per job"""
+        index = self._index(jobs)
+        taken = set()
+        matches = []
+        for article in sorted(articles, key=lambda a: a.position):
+            found = self.best_job(article, index, taken)
+            if found:
+                job, score = found
+                taken.add(job.id)
+                matches.append((article, job, score))
+        return matches
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""Run several engine processes on one host, fed from one shared job queue.
+
+One KlingEngine drives one browser from one automation thread.  The fleet
+plans the folders once, writes the jobs into .kling_cache/fleet.sqlite
+(fleet_queue.FleetQueue) and starts N engine processes (engine_host.py),
+each with its own browser and session file.  Workers lease jobs as their
+slots free up; a worker that dies has its leases handed back right away
+and is restarted (up to MAX_RESTARTS times).  A worker whose automation
+thread hangs stops renewing its leases; once its heartbeat says so, it is
+terminated and handled like one that died.  The console shows one
+combined progress line plus a line per worker.
+
+Each worker needs its own account: the engine tracks renders by their
+position in the account's feed, which only it may add to.
+
+    python fleet.py --root /data/root --sessions state_a.json state_b.json state_c.json
+"""
+import time
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from engine_host import EngineHost, LOG, EVENT, READY, EXITED
+from fleet_queue import FleetQueue, fleet_path, DONE, FAILED, PENDING, LEASED
+from job_planner import JobPlanner, plan_summary, format_duration
+
+REPORT_INTERVAL = 10.0  # seconds between fleet progress lines
+RATE_WINDOW = 1800.0  # throughput is measured over this window
+MAX_RESTARTS = 3  # per worker
+STOP_GRACE = 30.0  # seconds a worker gets to hand its leases back after stop
+
+
+class FleetWorker:
+    __slots__ = ('worker_id', 'engine_kwargs', 'host', 'exited', 'restarts', 'ready', 'started_at')
+
+    def __init__(self, worker_id: str, engine_kwargs: Dict):
+        self.worker_id = worker_id
+        self.engine_kwargs = engine_kwargs
+        self.host: Optional[EngineHost] = None
+        self.exited = False  # the engine said goodbye (a crash never does)
+        self.restarts = 0
+        self.ready = False
+        self.started_at = 0.0
+
+    def start(self):
+        self.host = EngineHost(**self.engine_kwargs)
+        self.exited = False
+        self.ready = False
+        self.started_at = time.time()
+        self.host.start()
+        self.host.send("start")  # queued: run() begins as soon as the browser is up
+
+
+class Fleet:
+    def __init__(self, root: str, sessions: List[str], queue_path: str, max_concurrent: int = 2,
+                 poll_interval: float = 10.0, headless: bool = True, sinks: Optional[List[str]] = None,
+                 post_steps: Optional[List[str]] = None, verbose: bool = False):
+        self.queue = FleetQueue(queue_path)
+        self.verbose = verbose
+        self.started_at = time.time()
+        self.reported_at = 0.0
+        self.stopping = False
+        self.workers: List[FleetWorker] = []
+        for i, session in enumerate(sessions, 1):
+            worker_id = f"w{i}"
+            self.workers.append(FleetWorker(worker_id, dict(
+                root_folder=root,
+                headless=headless,
+                max_concurrent=max_concurrent,
+                poll_interval=poll_interval,
+                sinks=sinks,
+                post_steps=post_steps,
+                fleet_queue=queue_path,
+                worker_id=worker_id,
+                state_file=session,
+            )))
+
+    def log(self, level: str, message: str, worker: Optional[str] = None):
+        if level == "DEBUG" and not self.verbose:
+            return
+        prefix = f"[{worker}] " if worker else ""
+        print(f"[{level}] {prefix}{message}", flush=True)
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        self.stopping = True
+        for worker in self.workers:
+            if worker.host and worker.host.is_alive():
+                worker.host.send("stop")
+
+    def pump(self):
+        """Forward worker logs; restart workers that died while work is left"""
+        for worker in self.workers:
+            if worker.host is None:
+                continue
+            alive = worker.host.is_alive()  # checked first: a dead worker's last messages are already queued
+            for kind, payload in self.drain(worker):
+                if kind == LOG:
+                    self.log(*payload, worker=worker.worker_id)
+                elif kind == READY:
+                    worker.ready = True
+                elif kind == EXITED:
+                    worker.exited = True
+                elif kind == EVENT and payload['type'] == 'submit_backoff':
+                    self.log("WARNING", f"backoff {payload['delay']:.0f}s ({payload['failure_class']})",
+                             worker=worker.worker_id)
+            if not alive:
+                self.on_worker_gone(worker)
+
+    def drain(self, worker: FleetWorker):
+        while True:
+            messages = worker.host.drain()
+            yield from messages
+            if not messages:
+                return
+
+    def on_worker_gone(self, worker: FleetWorker):
+        crashed = not worker.exited
+        # A clean exit already returned its leases; a crash left them to expire - reclaim them now
+        released = self.queue.release_worker(worker.worker_id, crashed=crashed)
+        if crashed:
+            self.log("ERROR", f"engine process died (exit code {worker.host.exitcode}); "
+                              f"{released} jobs back in the queue", worker=worker.worker_id)
+        worker.host = None
+        if self.stopping or not self.queue.unfinished():
+            return
+        if worker.restarts >= MAX_RESTARTS:
+            self.log("ERROR", f"not restarted (already restarted {MAX_RESTARTS} times)", worker=worker.worker_id)
+            return
+        worker.restarts += 1
+        self.log("WARNING", f"restarting ({worker.restarts}/{MAX_RESTARTS})", worker=worker.worker_id)
+        worker.start()
+
+    def terminate_stalled(self, workers: List[Dict]):
+        """Kill workers whose heartbeat reports a hung automation thread; pump() then reclaims and restarts them"""
+        now = time.time()
+        by_id = {worker.worker_id: worker for worker in self.workers}
+        for w in workers:
+            worker = by_id.get(w['worker'])
+            if worker is None or worker.host is None or not w['stats'].get('stalled'):
+                continue
+            if w['heartbeat_age'] is None or now - w['heartbeat_age'] < worker.started_at:
+                continue  # stats of the previous process
+            self.log("ERROR", f"automation thread stuck for {w['stats']['stalled']}s; terminating",
+                     worker=worker.worker_id)
+            worker.host.terminate()
+
+    def running(self) -> int:
+        return sum(1 for worker in self.workers if worker.host is not None)
+
+    def status(self) -> Dict:
+        """Queue counts, fleet throughput / ETA and every worker's last heartbeat"""
+        counts = self.queue.counts()
+        now = time.time()
+        window = min(RATE_WINDOW, now - self.started_at)
+        recent = self.queue.finished_since(now - window)
+        rate = recent * 3600.0 / window if window >= 60 and recent else None
+        unfinished = counts.get(PENDING, 0) + counts.get(LEASED, 0)
+        workers = self.queue.workers()
+        return {
+            'counts': counts,
+            'total': sum(counts.values()),
+            'unfinished': unfinished,
+            'throughput_per_hour': rate,
+            'eta_seconds': unfinished * 3600.0 / rate if rate else None,
+            'active': sum(w['stats'].get('active') or 0 for w in workers),
+            'capacity': sum(w['stats'].get('max_concurrent') or 0 for w in workers),
+            'workers': workers,
+            'running': self.running(),
+        }
+
+    def report(self, force: bool = False):
+        now = time.time()
+        if not force and now - self.reported_at < REPORT_INTERVAL:
+            return
+        self.reported_at = now
+        s = self.status()
+        if not self.stopping:
+            self.terminate_stalled(s['workers'])
+        counts = s['counts']
+        line = (f"Fleet: {counts.get(DONE, 0)}/{s['total']} done | leased {counts.get(LEASED, 0)} | "
+                f"pending {counts.get(PENDING, 0)} | failed {counts.get(FAILED, 0)} | "
+                f"active {s['active']}/{s['capacity']} | workers {s['running']}/{len(self.workers)}")
+        if s['throughput_per_hour']:
+            line += f" | {s['throughput_per_hour']:.1f}/h | ETA {format_duration(s['eta_seconds'])}"
+        self.log("INFO", line)
+        for w in s['workers']:
+            stats = w['stats']
+            flags = []
+            if stats.get('paused'):
+                flags.append("paused")
+            if stats.get('backoff'):
+                flags.append(f"backoff {stats['backoff']}s")
+            if stats.get('stalled'):
+                flags.append(f"stuck for {stats['stalled']}s")
+            if w['heartbeat_age'] is not None and w['heartbeat_age'] > 3 * REPORT_INTERVAL:
+                flags.append(f"no heartbeat for {w['heartbeat_age']:.0f}s")
+            counts = ", ".join(f"{n} {state}" for state, n in (stats.get('counts') or {}).items())
+            self.log("INFO", f"  {w['worker']}: leased {w['leased']} | active {stats.get('active', 0)}/"
+                             f"{stats.get('max_concurrent', '?')} | {counts or 'starting'}"
+                             + (f" | {', '.join(flags)}" if flags else ""))
+
+    def wait(self):
+        try:
+            while self.running():
+                self.pump()
+                self.report()
+                time.sleep(0.2)
+        except KeyboardInterrupt:
+            self.log("WARNING", "Stopping the fleet...")
+            self.stop()
+            deadline = time.time() + STOP_GRACE
+            while self.running() and time.time() < deadline:
+                self.pump()
+                time.sleep(0.2)
+            for worker in self.workers:
+                if worker.host:
+                    worker.host.terminate()
+                    self.queue.release_worker(worker.worker_id, crashed=False)
+                    worker.host = None
+        self.report(force=True)
+
+    def close(self):
+        self.queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several Kling engines on one host from a shared job queue")
+    parser.add_argument("--root", required=True, help="Root folder containing subfolders")
+    parser.add_argument("--folders", nargs="*", help="Only these subfolders of --root")
+    parser.add_argument("--sessions", nargs="+", metavar="STATE_JSON",
+                        help="One session file per worker, each logged in to its own account")
+    parser.add_argument("--workers", type=int, help="Number of engine processes (default: one per --sessions file)")
+    parser.add_argument("--concurrent", type=int, default=2, help="Max concurrent renders per worker")
+    parser.add_argument("--poll", type=float, default=10.0)
+    parser.add_argument("--show-browser", action="store_true", help="Do not run the browsers headless (needed to log in)")
+    parser.add_argument("--no-dedupe", action="store_true", help="Do not hash images or reuse cached results")
+    parser.add_argument("--sink", action="append", default=[], metavar="SPEC",
+                        help="Also deliver finished videos to local:DIR, mirror:DIR or s3://bucket/prefix (repeatable)")
+    parser.add_argument("--post", nargs="*", default=[], metavar="STEP",
+                        help="Post-process finished videos: poster, manifest, reel (poster/reel need ffmpeg)")
+    parser.add_argument("--verbose", action="store_true", help="Show DEBUG lines from the workers")
+    args = parser.parse_args()
+
+    sessions = args.sessions or []
+    workers = args.workers or len(sessions) or 2
+    if len(sessions) > workers:
+        parser.error(f"{len(sessions)} session files for {workers} workers")
+    sessions += [f"state_w{i}.json" for i in range(len(sessions) + 1, workers + 1)]
+    if len(set(sessions)) != len(sessions):
+        parser.error("Every worker needs its own session file")
+    missing = [s for s in sessions if not Path(s).exists()]
+    if missing and not args.show_browser:
+        parser.error(f"No saved session in {', '.join(missing)} - run once with --show-browser to log in")
+
+    plan = JobPlanner(args.root, args.folders, args.concurrent * workers, dedupe=not args.no_dedupe).build()
+    for w in plan['warnings']:
+        print(f"[WARNING] {w}")
+    for f in plan['folders']:
+        for w in f['warnings']:
+            print(f"[WARNING] [{f['name']}] {w}")
+    print(f"[INFO] {plan_summary(plan)}")
+
+    queue_path = str(fleet_path().resolve())
+    queue = FleetQueue(queue_path)
+    queue.reset()
+    queue.enqueue_plan(plan)
+    unfinished = queue.unfinished()
+    queue.close()
+    if not unfinished:
+        print("[INFO] All videos already exist. Skipping.")
+        return
+    for session in missing:
+        print(f"[WARNING] No saved session in {session}: log in in that worker's browser window")
+
+    fleet = Fleet(args.root, sessions, queue_path, max_concurrent=args.concurrent, poll_interval=args.poll,
+                  headless=not args.show_browser, sinks=args.sink, post_steps=args.post, verbose=args.verbose)
+    print(f"[INFO] {unfinished} jobs for {workers} workers ({args.concurrent} renders each)")
+    fleet.start()
+    try:
+        fleet.wait()
+    finally:
+        fleet.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""Shared job queue for a fleet of engine processes on one host.
+
+fleet.py plans the folders once and writes every job into
+.kling_cache/fleet.sqlite.  Each engine process (one browser, one session
+file) leases a handful of jobs at a time and keeps the leases alive with
+a heartbeat thread.  The heartbeat renews leases only while the worker's
+automation thread is still making progress: a worker that crashes stops
+heartbeating, and one whose browser thread hangs stops renewing, so
+either way its leases expire and the next lease() call hands the jobs
+back out (fleet.py also restarts both kinds of worker).  A job that
+keeps taking workers down with it is failed after MAX_RECLAIMS.
+
+Leasing never hands out a job whose dedupe key another worker is
+rendering, and a job whose twin is already done comes with 'reuse_from',
+so identical (image, prompt) pairs are rendered once across the fleet.
+The worker that finishes the last open job of a folder is told so
+(complete() returns True) and runs the folder's post-processing.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from kling_cache import cache_dir
+
+FLEET_FILE = "fleet.sqlite"
+LEASE_SECONDS = 120.0  # a lease not renewed for this long is reclaimed
+HEARTBEAT_INTERVAL = 15.0
+MAX_RECLAIMS = 3  # a job reclaimed this often (its workers died) is failed
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+OPEN = (PENDING, LEASED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    image TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    folder TEXT NOT NULL,
+    folder_path TEXT NOT NULL,
+    folder_priority INTEGER NOT NULL DEFAULT 0,
+    prompt_raw TEXT NOT NULL,
+    dedupe_key TEXT,
+    image_sha TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    deadline_minutes REAL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    reclaims INTEGER NOT NULL DEFAULT 0,
+    video TEXT,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, folder_priority, priority, seq);
+CREATE INDEX IF NOT EXISTS jobs_folder ON jobs (folder_path, state);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (dedupe_key, state);
+CREATE TABLE IF NOT EXISTS workers (
+    worker TEXT PRIMARY KEY,
+    pid INTEGER,
+    started_at REAL,
+    heartbeat_at REAL,
+    stats TEXT
+);
+"""
+
+JOB_FIELDS = ('image', 'folder', 'folder_path', 'folder_priority', 'prompt_raw', 'dedupe_key', 'image_sha',
+              'priority', 'deadline_minutes')
+
+
+def fleet_path() -> Path:
+    return cache_dir() / FLEET_FILE
+
+
+class FleetQueue:
+    """One connection per thread/process (sqlite handles the locking between them)"""
+
+    def __init__(self, path: Optional[str] = None, lease_seconds: float = LEASE_SECONDS):
+        self.path = Path(path) if path else fleet_path()
+        self.lease_seconds = lease_seconds
+        # Autocommit mode: every write below opens its own BEGIN IMMEDIATE transaction
+        self.db = sqlite3.connect(str(self.path), timeout=30.0, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def _write(self, fn: Callable):
+        """Run fn(db) in one write transaction (other workers wait on the lock, up to the timeout)"""
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(self.db)
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+        return result
+
+    # --- launcher side ---
+
+    def reset(self):
+        """Forget the previous run (jobs and workers)"""
+        self._write(lambda db: (db.execute("DELETE FROM jobs"), db.execute("DELETE FROM workers")))
+
+    def enqueue_plan(self, plan: Dict) -> int:
+        """Add every job of a job_planner plan; images already queued are left alone. Returns jobs added."""
+        def insert(db):
+            seq = db.execute("SELECT COALESCE(MAX(seq), 0) FROM jobs").fetchone()[0]
+            added = 0
+            for folder in plan['folders']:
+                if folder['skipped']:
+                    continue
+                for job in folder['jobs']:
+                    seq += 1
+                    cur = db.execute(
+                        "INSERT OR IGNORE INTO jobs (image, seq, folder, folder_path, folder_priority, prompt_raw, "
+                        "dedupe_key, image_sha, priority, deadline_minutes, state, video, finished_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job['image'], seq, folder['name'], folder['path'], folder.get('priority', 0),
+                         job['prompt_raw'], job.get('dedupe_key'), job.get('image_sha'), job.get('priority', 0),
+                         job.get('deadline_minutes'), DONE if job['done'] else PENDING,
+                         job['output'] if job['done'] else None, None))
+                    added += cur.rowcount
+            return added
+        return self._write(insert)
+
+    def release_worker(self, worker: str, crashed: bool = True) -> int:
+        """Hand a worker's leases back right away (its process is gone). Returns jobs released."""
+        return self._write(lambda db: self._release(db, worker, crashed))
+
+    # --- worker side ---
+
+    def _reclaim_expired(self, db, now: float) -> int:
+        expired = db.execute("UPDATE jobs SET state = CASE WHEN reclaims + 1 >= ? THEN ? ELSE ? END, "
+                             "worker = NULL, lease_until = NULL, reclaims = reclaims + 1 "
+                             "WHERE state = ? AND lease_until < ?",
+                             (MAX_RECLAIMS, FAILED, PENDING, LEASED, now))
+        return expired.rowcount
+
+    def _release(self, db, worker: str, crashed: bool) -> int:
+        if crashed:
+            cur = db.execute("UPDATE jobs SET state = CASE WHEN reclaims + 1 >= ? THEN ? ELSE ? END, "
+                             "worker = NULL, lease_until = NULL, reclaims = reclaims + 1 "
+                             "WHERE state = ? AND worker = ?", (MAX_RECLAIMS, FAILED, PENDING, LEASED, worker))
+        else:
+            cur = db.execute("UPDATE jobs SET state = ?, worker = NULL, lease_until = NULL "
+                             "WHERE state = ? AND worker = ?", (PENDING, LEASED, worker))
+        return cur.rowcount
+
+    def register(self, worker: str):
+        now = time.time()
+        self._write(lambda db: db.execute(
+            "INSERT INTO workers (worker, pid, started_at, heartbeat_at, stats) VALUES (?, ?, ?, ?, '{}') "
+            "ON CONFLICT (worker) DO UPDATE SET pid = excluded.pid, started_at = excluded.started_at, "
+            "heartbeat_at = excluded.heartbeat_at", (worker, os.getpid(), now, now)))
+
+    def lease(self, worker: str, limit: int) -> List[Dict]:
+        """Lease up to limit pending jobs, best first (job_planner job dicts plus folder fields)"""
+        if limit <= 0:
+            return []
+
+        def take(db):
+            now = time.time()
+            self._reclaim_expired(db, now)
+            rows = db.execute(
+                "SELECT * FROM jobs AS j WHERE state = ? AND (dedupe_key IS NULL OR NOT EXISTS ("
+                "  SELECT 1 FROM jobs AS o WHERE o.dedupe_key = j.dedupe_key AND o.state = ? AND o.worker != ?)) "
+                "ORDER BY folder_priority DESC, priority DESC, seq LIMIT ?",
+                (PENDING, LEASED, worker, limit)).fetchall()
+            db.executemany("UPDATE jobs SET state = ?, worker = ?, lease_until = ? WHERE image = ?",
+                           [(LEASED, worker, now + self.lease_seconds, row['image']) for row in rows])
+            jobs = []
+            for row in rows:
+                job = {field: row[field] for field in JOB_FIELDS}
+                job['done'] = False
+                job['output'] = str(Path(row['image']).with_suffix('.mp4'))
+                if row['dedupe_key']:
+                    twin = db.execute("SELECT video FROM jobs WHERE dedupe_key = ? AND state = ? AND video IS NOT NULL "
+                                      "LIMIT 1", (row['dedupe_key'], DONE)).fetchone()
+                    if twin and os.path.exists(twin['video']):
+                        job['reuse_from'] = twin['video']
+                jobs.append(job)
+            return jobs
+        return self._write(take)
+
+    def heartbeat(self, worker: str, stats: Optional[Dict] = None, renew: bool = True) -> int:
+        """Publish the worker's stats and (with renew) renew its leases; returns how many were renewed"""
+        def beat(db):
+            now = time.time()
+            renewed = 0
+            if renew:
+                renewed = db.execute("UPDATE jobs SET lease_until = ? WHERE state = ? AND worker = ?",
+                                     (now + self.lease_seconds, LEASED, worker)).rowcount
+            db.execute("UPDATE workers SET heartbeat_at = ?, stats = ? WHERE worker = ?",
+                       (now, json.dumps(stats or {}), worker))
+            return renewed
+        return self._write(beat)
+
+    def complete(self, worker: str, image: str, done: bool, video: Optional[str] = None) -> bool:
+        """Record a finished job; True when it was the folder's last open job across the fleet.
+        A video is kept even if the lease had meanwhile been reclaimed (the job is done either way)."""
+        def finish(db):
+            row = db.execute("SELECT folder_path, state, worker FROM jobs WHERE image = ?", (image,)).fetchone()
+            if row is None or row['state'] == DONE:
+                return False
+            if not done and (row['state'] != LEASED or row['worker'] != worker):
+                return False  # lost the lease: the job is someone else's now
+            db.execute("UPDATE jobs SET state = ?, worker = ?, lease_until = NULL, video = ?, finished_at = ? "
+                       "WHERE image = ?", (DONE if done else FAILED, worker, video, time.time(), image))
+            still_open = db.execute("SELECT COUNT(*) FROM jobs WHERE folder_path = ? AND state IN (?, ?)",
+                                    (row['folder_path'], *OPEN)).fetchone()[0]
+            return still_open == 0
+        return self._write(finish)
+
+    def release(self, worker: str) -> int:
+        """Clean shutdown: the worker's unfinished jobs go back to pending without a reclaim strike"""
+        return self._write(lambda db: self._release(db, worker, crashed=False))
+
+    # --- reads ---
+
+    def folder_items(self, folder_path: str) -> List[Dict]:
+        """Finished videos of a folder, as post_process.make_manifest() items"""
+        rows = self.db.execute("SELECT image, prompt_raw, video FROM jobs WHERE folder_path = ? AND state = ? "
+                               "AND video IS NOT NULL ORDER BY seq", (folder_path, DONE)).fetchall()
+        return [{'video': row['video'], 'image': Path(row['image']).name, 'prompt': row['prompt_raw']} for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def unfinished(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM jobs WHERE state IN (?, ?)", OPEN).fetchone()[0]
+
+    def open_folders(self) -> int:
+        return self.db.execute("SELECT COUNT(DISTINCT folder_path) FROM jobs WHERE state IN (?, ?)", OPEN).fetchone()[0]
+
+    def finished_since(self, since: float) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM jobs WHERE state = ? AND finished_at >= ?",
+                               (DONE, since)).fetchone()[0]
+
+    def workers(self) -> List[Dict]:
+        leased = dict(self.db.execute("SELECT worker, COUNT(*) FROM jobs WHERE state = ? GROUP BY worker",
+                                      (LEASED,)).fetchall())
+        out = []
+        for row in self.db.execute("SELECT * FROM workers ORDER BY worker").fetchall():
+            out.append({
+                'worker': row['worker'],
+                'pid': row['pid'],
+                'heartbeat_age': time.time() - row['heartbeat_at'] if row['heartbeat_at'] else None,
+                'leased': leased.get(row['worker'], 0),
+                'stats': json.loads(row['stats'] or "{}"),
+            })
+        return out
+
+    def close(self):
+        self.db.close()
+
+
+class LeaseKeeper:
+    """Heartbeat thread of a worker: renews its leases and publishes its stats.
+    Runs beside the browser thread, so a long download never lets the leases lapse.
+    seen_at() is when the browser thread last made progress: once that is older than
+    the lease time the leases are no longer renewed, so a hung worker's jobs expire
+    like a dead one's (its stats still go out, flagged 'stalled')."""
+
+    def __init__(self, path: str, worker: str, stats: Callable[[], Dict], seen_at: Callable[[], float],
+                 interval: float = HEARTBEAT_INTERVAL, log: Optional[Callable[[str, str], None]] = None):
+        self.path = path
+        self.worker = worker
+        self.stats = stats
+        self.seen_at = seen_at
+        self.stalled = False
+        self.interval = interval
+        self.log = log or (lambda level, msg: None)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="fleet-heartbeat", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        queue = FleetQueue(self.path)
+        try:
+            while not self.stop_event.is_set():
+                self.beat(queue)
+                self.stop_event.wait(self.interval)
+            self.beat(queue)  # final stats for the fleet view
+        finally:
+            queue.close()
+
+    def beat(self, queue: FleetQueue):
+        try:
+            stats = self.stats()
+        except Exception:
+            stats = {}
+        idle = time.time() - self.seen_at()
+        stalled = idle > queue.lease_seconds
+        if stalled != self.stalled:
+            self.stalled = stalled
+            if stalled:
+                self.log("ERROR", f"Automation thread stuck for {idle:.0f}s: letting the fleet leases lapse")
+            else:
+                self.log("INFO", "Automation thread running again: renewing the fleet leases")
+        if stalled:
+            stats['stalled'] = round(idle)
+        try:
+            queue.heartbeat(self.worker, stats, renew=not stalled)
+        except sqlite3.Error as e:
+            self.log("WARNING", f"Fleet heartbeat failed: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=5)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Model/view folder list for roots with thousands of subfolders.
+
+One row per folder is a name, a check flag and a small stats tuple, with no
+widgets; the view only paints the visible rows.  Counts (images,
+prompts.txt present, outputs already done) are computed by a background
+thread, rows currently on screen first, and arrive in batches.
+"""
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from PyQt6.QtCore import (
+    Qt, QAbstractListModel, QModelIndex, QSortFilterProxyModel, QThread, pyqtSignal
+)
+
+from job_planner import IMAGE_EXTS
+
+PENDING_ROLE = Qt.ItemDataRole.UserRole + 1
+BATCH_SIZE = 64
+
+# (images, done, has_prompts)
+FolderStats = Tuple[int, int, bool]
+
+
+def scan_folder_stats(path: Path) -> FolderStats:
+    """One directory listing: image count, images whose .mp4 exists, prompts.txt present"""
+    stems = set()
+    videos = set()
+    has_prompts = False
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                stem, ext = os.path.splitext(entry.name)
+                ext = ext.lower()
+                if ext in IMAGE_EXTS:
+                    stems.add(stem)
+                elif ext == ".mp4":
+                    videos.add(stem)
+                elif entry.name == "prompts.txt":
+                    has_prompts = True
+    except OSError:
+        pass
+    return len(stems), len(stems & videos), has_prompts
+
+
+def pending_of(stats: Optional[FolderStats]) -> int:
+    """Work left in a folder (-1 while unknown); folders without prompts.txt have none"""
+    if stats is None:
+        return -1
+    images, done, has_prompts = stats
+    return images - done if has_prompts else 0
+
+
+class FolderStatsWorker(QThread):
+    """Counts folders in the background; rows asked for by the view jump the queue"""
+    stats_ready = pyqtSignal(list)  # [(row, stats), ...]
+
+    def __init__(self, root: Path, names: List[str]):
+        super().__init__()
+        self.root = root
+        self.names = names
+        self.wanted = deque()  # rows the view is showing without counts
+        self.cancelled = threading.Event()
+
+    def want(self, row: int):
+        self.wanted.append(row)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        done = bytearray(len(self.names))
+        next_row = 0
+        batch = []
+        while not self.cancelled.is_set():
+            row = None
+            while self.wanted:
+                candidate = self.wanted.popleft()
+                if not done[candidate]:
+                    row = candidate
+                    break
+            urgent = row is not None
+            if row is None:
+                while next_row < len(self.names) and done[next_row]:
+                    next_row += 1
+                if next_row >= len(self.names):
+                    break
+                row = next_row
+            done[row] = 1
+            batch.append((row, scan_folder_stats(self.root / self.names[row])))
+            if len(batch) >= BATCH_SIZE or (urgent and not self.wanted):
+                # Rows on screen are shown as soon as they are counted
+                self.stats_ready.emit(batch)
+                batch = []
+        if batch and not self.cancelled.is_set():
+            self.stats_ready.emit(batch)
+
+
+class FolderListModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.root: Optional[Path] = None
+        self.names: List[str] = []
+        self.checked = bytearray()
+        self.stats: List[Optional[FolderStats]] = []
+        self.worker: Optional[FolderStatsWorker] = None
+
+    # --- loading ---
+
+    def load(self, root: Path, checked: bool = True) -> int:
+        """List the root's subfolders (names only) and start counting in the background"""
+        self.stop_worker()
+        names = sorted(entry.name for entry in os.scandir(root)
+                       if entry.is_dir() and not entry.name.startswith("."))
+        self.beginResetModel()
+        self.root = Path(root)
+        self.names = names
+        self.checked = bytearray([1 if checked else 0]) * len(names)
+        self.stats = [None] * len(names)
+        self.endResetModel()
+        if names:
+            self.worker = FolderStatsWorker(self.root, names)
+            self.worker.stats_ready.connect(self.apply_stats)
+            self.worker.start()
+        return len(names)
+
+    def stop_worker(self):
+        if self.worker:
+            self.worker.cancel()
+            self.worker.wait()
+            self.worker = None
+
+    def apply_stats(self, batch: list):
+        if self.worker is None or self.sender() is not self.worker:
+            return  # Late batch from a cancelled scan
+        lo, hi = len(self.names), -1
+        for row, stats in batch:
+            self.stats[row] = stats
+            lo, hi = min(lo, row), max(hi, row)
+        if hi >= 0:
+            self.dataChanged.emit(self.index(lo), self.index(hi), [Qt.ItemDataRole.DisplayRole, PENDING_ROLE])
+
+    # --- Qt model API ---
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.names)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        stats = self.stats[row]
+        if role == Qt.ItemDataRole.DisplayRole:
+            if stats is None:
+                if self.worker:
+                    self.worker.want(row)
+                return f"{self.names[row]} (đang đếm...)"
+            images, done, has_prompts = stats
+            if not has_prompts:
+                return f"{self.names[row]} ({images} ảnh, thiếu prompts.txt)"
+            return f"{self.names[row]} ({images} ảnh, xong {done}, còn {images - done})"
+        if role == Qt.ItemDataRole.CheckStateRole:
+            return Qt.CheckState.Checked if self.checked[row] else Qt.CheckState.Unchecked
+        if role == PENDING_ROLE:
+            return pending_of(stats)
+        return None
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if role != Qt.ItemDataRole.CheckStateRole or not index.isValid():
+            return False
+        self.checked[index.row()] = 1 if Qt.CheckState(value) == Qt.CheckState.Checked else 0
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.CheckStateRole])
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsUserCheckable
+
+    # --- bulk operations ---
+
+    def set_all_checked(self, checked: bool):
+        self.checked = bytearray([1 if checked else 0]) * len(self.names)
+        if self.names:
+            self.dataChanged.emit(self.index(0), self.index(len(self.names) - 1), [Qt.ItemDataRole.CheckStateRole])
+
+    def set_rows_checked(self, rows: List[int], checked: bool):
+        if not rows:
+            return
+        value = 1 if checked else 0
+        for row in rows:
+            self.checked[row] = value
+        self.dataChanged.emit(self.index(min(rows)), self.index(max(rows)), [Qt.ItemDataRole.CheckStateRole])
+
+    def checked_names(self) -> List[str]:
+        return [name for name, flag in zip(self.names, self.checked) if flag]
+
+
+class FolderFilterProxy(QSortFilterProxyModel):
+    """Name filter, 'only folders with work left', and sorting by name or by pending work"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.text = ""
+        self.only_pending = False
+        self.setDynamicSortFilter(True)
+
+    def set_text(self, text: str):
+        self.text = text.strip().lower()
+        self.invalidateFilter()
+
+    def set_only_pending(self, only: bool):
+        self.only_pending = only
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        model = self.sourceModel()
+        if self.text and self.text not in model.names[source_row].lower():
+            return False
+        if self.only_pending and pending_of(model.stats[source_row]) == 0:
+            return False  # Unknown counts stay visible until they arrive
+        return True
+
+    def lessThan(self, left, right):
+        if self.sortRole() == PENDING_ROLE:
+            return left.data(PENDING_ROLE) < right.data(PENDING_ROLE)
+        model = self.sourceModel()
+        return model.names[left.row()].lower() < model.names[right.row()].lower()
+
+    def source_rows(self) -> List[int]:
+        """Source rows currently shown (for bulk check operations on a filtered list)"""
+        return [self.mapToSource(self.index(i, 0)).row() for i in range(self.rowCount())]
+
+    def is_filtered(self) -> bool:
+        return bool(self.text) or self.only_pending
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Watch a root folder for new subfolders, images and prompts.txt changes.
+
+Linux uses inotify directly through ctypes (no extra dependency); other
+platforms, or a kernel out of watches, fall back to polling that stays
+cheap on large trees: a folder is only re-listed when its mtime changes,
+and only files seen changing are stat'ed again until they settle.
+
+A folder is reported once it has been quiet for `debounce` seconds, so an
+image still being copied or a prompts.txt still being written is never
+planned half-done.  Reports are folder names relative to the root.
+"""
+import os
+import sys
+import time
+import struct
+import select
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from job_planner import IMAGE_EXTS
+
+DEFAULT_DEBOUNCE = 5.0
+DEFAULT_POLL_INTERVAL = 10.0
+INPUT_FILES = ("prompts.txt", "schedule.json")
+
+# <sys/inotify.h>
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE_SELF = 0x400
+IN_ISDIR = 0x40000000
+IN_Q_OVERFLOW = 0x4000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+FILE_EVENTS = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+ROOT_EVENTS = IN_CREATE | IN_MOVED_TO
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_input_file(name: str) -> bool:
+    return name in INPUT_FILES or os.path.splitext(name)[1].lower() in IMAGE_EXTS
+
+
+def is_watched_folder(path: Path) -> bool:
+    return path.is_dir() and not path.name.startswith(".")
+
+
+class Inotify:
+    """Minimal ctypes binding: init, add_watch, read events"""
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.ctypes = ctypes
+
+    def add_watch(self, path: Path, mask: int) -> int:
+        wd = self._add_watch(self.fd, os.fsencode(str(path)), mask)
+        if wd < 0:
+            errno = self.ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch {path}: {os.strerror(errno)}")
+        return wd
+
+    def read(self, timeout: float) -> List[Tuple[int, int, str]]:
+        """(wd, mask, name) events, waiting at most timeout seconds for the first"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events, pos = [], 0
+        while pos + EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b"\0"))
+            pos += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    def __init__(self, root: str, on_change: Callable[[List[str]], None], debounce: float = DEFAULT_DEBOUNCE,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, use_inotify: bool = True,
+                 log: Optional[Callable[[str, str], None]] = None):
+        self.root = Path(root)
+        self.on_change = on_change  # called on the watcher thread with folder names
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and sys.platform.startswith("linux")
+        self.log = log or (lambda level, msg: None)
+        self.backend = None  # "inotify" or "polling" once started
+        self.dirty: Dict[str, float] = {}  # folder name -> last change seen
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Polling state
+        self._dir_mtimes: Dict[str, int] = {}
+        self._files: Dict[str, Dict[str, Tuple[int, int]]] = {}  # folder -> file -> (size, mtime_ns)
+        self._unsettled: Dict[str, Set[str]] = {}  # folder -> files to re-stat until unchanged
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="folder-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def touch(self, folder: str):
+        self.dirty[folder] = time.time()
+
+    def flush(self, force: bool = False):
+        """Report the folders that have been quiet for the debounce period"""
+        now = time.time()
+        ready = sorted(name for name, t in self.dirty.items() if force or now - t >= self.debounce)
+        if not ready:
+            return
+        for name in ready:
+            del self.dirty[name]
+        ready = [name for name in ready if is_watched_folder(self.root / name)]
+        if ready:
+            try:
+                self.on_change(ready)
+            except Exception as e:
+                self.log("WARNING", f"Watch: could not queue {', '.join(ready)}: {e}")
+
+    def _run(self):
+        if self.use_inotify:
+            try:
+                self._run_inotify()
+                return
+            except OSError as e:
+                self.log("WARNING", f"inotify unavailable ({e}), polling every {self.poll_interval:.0f}s")
+        self._run_polling()
+
+    # --- inotify ---
+
+    def _run_inotify(self):
+        ino = Inotify()
+        try:
+            watches: Dict[int, Optional[str]] = {ino.add_watch(self.root, ROOT_EVENTS): None}
+            for child in self.root.iterdir():
+                if is_watched_folder(child):
+                    watches[ino.add_watch(child, FILE_EVENTS)] = child.name
+            self.backend = "inotify"
+            self.log("INFO", f"Watching {self.root} (inotify, {len(watches) - 1} folders)")
+            while not self._stop.is_set():
+                for wd, mask, name in ino.read(timeout=0.5):
+                    if mask & IN_Q_OVERFLOW:
+                        # Events were dropped: re-check every folder
+                        for folder in watches.values():
+                            if folder:
+                                self.touch(folder)
+                        continue
+                    folder = watches.get(wd)
+                    if folder is None:
+                        if mask & IN_ISDIR and not name.startswith("."):
+                            # New subfolder: watch it, then count it as changed (files may already be in)
+                            try:
+                                watches[ino.add_watch(self.root / name, FILE_EVENTS)] = name
+                            except OSError as e:
+                                self.log("WARNING", f"Watch: {e} - later changes in {name} will be missed")
+                            self.touch(name)
+                        continue
+                    if mask & IN_DELETE_SELF:
+                        del watches[wd]
+                        self.dirty.pop(folder, None)
+                    elif is_input_file(name):
+                        self.touch(folder)
+                self.flush()
+        finally:
+            ino.close()
+
+    # --- polling ---
+
+    def _run_polling(self):
+        self.backend = "polling"
+        self._scan(initial=True)
+        self.log("INFO", f"Watching {self.root} (polling every {self.poll_interval:.0f}s)")
+        while not self._stop.wait(min(self.poll_interval, self.debounce) if self.dirty else self.poll_interval):
+            self._scan()
+            self.flush()
+
+    def _stat_files(self, folder: Path, names: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+        out = {}
+        for name in names:
+            try:
+                st = (folder / name).stat()
+            except OSError:
+                continue
+            out[name] = (st.st_size, st.st_mtime_ns)
+        return out
+
+    def _scan(self, initial: bool = False):
+        try:
+            children = [c for c in self.root.iterdir() if is_watched_folder(c)]
+        except OSError:
+            return
+        for child in children:
+            name = child.name
+            try:
+                dir_mtime = child.stat().st_mtime_ns
+            except OSError:
+                continue
+            known = self._files.get(name)
+            if known is None or dir_mtime != self._dir_mtimes.get(name):
+                # New folder or entries added/removed: list it again
+                names = [e.name for e in os.scandir(child) if e.is_file() and is_input_file(e.name)]
+                current = self._stat_files(child, names)
+                self._dir_mtimes[name] = dir_mtime
+            else:
+                # Same listing: only prompts/schedule (edited in place) and files still settling
+                check = set(INPUT_FILES) | self._unsettled.get(name, set())
+                current = dict(known)
+                for f in check:
+                    current.pop(f, None)
+                current.update(self._stat_files(child, check))
+            if initial:
+                self._files[name] = current
+                continue
+            known = known or {}
+            changed = {f for f, sig in current.items() if known.get(f) != sig}
+            self._files[name] = current
+            if changed:
+                self._unsettled[name] = changed
+                self.touch(name)
+            else:
+                self._unsettled.pop(name, None)
+        present = {c.name for c in children}
+        for name in list(self._files):
+            if name not in present:
+                self._files.pop(name)
+                self._dir_mtimes.pop(name, None)
+                self._unsettled.pop(name, None)
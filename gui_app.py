@@ -1,87 +1,167 @@
 #!/usr/bin/env python3
 import sys
 import os
-import threading
 from pathlib import Path
 from datetime import datetime
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QTextEdit, QFileDialog, QLineEdit, QProgressBar,
-    QCheckBox, QSpinBox, QGroupBox, QFrame, QScrollArea
+    QCheckBox, QSpinBox, QGroupBox, QFrame, QListView, QComboBox, QMenu
 )
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer
+from PyQt6.QtCore import Qt, QObject, QThread, pyqtSignal, QTimer
 from PyQt6.QtGui import QFont, QColor, QPalette
 
-from kling_engine import KlingEngine
+from engine_host import EngineHost, LOG, PROGRESS, EVENT, READY, REPLY, EXITED
+from job_planner import JobPlanner, plan_summary, format_duration
+from job_scheduler import FIFO, SHORTEST_PROMPT, DEADLINE
+from dashboard_panel import DashboardPanel
+from post_process import POSTER, MANIFEST, REEL
+from folder_list_model import FolderListModel, FolderFilterProxy, PENDING_ROLE
+from job_tracer import OFF as TRACE_OFF, SLOW as TRACE_SLOW, ALL as TRACE_ALL
 
 
-class WorkerThread(QThread):
+class EngineProcess(QObject):
+    """The engine in its own process (engine_host.py), seen by the window as Qt signals.
+    Messages are drained on a timer and progress/metrics are coalesced, so a chatty engine
+    costs the UI one batch per tick instead of one slot call per event."""
     log_signal = pyqtSignal(str, str)
     progress_signal = pyqtSignal(int, int)
+    metrics_signal = pyqtSignal(dict)
+    dashboard_signal = pyqtSignal(dict)
+    session_signal = pyqtSignal(dict)
+    save_session_signal = pyqtSignal(bool, str)
     finished_signal = pyqtSignal()
     browser_ready_signal = pyqtSignal()
 
-    def __init__(self, engine, phase="BROWSER_ONLY"):
+    PUMP_MS = 100
+    STOP_GRACE_MS = 60_000  # Kill the engine process if it has not exited this long after stop()
+
+    def __init__(self, **engine_kwargs):
         super().__init__()
-        self.engine = engine
-        self.phase = phase  # "BROWSER_ONLY" or "PROCESSING"
+        self.host = EngineHost(**engine_kwargs)
+        self.browser_ready = False
+        self.paused = False
+        self.running = False
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.pump)
+
+    def start(self):
+        self.host.start()
         self.running = True
-        self.start_processing_event = threading.Event()
+        self.timer.start(self.PUMP_MS)
+
+    def pump(self):
+        progress = metrics = dashboard = None
+        exited = False
+        for kind, payload in self.host.drain():
+            if kind == LOG:
+                self.log_signal.emit(*payload)
+            elif kind == PROGRESS:
+                progress = payload
+            elif kind == READY:
+                self.browser_ready = True
+                self.browser_ready_signal.emit()
+            elif kind == REPLY and payload[0] == "save_session":
+                self.save_session_signal.emit(payload[1], payload[2])
+            elif kind == EXITED:
+                exited = True
+            elif kind == EVENT:
+                etype = payload['type']
+                if etype == 'progress':
+                    metrics = payload
+                elif etype == 'metrics':
+                    dashboard = payload
+                elif etype == 'paused':
+                    self.paused = True
+                elif etype == 'resumed':
+                    self.paused = False
+                if etype.startswith('session_'):
+                    self.session_signal.emit(payload)
+        if progress:
+            self.progress_signal.emit(*progress)
+        if metrics:
+            self.metrics_signal.emit(metrics)
+        if dashboard:
+            self.dashboard_signal.emit(dashboard)
+        if not exited and not self.host.is_alive():
+            self.log_signal.emit("ERROR", f"Tiến trình engine đã thoát bất thường (mã {self.host.exitcode})")
+            exited = True
+        if exited:
+            self.finish()
+
+    def finish(self):
+        if not self.running:
+            return
+        self.running = False
+        self.browser_ready = False
+        self.timer.stop()
+        self.host.terminate()  # Already exited normally; reaps the process
+        self.finished_signal.emit()
 
-    def run(self):
-        try:
-            # Phase 1: Launch browser
-            self.emit_log("INFO", "Đang khởi động trình duyệt...")
-            self.engine.launch_browser(
-                log_callback=self.emit_log
-            )
-            self.emit_log("SUCCESS", "Trình duyệt đã sẵn sàng!")
-            self.browser_ready_signal.emit()
-
-            if self.phase == "BROWSER_ONLY":
-                # Wait for signal to start processing
-                self.emit_log("INFO", "Chờ lệnh bắt đầu xử lý...")
-                while not self.start_processing_event.is_set() and self.running:
-                    # Handle save session requests while waiting
-                    self.engine._handle_save_session()
-                    self.start_processing_event.wait(timeout=0.1)
-
-            # Phase 2: Process folders (only if not stopped)
-            if self.running and not self.engine.is_stopped():
-                self.emit_log("INFO", "Bắt đầu xử lý video...")
-                self.engine.run(
-                    log_callback=self.emit_log,
-                    progress_callback=self.emit_progress
-                )
-        except Exception as e:
-            import traceback
-            self.emit_log("ERROR", f"Exception: {e}")
-            self.emit_log("ERROR", traceback.format_exc())
-        finally:
-            self.finished_signal.emit()
+    def start_processing(self):
+        self.host.send("start")
 
-    def emit_log(self, level, message):
-        self.log_signal.emit(level, message)
+    def stop(self):
+        """Ask the engine to stop; it finishes its current step and exits on its own"""
+        self.host.send("stop")
+        QTimer.singleShot(self.STOP_GRACE_MS, self.kill)
 
-    def emit_progress(self, current, total):
-        self.progress_signal.emit(current, total)
+    def kill(self):
+        if self.running and self.host.is_alive():
+            self.log_signal.emit("WARNING", "Engine không phản hồi - buộc dừng tiến trình")
+            self.host.terminate()
 
-    def start_processing(self):
-        """Signal the thread to start processing"""
-        self.start_processing_event.set()
+    def request_save_session(self):
+        """Result arrives on save_session_signal"""
+        self.host.send("save_session")
 
-    def stop(self):
-        self.running = False
-        self.engine.stop()
-        self.start_processing_event.set()  # Unblock if waiting
+    def is_paused(self) -> bool:
+        return self.paused
+
+    def pause(self):
+        self.paused = True
+        self.host.send("pause")
+
+    def resume(self):
+        self.paused = False
+        self.host.send("resume")
+
+    def prioritize_folder(self, folder: str):
+        self.host.send("prioritize_folder", folder)
+
+    def set_schedule_policy(self, policy: str):
+        self.host.send("set_schedule_policy", policy)
+
+    def set_profiling(self, **settings):
+        self.host.send("set_profiling", **settings)
+
+
+class PlanWorker(QThread):
+    """Builds a job plan off the UI thread (dedupe hashes every new source image)"""
+    plan_ready = pyqtSignal(dict)
+    plan_failed = pyqtSignal(str)
+
+    def __init__(self, root_folder: str, selected_folders, max_concurrent: int, dedupe: bool):
+        super().__init__()
+        self.planner = JobPlanner(root_folder, selected_folders, max_concurrent, dedupe=dedupe)
+
+    def run(self):
+        try:
+            plan = self.planner.build()
+        except Exception as e:
+            self.plan_failed.emit(str(e))
+            return
+        self.plan_ready.emit(plan)
 
 
 class KlingAdvanceUI(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.engine = None
-        self.worker = None
-        self.folder_checkboxes = {}  # Dict[str, QCheckBox] - folder_name: checkbox
+        self.engine = None  # EngineProcess while a browser is open
+        self.plan_worker = None  # PlanWorker while a plan is being built
+        self.folder_model = FolderListModel()
+        self.folder_proxy = FolderFilterProxy()
+        self.folder_proxy.setSourceModel(self.folder_model)
         self.init_ui()
         self.apply_dark_theme()
 
@@ -157,6 +237,13 @@ class KlingAdvanceUI(QMainWindow):
         self.headless_check = QCheckBox("Ẩn trình duyệt")
         self.headless_check.setToolTip("Chạy trình duyệt nền")
         opt1_layout.addWidget(self.headless_check)
+        self.dedupe_check = QCheckBox("Dùng lại video trùng")
+        self.dedupe_check.setToolTip("Ảnh + prompt giống hệt đã có video → sao chép thay vì tạo lại")
+        self.dedupe_check.setChecked(True)
+        opt1_layout.addWidget(self.dedupe_check)
+        self.watch_check = QCheckBox("Theo dõi thư mục")
+        self.watch_check.setToolTip("Chạy liên tục: thư mục/ảnh/prompts.txt mới trong thư mục gốc được tự động thêm vào hàng đợi")
+        opt1_layout.addWidget(self.watch_check)
         opt1_layout.addStretch()
         settings_layout.addLayout(opt1_layout)
 
@@ -182,6 +269,79 @@ class KlingAdvanceUI(QMainWindow):
         opt3_layout.addStretch()
         settings_layout.addLayout(opt3_layout)
 
+        opt4_layout = QHBoxLayout()
+        resize_label = QLabel("Giảm ảnh tối đa (px):")
+        self.resize_spin = QSpinBox()
+        self.resize_spin.setRange(0, 8192)
+        self.resize_spin.setSingleStep(256)
+        self.resize_spin.setValue(0)
+        self.resize_spin.setSpecialValueText("Tắt")
+        self.resize_spin.setToolTip("Thu nhỏ, nén lại và xóa metadata ảnh trước khi tải lên (cần Pillow)")
+        opt4_layout.addWidget(resize_label)
+        opt4_layout.addWidget(self.resize_spin)
+        opt4_layout.addStretch()
+        settings_layout.addLayout(opt4_layout)
+
+        sink_layout = QHBoxLayout()
+        sink_label = QLabel("Sao chép video tới:")
+        self.sink_input = QLineEdit()
+        self.sink_input.setPlaceholderText("Để trống = chỉ lưu cạnh ảnh")
+        self.sink_input.setToolTip("Thư mục chung (local:DIR hoặc mirror:DIR cho ổ mạng) hoặc s3://bucket/prefix; "
+                                   "nhiều đích cách nhau bằng dấu ';'. Sao chép chạy nền trong khi vẫn tạo video.")
+        sink_layout.addWidget(sink_label)
+        sink_layout.addWidget(self.sink_input)
+        settings_layout.addLayout(sink_layout)
+
+        post_layout = QHBoxLayout()
+        post_layout.addWidget(QLabel("Hậu xử lý:"))
+        self.post_checks = {}
+        for step, text, tip in (
+            (POSTER, "Ảnh bìa", "Trích khung hình làm ảnh bìa cho mỗi video (cần ffmpeg)"),
+            (MANIFEST, "Manifest", "manifest.json cho mỗi thư mục: checksum, thời lượng, ảnh gốc, prompt"),
+            (REEL, "Ghép reel", "Ghép các video của thư mục thành reel.mp4 (cần ffmpeg)"),
+        ):
+            check = QCheckBox(text)
+            check.setToolTip(tip + ". Kết quả nằm trong thư mục _post, chạy nền không làm chậm việc tạo video.")
+            post_layout.addWidget(check)
+            self.post_checks[step] = check
+        post_layout.addStretch()
+        settings_layout.addLayout(post_layout)
+
+        opt5_layout = QHBoxLayout()
+        policy_label = QLabel("Thứ tự xử lý:")
+        self.policy_combo = QComboBox()
+        self.policy_combo.addItem("Theo thứ tự (FIFO)", FIFO)
+        self.policy_combo.addItem("Prompt ngắn trước", SHORTEST_PROMPT)
+        self.policy_combo.addItem("Hạn chót trước", DEADLINE)
+        self.policy_combo.setToolTip("Có thể đổi khi đang chạy. Chuột phải vào thư mục để ưu tiên thư mục đó.")
+        self.policy_combo.currentIndexChanged.connect(self.change_schedule_policy)
+        opt5_layout.addWidget(policy_label)
+        opt5_layout.addWidget(self.policy_combo)
+        opt5_layout.addStretch()
+        settings_layout.addLayout(opt5_layout)
+
+        opt6_layout = QHBoxLayout()
+        self.sampling_check = QCheckBox("Đo hiệu năng")
+        self.sampling_check.setToolTip("Lấy mẫu luồng xử lý; khi tắt sẽ ghi file flame graph vào thư mục .kling_profile")
+        self.sampling_check.toggled.connect(self.change_profiling)
+        self.trace_combo = QComboBox()
+        self.trace_combo.addItem("Trace: Tắt", TRACE_OFF)
+        self.trace_combo.addItem("Trace: Job chậm", TRACE_SLOW)
+        self.trace_combo.addItem("Trace: Mọi job", TRACE_ALL)
+        self.trace_combo.setToolTip("Ghi Playwright trace (.zip) cho từng job; mở bằng 'playwright show-trace'")
+        self.trace_combo.currentIndexChanged.connect(self.change_profiling)
+        self.slow_spin = QSpinBox()
+        self.slow_spin.setRange(5, 600)
+        self.slow_spin.setValue(30)
+        self.slow_spin.setSuffix(" s")
+        self.slow_spin.setToolTip("Chỉ giữ trace của bước chậm hơn ngưỡng này")
+        self.slow_spin.valueChanged.connect(self.change_profiling)
+        opt6_layout.addWidget(self.sampling_check)
+        opt6_layout.addWidget(self.trace_combo)
+        opt6_layout.addWidget(self.slow_spin)
+        opt6_layout.addStretch()
+        settings_layout.addLayout(opt6_layout)
+
         settings_group.setLayout(settings_layout)
         left_column.addWidget(settings_group)
 
@@ -197,9 +357,16 @@ class KlingAdvanceUI(QMainWindow):
         self.progress_bar.setTextVisible(True)
         progress_layout.addWidget(self.progress_bar)
 
+        self.progress_detail_label = QLabel("")
+        self.progress_detail_label.setStyleSheet("color: #888;")
+        progress_layout.addWidget(self.progress_detail_label)
+
         progress_group.setLayout(progress_layout)
         left_column.addWidget(progress_group)
 
+        self.dashboard = DashboardPanel()
+        left_column.addWidget(self.dashboard)
+
         left_column.addStretch()
         columns_layout.addLayout(left_column)
 
@@ -210,16 +377,36 @@ class KlingAdvanceUI(QMainWindow):
         folder_selection_group = QGroupBox("📁 Chọn thư mục xử lý")
         folder_selection_layout = QVBoxLayout()
 
-        scroll_area = QScrollArea()
-        scroll_area.setWidgetResizable(True)
-        scroll_area.setMinimumHeight(200)
-
-        self.folder_checkboxes_widget = QWidget()
-        self.folder_checkboxes_layout = QVBoxLayout(self.folder_checkboxes_widget)
-        self.folder_checkboxes_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
-        scroll_area.setWidget(self.folder_checkboxes_widget)
-
-        folder_selection_layout.addWidget(scroll_area)
+        folder_filter_layout = QHBoxLayout()
+        self.folder_filter_input = QLineEdit()
+        self.folder_filter_input.setPlaceholderText("Lọc theo tên...")
+        self.folder_filter_input.textChanged.connect(self.folder_proxy.set_text)
+        folder_filter_layout.addWidget(self.folder_filter_input)
+
+        self.folder_sort_combo = QComboBox()
+        self.folder_sort_combo.addItem("Tên A-Z", Qt.ItemDataRole.DisplayRole)
+        self.folder_sort_combo.addItem("Còn nhiều việc nhất", PENDING_ROLE)
+        self.folder_sort_combo.currentIndexChanged.connect(self.sort_folders)
+        folder_filter_layout.addWidget(self.folder_sort_combo)
+
+        self.pending_only_check = QCheckBox("Chỉ còn việc")
+        self.pending_only_check.setToolTip("Ẩn thư mục đã xong hoặc thiếu prompts.txt")
+        self.pending_only_check.toggled.connect(self.folder_proxy.set_only_pending)
+        folder_filter_layout.addWidget(self.pending_only_check)
+        folder_selection_layout.addLayout(folder_filter_layout)
+
+        # Model/view: only the visible rows are painted, counts arrive in the background
+        self.folder_view = QListView()
+        self.folder_view.setModel(self.folder_proxy)
+        self.folder_view.setUniformItemSizes(True)
+        self.folder_view.setMinimumHeight(200)
+        self.folder_view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.folder_view.customContextMenuRequested.connect(self.on_folder_context_menu)
+        folder_selection_layout.addWidget(self.folder_view)
+
+        self.folder_count_label = QLabel("")
+        self.folder_count_label.setStyleSheet("color: #888;")
+        folder_selection_layout.addWidget(self.folder_count_label)
 
         folder_control_layout = QHBoxLayout()
         select_all_btn = QPushButton("Chọn tất cả")
@@ -230,6 +417,11 @@ class KlingAdvanceUI(QMainWindow):
         deselect_all_btn.clicked.connect(self.deselect_all_folders)
         folder_control_layout.addWidget(deselect_all_btn)
 
+        self.check_plan_btn = QPushButton("📋 Kiểm tra")
+        self.check_plan_btn.setToolTip("Lập kế hoạch và kiểm tra dữ liệu đầu vào (không cần mở trình duyệt)")
+        self.check_plan_btn.clicked.connect(self.check_plan)
+        folder_control_layout.addWidget(self.check_plan_btn)
+
         refresh_folders_btn = QPushButton("🔄")
         refresh_folders_btn.setMaximumWidth(50)
         refresh_folders_btn.clicked.connect(self.load_folders)
@@ -485,16 +677,18 @@ class KlingAdvanceUI(QMainWindow):
 
     def save_session(self):
         """Trigger manual session save from running engine"""
-        if self.engine and hasattr(self.engine, 'request_save_session'):
-            success, message = self.engine.request_save_session()
-            if success:
-                self.log_message("SUCCESS", "Đã lưu phiên đăng nhập thành công!")
-                self.update_session_status()
-            else:
-                self.log_message("ERROR", f"Lỗi khi lưu phiên: {message}")
+        if self.engine and self.engine.browser_ready:
+            self.engine.request_save_session()
         else:
             self.log_message("WARNING", "Vui lòng mở trình duyệt trước khi lưu phiên")
 
+    def on_session_saved(self, success, message):
+        if success:
+            self.log_message("SUCCESS", "Đã lưu phiên đăng nhập thành công!")
+            self.update_session_status()
+        else:
+            self.log_message("ERROR", f"Lỗi khi lưu phiên: {message}")
+
     def delete_session(self):
         """Delete saved session file"""
         session_file = Path("state.json")
@@ -521,24 +715,43 @@ class KlingAdvanceUI(QMainWindow):
             self.log_message("ERROR", "Vui lòng chọn ít nhất một thư mục để xử lý")
             return
 
+        # Plan offline first so input problems show up before any browser time is spent
+        self.build_plan(root_folder, selected_folders, lambda plan: self.launch_engine(root_folder, selected_folders, plan))
+
+    def launch_engine(self, root_folder, selected_folders, plan):
+        """Second half of open_browser(), once the plan is ready"""
+        if plan['totals']['pending'] == 0:
+            self.log_message("WARNING", "Không có video nào cần tạo trong các thư mục đã chọn")
+
         self.log_message("INFO", "Đang chuẩn bị mở trình duyệt...")
 
-        # Create engine with selected folders
-        self.engine = KlingEngine(
+        # Create the engine process with selected folders
+        self.engine = EngineProcess(
             root_folder=root_folder,
             headless=self.headless_check.isChecked(),
             max_concurrent=self.concurrent_spin.value(),
             poll_interval=self.poll_spin.value(),
-            selected_folders=selected_folders
+            selected_folders=selected_folders,
+            plan=plan,
+            preprocess_max_side=self.resize_spin.value(),
+            dedupe=self.dedupe_check.isChecked(),
+            schedule_policy=self.policy_combo.currentData(),
+            watch=self.watch_check.isChecked(),
+            sinks=[spec.strip() for spec in self.sink_input.text().split(";") if spec.strip()],
+            post_steps=[step for step, check in self.post_checks.items() if check.isChecked()]
         )
-
-        # Start worker thread in BROWSER_ONLY mode
-        self.worker = WorkerThread(self.engine, phase="BROWSER_ONLY")
-        self.worker.log_signal.connect(self.log_message)
-        self.worker.progress_signal.connect(self.update_progress)
-        self.worker.browser_ready_signal.connect(self.on_browser_ready)
-        self.worker.finished_signal.connect(self.on_finished)
-        self.worker.start()
+        self.change_profiling()
+
+        # The engine launches the browser, then waits for 'start'
+        self.engine.log_signal.connect(self.log_message)
+        self.engine.progress_signal.connect(self.update_progress)
+        self.engine.metrics_signal.connect(self.update_metrics)
+        self.engine.dashboard_signal.connect(self.dashboard.set_snapshot)
+        self.engine.session_signal.connect(self.on_session_event)
+        self.engine.save_session_signal.connect(self.on_session_saved)
+        self.engine.browser_ready_signal.connect(self.on_browser_ready)
+        self.engine.finished_signal.connect(self.on_finished)
+        self.engine.start()
 
         self.open_browser_btn.setEnabled(False)
         self.statusBar().showMessage("Đang mở trình duyệt...")
@@ -562,62 +775,130 @@ class KlingAdvanceUI(QMainWindow):
         if not root_folder or not Path(root_folder).exists():
             return
 
-        # Clear existing checkboxes
-        for checkbox in self.folder_checkboxes.values():
-            self.folder_checkboxes_layout.removeWidget(checkbox)
-            checkbox.deleteLater()
-        self.folder_checkboxes.clear()
+        # Names only; image/prompt/output counts are filled in by a background scan
+        count = self.folder_model.load(Path(root_folder))  # Default: select all
+        self.sort_folders()
+        if not count:
+            self.folder_count_label.setText("Không tìm thấy thư mục con nào")
+            self.folder_count_label.setStyleSheet("color: #FFA500; font-style: italic;")
+            return
+        self.folder_count_label.setText(f"{count} thư mục")
+        self.folder_count_label.setStyleSheet("color: #888;")
+        self.log_message("INFO", f"Đã tải {count} thư mục")
+
+    def sort_folders(self):
+        role = self.folder_sort_combo.currentData()
+        self.folder_proxy.setSortRole(role)
+        order = Qt.SortOrder.DescendingOrder if role == PENDING_ROLE else Qt.SortOrder.AscendingOrder
+        self.folder_proxy.sort(0, order)
+
+    def on_folder_context_menu(self, pos):
+        index = self.folder_view.indexAt(pos)
+        if index.isValid():
+            name = self.folder_model.names[self.folder_proxy.mapToSource(index).row()]
+            self.show_folder_menu(name, self.folder_view.viewport().mapToGlobal(pos))
+
+    def build_plan(self, root_folder, selected_folders, on_ready):
+        """Build the job plan on a worker thread; on_ready(plan) runs on the UI thread when it is done"""
+        if self.plan_worker and self.plan_worker.isRunning():
+            self.log_message("WARNING", "Đang lập kế hoạch, vui lòng chờ...")
+            return
+        self.plan_worker = PlanWorker(root_folder, selected_folders, self.concurrent_spin.value(), self.dedupe_check.isChecked())
+        self.plan_worker.plan_ready.connect(lambda plan: on_ready(self.log_plan(plan)))
+        self.plan_worker.plan_failed.connect(lambda error: self.log_message("ERROR", f"Lập kế hoạch thất bại: {error}"))
+        self.plan_worker.finished.connect(self.on_plan_finished)
+        self.check_plan_btn.setEnabled(False)
+        self.open_browser_btn.setEnabled(False)
+        self.statusBar().showMessage("Đang lập kế hoạch...")
+        self.plan_worker.start()
+
+    def on_plan_finished(self):
+        self.check_plan_btn.setEnabled(True)
+        if self.engine is None:
+            self.open_browser_btn.setEnabled(True)
+
+    def log_plan(self, plan):
+        """Log a plan's warnings and totals"""
+        for w in plan['warnings']:
+            self.log_message("WARNING", w)
+        for folder in plan['folders']:
+            for w in folder['warnings']:
+                self.log_message("WARNING", f"[{folder['name']}] {w}")
+        self.log_message("INFO", f"Kế hoạch: {plan_summary(plan)}")
+        return plan
+
+    def check_plan(self):
+        """Dry run: show pending work and input problems without opening the browser"""
+        root_folder = self.folder_input.text()
+        if not root_folder or not Path(root_folder).exists():
+            self.log_message("ERROR", "Vui lòng chọn thư mục gốc trước")
+            return
+
+        selected_folders = self.get_selected_folders()
+        if not selected_folders:
+            self.log_message("ERROR", "Vui lòng chọn ít nhất một thư mục để xử lý")
+            return
 
-        # Load folders
-        root_path = Path(root_folder)
-        folders = sorted([f for f in root_path.iterdir() if f.is_dir()])
+        self.build_plan(root_folder, selected_folders, lambda plan: self.statusBar().showMessage(plan_summary(plan)))
 
-        if not folders:
-            no_folder_label = QLabel("Không tìm thấy thư mục con nào")
-            no_folder_label.setStyleSheet("color: #FFA500; font-style: italic;")
-            self.folder_checkboxes_layout.addWidget(no_folder_label)
+    def show_folder_menu(self, folder_name, global_pos):
+        menu = QMenu(self)
+        prioritize_action = menu.addAction("⚡ Ưu tiên thư mục này")
+        prioritize_action.setEnabled(self.engine is not None)
+        if menu.exec(global_pos) == prioritize_action:
+            self.prioritize_folder(folder_name)
+
+    def prioritize_folder(self, folder_name):
+        """Move a folder's pending jobs ahead of everything else without restarting"""
+        if not self.engine:
             return
+        self.engine.prioritize_folder(folder_name)
+        self.log_message("INFO", f"Đã ưu tiên thư mục: {folder_name}")
 
-        # Create checkbox for each folder
-        for folder in folders:
-            # Count images in folder
-            image_count = len(list(folder.glob('*.jpg'))) + len(list(folder.glob('*.png'))) + \
-                         len(list(folder.glob('*.jpeg'))) + len(list(folder.glob('*.webp')))
+    def change_schedule_policy(self):
+        if self.engine:
+            self.engine.set_schedule_policy(self.policy_combo.currentData())
+            self.log_message("INFO", f"Thứ tự xử lý: {self.policy_combo.currentText()}")
 
-            checkbox = QCheckBox(f"{folder.name} ({image_count} images)")
-            checkbox.setChecked(True)  # Default: select all
-            self.folder_checkboxes[folder.name] = checkbox
-            self.folder_checkboxes_layout.addWidget(checkbox)
+    def change_profiling(self):
+        """Profilers can be switched on and off while running"""
+        if self.engine:
+            self.engine.set_profiling(
+                sampling=self.sampling_check.isChecked(),
+                trace=self.trace_combo.currentData(),
+                slow_seconds=self.slow_spin.value(),
+            )
 
-        self.log_message("INFO", f"Đã tải {len(folders)} thư mục")
+    def set_folders_checked(self, checked):
+        """Check or uncheck every folder shown (only the filtered ones while a filter is active)"""
+        if self.folder_proxy.is_filtered():
+            self.folder_model.set_rows_checked(self.folder_proxy.source_rows(), checked)
+        else:
+            self.folder_model.set_all_checked(checked)
 
     def select_all_folders(self):
-        """Check all folder checkboxes"""
-        for checkbox in self.folder_checkboxes.values():
-            checkbox.setChecked(True)
+        self.set_folders_checked(True)
 
     def deselect_all_folders(self):
-        """Uncheck all folder checkboxes"""
-        for checkbox in self.folder_checkboxes.values():
-            checkbox.setChecked(False)
+        self.set_folders_checked(False)
 
     def get_selected_folders(self):
         """Get list of selected folder names"""
-        return [folder_name for folder_name, checkbox in self.folder_checkboxes.items() if checkbox.isChecked()]
+        return self.folder_model.checked_names()
 
     def start_process(self):
-        if not self.worker or not self.worker.isRunning():
+        if not self.engine or not self.engine.running:
             self.log_message("ERROR", "Vui lòng mở trình duyệt trước khi bắt đầu")
             return
 
-        if not self.engine or not self.engine.browser or not self.engine.page:
+        if not self.engine.browser_ready:
             self.log_message("ERROR", "Trình duyệt chưa sẵn sàng. Vui lòng mở trình duyệt trước.")
             return
 
         self.log_message("INFO", "Gửi lệnh bắt đầu xử lý...")
 
-        # Signal the worker thread to start processing
-        self.worker.start_processing()
+        # Signal the engine process to start processing
+        self.engine.start_processing()
 
         self.open_browser_btn.setEnabled(False)
         self.start_btn.setEnabled(False)
@@ -638,12 +919,25 @@ class KlingAdvanceUI(QMainWindow):
                 self.log_message("INFO", "Đã tạm dừng")
                 self.statusBar().showMessage("Đã tạm dừng")
 
+    def on_session_event(self, event):
+        """Engine paused itself on a dead session: keep the pause button in sync"""
+        if event['type'] == 'session_expired':
+            self.pause_btn.setText("▶ Tiếp tục")
+            self.statusBar().showMessage("Phiên đăng nhập hết hạn - đã tạm dừng")
+            self.session_status_label.setText("✗ Phiên đăng nhập đã hết hạn")
+            self.session_status_label.setStyleSheet("color: #FF4444;")
+        else:
+            self.update_session_status()
+
     def stop_process(self):
-        if self.worker:
+        """Non-blocking: the window stays live and on_finished runs when the engine process exits"""
+        if self.engine and self.engine.running:
             self.log_message("WARNING", "Đang dừng tiến trình...")
-            self.worker.stop()
-            self.worker.wait()
-            self.on_finished()
+            self.engine.stop()
+            self.start_btn.setEnabled(False)
+            self.pause_btn.setEnabled(False)
+            self.stop_btn.setEnabled(False)
+            self.statusBar().showMessage("Đang dừng...")
 
     def on_finished(self):
         self.log_message("INFO", "Tiến trình đã hoàn thành")
@@ -655,6 +949,17 @@ class KlingAdvanceUI(QMainWindow):
         self.update_session_status()
         self.statusBar().showMessage("Hoàn thành")
 
+    def closeEvent(self, event):
+        """Closing the window takes the engine process (and its browser) with it"""
+        if self.engine and self.engine.running:
+            self.engine.host.send("stop")
+            self.engine.host.process.join(timeout=10)
+            self.engine.host.terminate()
+        self.folder_model.stop_worker()
+        if self.plan_worker:
+            self.plan_worker.wait()
+        event.accept()
+
     def update_progress(self, current, total):
         if total > 0:
             percentage = int((current / total) * 100)
@@ -663,6 +968,18 @@ class KlingAdvanceUI(QMainWindow):
         else:
             self.progress_bar.setValue(0)
 
+    def update_metrics(self, snapshot):
+        """Run-wide job states, throughput and ETA from the engine's progress events"""
+        c = snapshot['counts']
+        text = (f"Chờ {c['pending']} | Đang render {c['rendering']} | Đang tải {c['downloading']} | "
+                f"Xong {c['done']} | Lỗi {c['failed']}")
+        if snapshot['throughput_per_hour']:
+            text += f"\n{snapshot['throughput_per_hour']:.1f} video/giờ"
+        if snapshot['eta_seconds']:
+            prefix = "còn" if snapshot['eta_from_throughput'] else "còn khoảng"
+            text += f" | {prefix} {format_duration(snapshot['eta_seconds'])}"
+        self.progress_detail_label.setText(text)
+
     def log_message(self, level, message):
         timestamp = datetime.now().strftime("%H:%M:%S")
 
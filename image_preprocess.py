@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Optional image pre-processing before upload.
+
+Large source images are downscaled, recompressed and stripped of metadata in a
+process pool while the engine is busy with earlier jobs.  Small images are
+uploaded as-is only when they carry no metadata (EXIF/GPS, XMP, comments);
+otherwise they are re-saved without it like the large ones.  Results are cached
+under .kling_cache/images keyed by content hash + settings, so reruns reuse
+them.  Requires Pillow; without it the engine uploads the original files.
+"""
+import os
+import time
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, Future, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from kling_cache import cache_dir, file_sha256
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional
+    Image = None
+    ImageOps = None
+
+PREPROCESS_VERSION = 1
+# Files already within max_side, below this size and without metadata are uploaded as-is
+SMALL_FILE_BYTES = 1024 * 1024
+METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp", "comment")
+WAIT_SLICE = 0.2  # get() runs its check() at least this often while waiting
+
+
+def has_metadata(im) -> bool:
+    """EXIF (camera, GPS), XMP, comments or PNG text chunks that would be uploaded with the file"""
+    return bool(im.getexif()) or any(k in im.info for k in METADATA_KEYS) or bool(getattr(im, "text", None))
+
+
+def _preprocess_one(src: str, known_sha: Optional[str], out_dir: str, max_side: int, quality: int, settings_key: str) -> Tuple[str, str]:
+    """Runs in a worker process. Returns (content sha256, path to upload)."""
+    sha = known_sha or file_sha256(src)
+    dst = os.path.join(out_dir, f"{sha[:32]}-{settings_key}.jpg")
+    if os.path.exists(dst):
+        return sha, dst
+
+    with Image.open(src) as im:
+        if max(im.size) <= max_side and os.path.getsize(src) <= SMALL_FILE_BYTES and not has_metadata(im):
+            return sha, src
+        im = ImageOps.exif_transpose(im)  # bake orientation in before EXIF is dropped
+        if im.mode != "RGB":
+            im = im.convert("RGB")
+        im.thumbnail((max_side, max_side), Image.LANCZOS)
+        tmp = dst + ".tmp"
+        # No exif/icc arguments -> metadata is not copied
+        im.save(tmp, format="JPEG", quality=quality, optimize=True)
+    os.replace(tmp, dst)
+    return sha, dst
+
+
+class ImagePreprocessor:
+    def __init__(self, max_side: int = 1920, quality: int = 90, workers: Optional[int] = None):
+        if Image is None:
+            raise RuntimeError("Pillow is not installed (pip install Pillow)")
+        self.max_side = max_side
+        self.quality = quality
+        self.settings_key = f"v{PREPROCESS_VERSION}-{max_side}-q{quality}"
+        self.out_dir = str(cache_dir("images"))
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.futures: Dict[str, Future] = {}
+
+    @staticmethod
+    def available() -> bool:
+        return Image is not None
+
+    def start(self, paths: Iterable[Path], known_shas: Optional[Dict[str, str]] = None):
+        """Queue images for pre-processing; returns immediately.
+        known_shas (str path -> sha256) skips re-hashing images the planner already hashed."""
+        known_shas = known_shas or {}
+        for p in paths:
+            key = str(p)
+            if key in self.futures:
+                continue
+            self.futures[key] = self.executor.submit(
+                _preprocess_one, key, known_shas.get(key), self.out_dir, self.max_side, self.quality, self.settings_key
+            )
+
+    def get(self, img_path: Path, timeout: float = 120.0, check: Optional[Callable[[], None]] = None) -> Path:
+        """Path to upload for img_path; falls back to the original on any failure.
+        check() runs between short waits and may raise to abandon the wait (e.g. Cancelled on stop)."""
+        fut = self.futures.get(str(img_path))
+        if fut is None:
+            self.start([img_path])
+            fut = self.futures[str(img_path)]
+        deadline = time.time() + timeout
+        while True:
+            if check:
+                check()
+            try:
+                _, out = fut.result(timeout=max(0.0, min(WAIT_SLICE, deadline - time.time())))
+                return Path(out)
+            except FutureTimeout:
+                if fut.done() or time.time() >= deadline:  # done: the worker itself raised a TimeoutError
+                    return img_path
+            except Exception:
+                return img_path
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""Offline job planning: scan the folder tree before the browser launches.
+
+A plan is a plain dict (JSON-serializable) describing every selected folder,
+its image <-> prompt mapping, outputs that already exist and any input
+problems found along the way.  KlingEngine runs directly from a plan, so the
+folders are scanned exactly once.
+"""
+import re
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import List, Dict, Iterator, Optional
+
+from kling_cache import HashIndex, ResultCache, dedupe_key
+from video_integrity import VerifiedIndex
+
+PLAN_VERSION = 1
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp")
+
+# Rough per-job costs used for the duration estimate (seconds)
+AVG_RENDER_SECONDS = 300.0
+AVG_SUBMIT_SECONDS = 25.0
+
+
+def list_images_sorted(dir_path: Path) -> List[Path]:
+    imgs = [p for p in dir_path.iterdir() if p.suffix.lower() in IMAGE_EXTS]
+    def sort_key(p: Path):
+        m = re.match(r"^(\d+)$", p.stem)
+        if m:
+            return (0, int(m.group(1)))
+        m2 = re.match(r"^(\d+)[-_].*", p.stem)
+        if m2:
+            return (0, int(m2.group(1)))
+        return (1, p.name.lower())
+    return sorted(imgs, key=sort_key)
+
+
+def read_prompts(dir_path: Path) -> List[str]:
+    txt = dir_path / "prompts.txt"
+    if not txt.exists():
+        raise FileNotFoundError(f"Không thấy {txt}")
+    lines = [ln.rstrip("\n") for ln in txt.read_text(encoding="utf-8").splitlines()]
+    return lines
+
+
+def normalize_prompt_text(s: str) -> str:
+    if not s:
+        return ""
+    s = s.strip()
+    s = re.sub(r"^\s*\d+\s*[:.\\-]\s*", "", s)
+    return s.strip().lower()
+
+
+def read_schedule(dir_path: Path) -> Dict:
+    """Optional schedule.json: {"priority": 5, "deadline_minutes": 90, "jobs": {"3": {"priority": 10}}}"""
+    path = dir_path / "schedule.json"
+    if not path.exists():
+        return {}
+    return check_schedule(json.loads(path.read_text(encoding="utf-8")))
+
+
+def check_schedule(schedule) -> Dict:
+    """Validate a parsed schedule.json and normalize its numbers; ValueError when the shape is wrong"""
+    if not isinstance(schedule, dict):
+        raise ValueError("expected a JSON object")
+    jobs = schedule.setdefault('jobs', {})
+    if not isinstance(jobs, dict):
+        raise ValueError("'jobs' must be an object keyed by image number")
+    entries = [("", schedule)] + [(f"jobs.{number}.", entry) for number, entry in jobs.items()]
+    for where, entry in entries:
+        if not isinstance(entry, dict):
+            raise ValueError(f"{where.rstrip('.')} must be an object")
+        try:
+            entry['priority'] = int(entry.get('priority', 0))
+        except (TypeError, ValueError):
+            raise ValueError(f"{where}priority must be a whole number, got {entry.get('priority')!r}") from None
+        deadline = entry.get('deadline_minutes')
+        if deadline is not None:
+            if isinstance(deadline, bool) or not isinstance(deadline, (int, float)):
+                raise ValueError(f"{where}deadline_minutes must be a number, got {deadline!r}")
+    return schedule
+
+
+def build_prompt_map(prompts: List[str]) -> Dict[int, str]:
+    """Map prompt number -> raw prompt ("1: text" -> 1, otherwise line number)"""
+    prompt_map = {}
+    for idx, prompt in enumerate(prompts):
+        m = re.match(r"^\s*(\d+)\s*[:.–—-]\s*", prompt)
+        if m:
+            prompt_map[int(m.group(1))] = prompt
+        else:
+            prompt_map[idx + 1] = prompt
+    return prompt_map
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(max(0, seconds))
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    if h:
+        return f"{h}h{m:02d}m"
+    if m:
+        return f"{m}m{s:02d}s"
+    return f"{s}s"
+
+
+class JobPlanner:
+    def __init__(self, root_folder: str, selected_folders: Optional[List[str]] = None, max_concurrent: int = 2, dedupe: bool = False, verified_index: Optional[VerifiedIndex] = None):
+        self.root_folder = Path(root_folder)
+        self.selected_folders = selected_folders  # None = all folders
+        self.max_concurrent = max(1, max_concurrent)
+        self.dedupe = dedupe  # Hash images and look up already-rendered (image, prompt) pairs
+        self.verified = verified_index  # VerifiedIndex, loaded on first use
+
+    def folders_to_plan(self, warnings: List[str]) -> List[Path]:
+        if self.selected_folders:
+            folders = []
+            for folder_name in self.selected_folders:
+                folder_path = self.root_folder / folder_name
+                if folder_path.is_dir():
+                    folders.append(folder_path)
+                else:
+                    warnings.append(f"Folder not found: {folder_name}")
+            return folders
+        return sorted(child for child in self.root_folder.iterdir()
+                      if child.is_dir() and not child.name.startswith("."))
+
+    def plan_folder(self, sub_dir: Path) -> Dict:
+        """Build the job list for one folder without touching the browser"""
+        folder = {
+            'name': sub_dir.name,
+            'path': str(sub_dir),
+            'skipped': False,
+            'priority': 0,
+            'warnings': [],
+            'jobs': [],
+        }
+        warnings = folder['warnings']
+        try:
+            schedule = read_schedule(sub_dir)
+        except ValueError as e:
+            warnings.append(f"Ignoring invalid schedule.json: {e}")
+            schedule = {}
+        folder['priority'] = schedule.get('priority', 0)
+        job_schedules = schedule.get('jobs', {})
+        images = list_images_sorted(sub_dir)
+
+        try:
+            prompts = read_prompts(sub_dir)
+        except FileNotFoundError as e:
+            warnings.append(f"Skip folder: {e}")
+            folder['skipped'] = True
+            return folder
+
+        if not images:
+            warnings.append("No images found")
+
+        if len(prompts) < len(images):
+            warnings.append(f"prompts.txt has fewer lines ({len(prompts)}) than images ({len(images)}). Processing first {len(prompts)} images.")
+            images = images[:len(prompts)]
+
+        prompt_map = build_prompt_map(prompts)
+        seen_numbers = {}
+        for img in images:
+            m = re.match(r"^(\d+)", img.stem)
+            if not m:
+                warnings.append(f"Cannot extract number from {img.name}, skipping...")
+                continue
+
+            img_num = int(m.group(1))
+            raw = prompt_map.get(img_num)
+            if raw is None:
+                warnings.append(f"No prompt found for image number {img_num} ({img.name}), skipping...")
+                continue
+            if img_num in seen_numbers:
+                warnings.append(f"{img.name} and {seen_numbers[img_num]} share prompt number {img_num}")
+            seen_numbers[img_num] = img.name
+
+            output = img.with_suffix('.mp4')
+            done = False
+            if output.exists():
+                done, reason = self.verified_index().check(output)
+                if not done:
+                    warnings.append(f"{output.name} is broken ({reason}), will regenerate")
+            job_schedule = job_schedules.get(str(img_num), {})
+            folder['jobs'].append({
+                'image': str(img),
+                'number': img_num,
+                'prompt_raw': raw,
+                'prompt_norm': normalize_prompt_text(raw),
+                'output': str(output),
+                'done': done,
+                'priority': job_schedule.get('priority', 0),
+                # Minutes after the run starts; None = no deadline
+                'deadline_minutes': job_schedule.get('deadline_minutes', schedule.get('deadline_minutes')),
+            })
+
+        return folder
+
+    def verified_index(self) -> VerifiedIndex:
+        if self.verified is None:
+            self.verified = VerifiedIndex()
+        return self.verified
+
+    def apply_dedupe(self, folders: List[Dict], hashes: Optional[HashIndex] = None, results: Optional[ResultCache] = None):
+        """Attach content keys to jobs; pending jobs with a cached result get 'reuse_from'.
+        Indexes passed in are left for the caller to save."""
+        owned = hashes is None
+        if owned:
+            hashes = HashIndex()
+            results = ResultCache()
+        for folder in folders:
+            for job in folder['jobs']:
+                try:
+                    sha = hashes.sha256(Path(job['image']))
+                except OSError as e:
+                    folder['warnings'].append(f"Cannot hash {Path(job['image']).name}: {e}")
+                    continue
+                job['image_sha'] = sha
+                job['dedupe_key'] = dedupe_key(sha, job['prompt_norm'])
+                if job['done']:
+                    results.record(job['dedupe_key'], Path(job['output']))
+                else:
+                    hit = results.lookup(job['dedupe_key'])
+                    if hit:
+                        job['reuse_from'] = str(hit)
+        if owned:
+            hashes.save()
+            results.save()
+
+    def iter_folders(self, folders: Optional[List[Path]] = None) -> Iterator[Dict]:
+        """Folder plans one at a time, for roots too large to plan up front"""
+        if folders is None:
+            folders = self.folders_to_plan([])
+        hashes = results = None
+        if self.dedupe:
+            hashes, results = HashIndex(), ResultCache()
+        try:
+            for sub_dir in folders:
+                folder = self.plan_folder(sub_dir)
+                if self.dedupe:
+                    self.apply_dedupe([folder], hashes, results)
+                folder['pending'] = sum(1 for j in folder['jobs'] if not j['done'])
+                yield folder
+        finally:
+            if self.dedupe:
+                hashes.save()
+                results.save()
+            if self.verified is not None:
+                self.verified.save()
+
+    def build(self) -> Dict:
+        plan_warnings = []
+        folders = [self.plan_folder(f) for f in self.folders_to_plan(plan_warnings)]
+        if self.dedupe:
+            self.apply_dedupe(folders)
+        if self.verified is not None:
+            self.verified.save()
+        plan = empty_plan(str(self.root_folder), self.max_concurrent)
+        plan['warnings'] = plan_warnings
+        plan['folders'] = folders
+        return update_plan_totals(plan)
+
+
+def empty_plan(root_folder: str = "", max_concurrent: int = 2) -> Dict:
+    """A plan with no folders - for engines that only receive work through submit_batch()"""
+    plan = {
+        'version': PLAN_VERSION,
+        'root': root_folder,
+        'created_at': time.time(),
+        'max_concurrent': max_concurrent,
+        'warnings': [],
+        'folders': [],
+    }
+    return update_plan_totals(plan)
+
+
+def estimate_seconds(pending: int, max_concurrent: int, render_seconds: float = AVG_RENDER_SECONDS) -> float:
+    """Submissions are serial, renders overlap up to max_concurrent"""
+    if pending <= 0:
+        return 0.0
+    submit_bound = pending * AVG_SUBMIT_SECONDS
+    render_bound = pending * render_seconds / max(1, max_concurrent)
+    return max(submit_bound, render_bound) + render_seconds
+
+
+def update_plan_totals(plan: Dict) -> Dict:
+    jobs = [j for f in plan['folders'] for j in f['jobs']]
+    done = sum(1 for j in jobs if j['done'])
+    pending = len(jobs) - done
+    # Jobs served from the result cache or sharing a key with another pending job need no render
+    reusable = 0
+    to_render = set()
+    for j in jobs:
+        if j['done']:
+            continue
+        if j.get('reuse_from'):
+            reusable += 1
+        else:
+            to_render.add(j.get('dedupe_key') or j['output'])
+    for f in plan['folders']:
+        f['pending'] = sum(1 for j in f['jobs'] if not j['done'])
+    plan['totals'] = {
+        'folders': len(plan['folders']),
+        'jobs': len(jobs),
+        'done': done,
+        'pending': pending,
+        'reusable': reusable,
+        'to_render': len(to_render),
+        'warnings': len(plan['warnings']) + sum(len(f['warnings']) for f in plan['folders']),
+    }
+    plan['estimated_seconds'] = estimate_seconds(len(to_render), plan.get('max_concurrent', 1))
+    return plan
+
+
+def plan_summary(plan: Dict) -> str:
+    t = plan['totals']
+    return (f"{t['folders']} thư mục | {t['jobs']} video | đã có {t['done']} | "
+            f"cần tạo {t['pending']} (dùng lại {t['pending'] - t['to_render']}) | cảnh báo {t['warnings']} | "
+            f"ước tính {format_duration(plan['estimated_seconds'])}")
+
+
+def save_plan(plan: Dict, path: str):
+    Path(path).write_text(json.dumps(plan, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def load_plan(path: str) -> Dict:
+    plan = json.loads(Path(path).read_text(encoding="utf-8"))
+    if plan.get('version') != PLAN_VERSION:
+        raise ValueError(f"Unsupported plan version: {plan.get('version')}")
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Kling job plan without launching the browser")
+    parser.add_argument("root", help="Root folder containing subfolders")
+    parser.add_argument("--folders", nargs="*", help="Only plan these subfolders")
+    parser.add_argument("--concurrent", type=int, default=2, help="Max concurrent videos (for the estimate)")
+    parser.add_argument("--no-dedupe", action="store_true", help="Do not hash images or reuse cached results")
+    parser.add_argument("--out", help="Write the plan as JSON to this file")
+    args = parser.parse_args()
+
+    plan = JobPlanner(args.root, args.folders, args.concurrent, dedupe=not args.no_dedupe).build()
+    for w in plan['warnings']:
+        print(f"[WARNING] {w}")
+    for f in plan['folders']:
+        print(f"{f['name']}: {len(f['jobs'])} jobs, {f['pending']} pending")
+        for w in f['warnings']:
+            print(f"  [WARNING] {w}")
+    print(plan_summary(plan))
+    if args.out:
+        save_plan(plan, args.out)
+        print(f"Plan saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
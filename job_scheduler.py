@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Priority-queue scheduling of pending jobs across all selected folders.
+
+Jobs are kept in a heap ordered by (folder priority + job priority, policy
+key, submission order).  Priorities and the policy can be changed while the
+engine runs; the heap is rebuilt and the next pick reflects the change.
+"""
+import heapq
+import itertools
+import threading
+from typing import Callable, Dict, List, Optional
+
+from job_store import Job, JobState
+
+FIFO = "fifo"
+SHORTEST_PROMPT = "shortest_prompt"
+DEADLINE = "deadline"
+POLICIES = (FIFO, SHORTEST_PROMPT, DEADLINE)
+
+NO_DEADLINE = float("inf")
+
+
+class JobScheduler:
+    def __init__(self, policy: str = FIFO):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {policy}")
+        self.policy = policy
+        self.folder_priority: Dict[str, int] = {}  # overrides set while running
+        self._heap = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)
+
+    def sort_key(self, job: Job) -> tuple:
+        folder_prio = self.folder_priority.get(job.folder, job.folder_priority)
+        prio = -(folder_prio + job.priority)  # higher priority first
+        if self.policy == DEADLINE:
+            return (prio, job.deadline if job.deadline is not None else NO_DEADLINE)
+        if self.policy == SHORTEST_PROMPT:
+            return (prio, len(job.prompt_raw))
+        return (prio,)
+
+    def push(self, job: Job):
+        with self._lock:
+            if job.scheduled:
+                return
+            job.scheduled = True
+            if job.seq is None:
+                job.seq = next(self._seq)
+            heapq.heappush(self._heap, (self.sort_key(job), job.seq, job))
+
+    def pop_next(self, is_ready: Callable[[Job], bool]) -> Optional[Job]:
+        """Pop the best pending job accepted by is_ready; jobs not ready yet stay queued"""
+        deferred = []
+        picked = None
+        with self._lock:
+            while self._heap:
+                entry = heapq.heappop(self._heap)
+                job = entry[2]
+                if job.state != JobState.PENDING:
+                    job.scheduled = False  # finished elsewhere (e.g. filled as a duplicate)
+                    continue
+                if is_ready(job):
+                    job.scheduled = False
+                    picked = job
+                    break
+                deferred.append(entry)
+            for entry in deferred:
+                heapq.heappush(self._heap, entry)
+        return picked
+
+    def _rebuild(self):
+        self._heap = [(self.sort_key(job), seq, job) for _, seq, job in self._heap]
+        heapq.heapify(self._heap)
+
+    def set_folder_priority(self, folder: str, priority: int):
+        with self._lock:
+            self.folder_priority[folder] = priority
+            self._rebuild()
+
+    def set_policy(self, policy: str):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {policy}")
+        with self._lock:
+            self.policy = policy
+            self._rebuild()
+
+    def max_folder_priority(self) -> int:
+        with self._lock:
+            prios = [self.folder_priority.get(job.folder, job.folder_priority) for _, _, job in self._heap]
+        return max(prios + list(self.folder_priority.values()) + [0])
+
+    def pending_jobs(self) -> List[Job]:
+        with self._lock:
+            return [entry[2] for entry in sorted(self._heap)]
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Compact in-memory job records with per-state indexes.
+
+A Job is a __slots__ record (no per-instance dict, the image path kept as a
+str, the normalized prompt derived on demand).  JobStore keeps insertion-
+ordered index sets per state, per dedupe key and per folder, so the engine
+loop only ever touches the jobs in the state it cares about (a handful of
+rendering jobs) instead of rescanning every job each tick.
+"""
+import itertools
+from enum import IntEnum
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from job_planner import normalize_prompt_text
+
+
+class JobState(IntEnum):
+    PENDING = 0
+    GENERATING = 1
+    DOWNLOADED = 2
+    FAILED = 3
+
+
+STATUS_NAMES = ('pending', 'generating', 'downloaded', 'failed')
+FINISHED = (JobState.DOWNLOADED, JobState.FAILED)
+
+
+class Job:
+    __slots__ = (
+        'id', 'image', 'folder', 'folder_path', 'prompt_raw', 'dedupe_key', 'state',
+        'article_position', 'queued_timestamp', 'folder_priority', 'priority',
+        'deadline', 'retry_at', 'finished_at', 'scheduled', 'seq',
+        'loaded_at', 'submitted_at', 'check_after',
+    )
+
+    def __init__(self, job_id: int, image: str, folder: str, folder_path: str, prompt_raw: str,
+                 state: JobState = JobState.PENDING, dedupe_key: Optional[str] = None,
+                 folder_priority: int = 0, priority: int = 0, deadline: Optional[float] = None):
+        self.id = job_id
+        self.image = image
+        self.folder = folder  # folder name (shared str for the whole folder)
+        self.folder_path = folder_path
+        self.prompt_raw = prompt_raw
+        self.dedupe_key = dedupe_key  # same key = same image content + prompt
+        self.state = state
+        self.article_position: Optional[int] = None  # set after queuing
+        self.queued_timestamp: Optional[float] = None  # set when queued
+        self.folder_priority = folder_priority
+        self.priority = priority
+        self.deadline = deadline
+        self.retry_at = 0.0
+        self.finished_at = 0.0
+        self.scheduled = False  # owned by JobScheduler
+        self.seq: Optional[int] = None  # owned by JobScheduler
+        self.loaded_at = 0.0  # entered the engine's queue
+        self.submitted_at: Optional[float] = None  # Generate confirmed in this run (None for adopted renders)
+        self.check_after = 0.0  # feed checks skipped before this (predicted earliest finish)
+
+    @property
+    def img_path(self) -> Path:
+        return Path(self.image)
+
+    @property
+    def prompt_norm(self) -> str:
+        return normalize_prompt_text(self.prompt_raw)
+
+    @property
+    def status(self) -> str:
+        return STATUS_NAMES[self.state]
+
+    @property
+    def downloaded(self) -> bool:
+        return self.state == JobState.DOWNLOADED
+
+
+class JobStore:
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.jobs: List[Job] = []
+        self.by_state: List[Dict[Job, None]] = [{} for _ in JobState]  # dicts as ordered sets
+        self.by_key: Dict[str, List[Job]] = {}
+        self.by_image: Dict[str, Job] = {}  # image path -> job, so re-planned folders only add new images
+        self.folder_jobs: Dict[str, List[Job]] = {}  # folder path -> its jobs
+        self.folder_open: Dict[str, int] = {}  # folder path -> unfinished jobs
+        self.finished_folders: List[str] = []  # folders that reached 0 open jobs, drained by the engine
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def __iter__(self) -> Iterator[Job]:
+        return iter(self.jobs)
+
+    def new_job(self, **fields) -> Job:
+        job = Job(next(self._ids), **fields)
+        self.jobs.append(job)
+        self.by_state[job.state][job] = None
+        if job.dedupe_key:
+            self.by_key.setdefault(job.dedupe_key, []).append(job)
+        self.by_image[job.image] = job
+        self.folder_jobs.setdefault(job.folder_path, []).append(job)
+        if job.state not in FINISHED:
+            self.folder_open[job.folder_path] = self.folder_open.get(job.folder_path, 0) + 1
+        return job
+
+    def set_state(self, job: Job, state: JobState):
+        old = job.state
+        if old == state:
+            return
+        del self.by_state[old][job]
+        self.by_state[state][job] = None
+        job.state = state
+        was_open, is_open = old not in FINISHED, state not in FINISHED
+        if was_open and not is_open:
+            self.folder_open[job.folder_path] -= 1
+            if self.folder_open[job.folder_path] == 0:
+                self.finished_folders.append(job.folder_path)
+        elif is_open and not was_open:
+            self.folder_open[job.folder_path] += 1
+
+    def update_prompt(self, job: Job, prompt_raw: str, dedupe_key: Optional[str]):
+        """prompts.txt changed for a job that has not been submitted yet"""
+        if job.dedupe_key:
+            self.by_key[job.dedupe_key].remove(job)
+        job.prompt_raw = prompt_raw
+        job.dedupe_key = dedupe_key
+        if dedupe_key:
+            self.by_key.setdefault(dedupe_key, []).append(job)
+
+    def in_state(self, state: JobState) -> List[Job]:
+        """Snapshot of the jobs in one state (safe to change states while iterating)"""
+        return list(self.by_state[state])
+
+    def count(self, *states: JobState) -> int:
+        return sum(len(self.by_state[s]) for s in states)
+
+    def all_finished(self) -> bool:
+        return self.count(*FINISHED) == len(self.jobs)
+
+    def duplicates(self, job: Job) -> List[Job]:
+        return [other for other in self.by_key.get(job.dedupe_key, ()) if other is not job] if job.dedupe_key else []
+
+    def take_finished_folders(self) -> List[str]:
+        done, self.finished_folders = self.finished_folders, []
+        return done
+
+    def status_counts(self) -> Dict[str, int]:
+        return {STATUS_NAMES[s]: len(self.by_state[s]) for s in JobState if self.by_state[s]}
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Playwright trace capture for individual jobs.
+
+Tracing runs for the whole context, with one trace chunk per span of
+engine work on a job (its submit, each download attempt).  Chunks are kept
+as .zip files for every job, for chosen jobs, or only when the span was
+slower than a threshold; the rest are discarded when the chunk stops.
+Open a kept chunk with `playwright show-trace <file>.zip`.
+
+Must be used from the browser thread, like every Playwright call.
+"""
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
+
+OFF = "off"
+SLOW = "slow"
+ALL = "all"
+MODES = (OFF, SLOW, ALL)
+DEFAULT_SLOW_SECONDS = 30.0
+
+UNSAFE_CHARS = re.compile(r"[^\w.-]+")
+
+
+class JobTracer:
+    def __init__(self, out_dir: Path, log: Optional[Callable[[str, str], None]] = None):
+        self.out_dir = Path(out_dir)
+        self.log = log or (lambda level, msg: None)
+        self.mode = OFF
+        self.slow_seconds = DEFAULT_SLOW_SECONDS
+        self.jobs = set()  # job labels traced whatever the mode
+        self.context = None
+        self.tracing = False
+        self.kept = 0
+        self.discarded = 0
+        self.overhead = 0.0  # seconds spent starting and stopping chunks
+
+    def configure(self, mode: Optional[str] = None, slow_seconds: Optional[float] = None,
+                  jobs: Optional[Iterable[str]] = None):
+        if mode is not None:
+            if mode not in MODES:
+                raise ValueError(f"Unknown trace mode: {mode}")
+            self.mode = mode
+        if slow_seconds is not None:
+            self.slow_seconds = float(slow_seconds)
+        if jobs is not None:
+            self.jobs = set(jobs)
+        if not self.active:
+            self.stop()
+
+    @property
+    def active(self) -> bool:
+        return self.mode != OFF or bool(self.jobs)
+
+    def attach(self, context):
+        self.context = context
+        self.tracing = False
+
+    def stop(self):
+        """End tracing for the context (chunks already kept stay on disk)"""
+        if self.tracing and self.context:
+            try:
+                self.context.tracing.stop()
+            except Exception:
+                pass
+        self.tracing = False
+
+    @contextmanager
+    def span(self, label: str, kind: str):
+        if not self.context or not (self.mode != OFF or label in self.jobs):
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            if not self.tracing:
+                self.context.tracing.start(screenshots=True, snapshots=True)
+                self.tracing = True
+            self.context.tracing.start_chunk(title=f"{label} {kind}")
+        except Exception as e:
+            self.log("WARNING", f"Trace start failed: {e}")
+            yield
+            return
+        started = time.perf_counter()
+        self.overhead += started - t0
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            t1 = time.perf_counter()
+            keep = failed or self.mode == ALL or label in self.jobs or duration >= self.slow_seconds
+            try:
+                if keep:
+                    self.out_dir.mkdir(parents=True, exist_ok=True)
+                    path = self.out_dir / f"trace_{int(time.time() * 1000)}_{UNSAFE_CHARS.sub('_', label)}_{kind}.zip"
+                    self.context.tracing.stop_chunk(path=str(path))
+                    self.kept += 1
+                    self.log("DEBUG", f"Trace {label} {kind} ({duration:.1f}s): {path}")
+                else:
+                    self.context.tracing.stop_chunk()
+                    self.discarded += 1
+            except Exception as e:
+                self.log("WARNING", f"Trace stop failed: {e}")
+            self.overhead += time.perf_counter() - t1
+
+    def report(self) -> Dict:
+        return {
+            'mode': self.mode,
+            'slow_seconds': self.slow_seconds,
+            'jobs': sorted(self.jobs),
+            'kept': self.kept,
+            'discarded': self.discarded,
+            'overhead_seconds': round(self.overhead, 3),
+        }
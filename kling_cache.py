@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Shared helpers for the on-disk cache kept next to state.json."""
+import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional
+
+CACHE_DIR = ".kling_cache"
+HASH_CHUNK = 1024 * 1024
+
+
+def cache_dir(*parts: str) -> Path:
+    path = Path(CACHE_DIR).joinpath(*parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def file_sha256(path) -> str:
+    """Streaming sha256 so large images/videos never sit in memory at once"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_json(path: Path, default=None):
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {} if default is None else default
+
+
+def atomic_write_json(path: Path, data: Dict):
+    """Write to a temp file then rename, so a crash never leaves a half-written index"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def dedupe_key(image_sha: str, prompt_norm: str) -> str:
+    """Identity of a render: image content + prompt with whitespace collapsed"""
+    prompt = " ".join(prompt_norm.split())
+    return hashlib.sha256(f"{image_sha}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+def link_or_copy(src: Path, dst: Path):
+    """Hardlink src to dst, copying when linking is not possible (other volume, FAT, ...)"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class HashIndex:
+    """sha256 per file, reused while (size, mtime) are unchanged"""
+    FILE = "hashes.json"
+
+    def __init__(self):
+        self.path = cache_dir() / self.FILE
+        self.entries = load_json(self.path)
+        self.dirty = False
+
+    def sha256(self, path: Path) -> str:
+        st = path.stat()
+        key = str(path.resolve())
+        entry = self.entries.get(key)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        sha = file_sha256(path)
+        self.entries[key] = [st.st_size, st.st_mtime_ns, sha]
+        self.dirty = True
+        return sha
+
+    def save(self):
+        if self.dirty:
+            atomic_write_json(self.path, self.entries)
+            self.dirty = False
+
+
+class ResultCache:
+    """dedupe_key -> an already-downloaded video with that image + prompt"""
+    FILE = "results.json"
+
+    def __init__(self):
+        self.path = cache_dir() / self.FILE
+        self.entries = load_json(self.path)
+
+    def lookup(self, key: str) -> Optional[Path]:
+        entry = self.entries.get(key)
+        if not entry:
+            return None
+        video = Path(entry['video'])
+        try:
+            if video.stat().st_size == entry['size']:
+                return video
+        except OSError:
+            pass
+        # Video was moved, deleted or rewritten - forget it
+        del self.entries[key]
+        return None
+
+    def record(self, key: str, video: Path):
+        video = video.resolve()
+        self.entries[key] = {'video': str(video), 'size': video.stat().st_size}
+
+    def save(self):
+        atomic_write_json(self.path, self.entries)
@@ -1,39 +1,123 @@
 #!/usr/bin/env python3
+import os
 import re
 import time
+import sqlite3
 import random
+import queue
 import threading
-import uuid
+from collections import deque
 from pathlib import Path
 from typing import List, Dict, Optional, Callable
 
 from playwright.sync_api import sync_playwright, TimeoutError as PWTimeoutError
 
+from job_planner import (
+    JobPlanner, list_images_sorted, read_prompts, normalize_prompt_text, plan_summary, format_duration
+)
+from image_preprocess import ImagePreprocessor
+from kling_cache import ResultCache, link_or_copy, file_sha256, atomic_write_json
+from video_integrity import VerifiedIndex, validate_mp4
+from job_scheduler import JobScheduler, FIFO
+from job_store import JobStore, Job, JobState, FINISHED
+from progress_model import ProgressTracker
+from slot_metrics import SlotMeter
+from session_monitor import SessionMonitor, EXPIRED, EXPIRING, HEALTHY
+from selector_registry import SelectorRegistry
+from session_recorder import Recorder
+from stage_profiler import StageProfiler
+from sampling_profiler import SamplingProfiler
+from job_tracer import JobTracer
+from folder_watcher import FolderWatcher
+from render_history import RunHistory, RenderPredictor, DOWNLOADED
+from post_process import PostProcessor
+from output_sinks import SinkWriter, build_sink
+from fleet_queue import FleetQueue, LeaseKeeper
+from feed_reconcile import FeedArticle, FeedReconciler, prompt_similarity, MIN_SCORE as PROMPT_MIN_SCORE
+from cancel_token import CancelToken, Cancelled
+from submit_backoff import SubmitBackoff, SubmitRefused, classify_status, classify_message
+from retry_policy import (
+    RetryTracker, JobFailure, classify_exception,
+    SELECTOR_MISSING, TIMEOUT, REJECTED, THROTTLED, DOWNLOAD_ERROR, SESSION_EXPIRED
+)
+
 
 class KlingEngine:
     BASE_URL = "https://higgsfield.ai/create/video"
     STATE_FILE = "state.json"
 
-    UPLOAD_AREA = r"#create-content > div.absolute.top-\[52px\].w-\[20rem\].left-4 > form > div.px-4.pb-6.shrink-0.overflow-y-auto.pt-4.hide-scrollbar.space-y-4.max-h-\[calc\(100vh-12rem\)\] > div.bg-neutral-surface-subtle.p-2.size-full.rounded-lg.w-full.select-none > label > div"
-    PROMPT_BOX = r"#prompt"
-    GENERATE_BTN = 'button:has-text("Generate")'
-    DOWNLOAD_BTN_TEMPLATE = r"#create-content > div.space-y-4.pb-8.md\:pb-0.feed-container > article:nth-child({idx}) > div.flex-1.h-full.gap-2.my-auto > div > div > div:nth-child(1) > button:nth-child(1)"
-    ARTICLE_PROMPT_SELECTOR_TEMPLATE = r"#create-content > div.space-y-4.pb-8.md\:pb-0.feed-container > article:nth-child({idx}) [data-sentry-component='ViewPromptInteractable']"
-    DELETE_IMG_BTN_XPATH = "/html/body/main/div/div[2]/div[1]/form/div[1]/div[1]/div/div[2]/button"
-
-    DOWNLOAD_POLL_TIMEOUT = 60 * 20
-
-    def __init__(self, root_folder: str, headless: bool = False, max_concurrent: int = 2, poll_interval: float = 10.0, selected_folders: Optional[List[str]] = None):
+    DOWNLOAD_VERIFY_ATTEMPTS = 3
+    DOWNLOAD_START_TIMEOUT = 90.0  # Seconds from the download click to the browser's download event
+    UPLOAD_REQUEST_PATTERN = re.compile(r"upload|presign|s3\.|storage|/media|/files?\b", re.IGNORECASE)
+    UPLOAD_CONFIRM_TIMEOUT = 20.0  # Seconds to wait for the upload request to finish
+    UPLOAD_QUIET_SECONDS = 0.5  # After the file's request, no upload request may start or run for this long
+    UPLOAD_CONFIRM_MISSES = 3  # Consecutive uploads without a recognised request before the overlay wait takes over
+    SUBMIT_REQUEST_PATTERN = re.compile(r"generat|/jobs?\b|/tasks?\b|/create", re.IGNORECASE)
+    SUBMIT_CONFIRM_TIMEOUT = 20.0  # Seconds for the new article to show up after Generate
+    DELETE_BUTTON_TIMEOUT = 2.0  # The staged image's delete button is already rendered when we get there
+    PREFETCH_PENDING = 50  # Plan more folders when fewer jobs than this are pending
+    MAX_RENDER_AGE = 1800  # A render still unfinished after this is resubmitted (within its retry budget)
+    SESSION_CHECK_INTERVAL = 60.0  # Cheap URL + cookie check
+    SESSION_REFRESH_INTERVAL = 900.0  # Re-save state.json while logged in
+    METRICS_INTERVAL = 5.0  # Seconds between dashboard updates (charts redraw from these, not per event)
+    RECONCILE_MAX_ARTICLES = 60  # Feed articles read by the startup reconcile scan
+    WATCH_DEBOUNCE = 5.0  # A watched folder must be quiet this long before it is planned
+    PROFILE_DIR = ".kling_profile"  # Under the root folder (hidden, so never planned as a folder)
+
+    def __init__(self, root_folder: str, headless: bool = False, max_concurrent: int = 2, poll_interval: float = 10.0, selected_folders: Optional[List[str]] = None, plan: Optional[Dict] = None, preprocess_max_side: int = 0, dedupe: bool = True, schedule_policy: str = FIFO, record_dir: Optional[str] = None, watch: bool = False, reconcile: bool = True, sinks: Optional[List[str]] = None, post_steps: Optional[List[str]] = None, fleet_queue: Optional[str] = None, worker_id: Optional[str] = None, state_file: Optional[str] = None):
         self.root_folder = Path(root_folder)
         self.headless = headless
         self.max_concurrent = max_concurrent
         self.poll_interval = poll_interval
         self.selected_folders = selected_folders  # List of folder names to process (None = all folders)
-
-        self.pause_event = threading.Event()
-        self.stop_event = threading.Event()
+        self.plan = plan  # Job plan from job_planner (None = build one when run() starts)
+        self.watch = watch  # Keep running and queue new/changed folders under root_folder as they appear
+        self.reconcile = reconcile  # Adopt renders already in the feed (from an interrupted run) before submitting
+        self.feed_inventory: List[FeedArticle] = []  # Unclaimed feed articles from the startup scan
+        self.watcher = None
+        self.watch_initial_folders = set()
+        self.preprocess_max_side = preprocess_max_side  # Downscale images before upload (0 = upload originals)
+        self.preprocessor = None
+        self.dedupe = dedupe  # Reuse videos already rendered for the same image content + prompt
+        self.result_cache = None
+        self.verified_index = VerifiedIndex()  # Outputs that passed MP4 validation
+        self.sink_specs = sinks or []  # Extra destinations for finished videos (output_sinks.build_sink specs)
+        self.sink_writer = None
+        self.post_steps = post_steps or []  # post_process steps run on finished videos/folders
+        self.post = None
+        if state_file:
+            self.STATE_FILE = state_file  # Fleet workers each keep their own session
+        self.fleet_queue_path = fleet_queue  # Shared fleet.sqlite: jobs are leased from it instead of planned here
+        self.worker_id = worker_id or f"w{os.getpid()}"
+        self.fleet = None
+        self.lease_keeper = None
+        self.fleet_leased: Dict[str, Job] = {}  # image -> leased job not reported back yet
+        self.history = None  # Per-job rows across runs (render_history.RunHistory)
+        self.predictor = RenderPredictor()  # Render time estimates: feed checks start near the predicted finish
+        self.checks_skipped = 0
+        self.retry = RetryTracker()  # Per-job failure budgets and dead-letter list
+        self.submit_backoff = SubmitBackoff()  # Holds all submissions back after throttling / rejections
+        self.scheduler = JobScheduler(schedule_policy)  # Pending jobs of all folders, best first
+        self.run_started_at = time.time()  # Base for per-job deadlines
+        self.progress = ProgressTracker(max_concurrent)  # Counts per state, throughput, ETA
+        self.slots = SlotMeter(max_concurrent)  # Slot occupancy, render/download times, chart history
+        self.metrics_emitted_at = 0.0
+
+        self.token = CancelToken()  # Every wait below goes through it: stop() lands within a fraction of a second
+        self.pause_event = self.token.pause_event
+        self.stop_event = self.token.stop_event
         self.save_session_event = threading.Event()
         self.save_session_result = None
+        self.session_monitor = None  # Created by launch_browser()
+        self.selectors = SelectorRegistry(log=self.log, sleep=lambda s: self.token.sleep(s, pausable=False))  # Fallback chains for every page element
+        self.upload_input = None  # Cached file input handle, re-resolved when detached
+        self.upload_confirm_by_network = True  # Falls back to the overlay wait if upload requests keep going unseen
+        self.upload_misses = 0  # Consecutive uploads confirmed by the overlay instead of the network
+        self.profiler = StageProfiler()  # Time spent per stage (upload, polling, matching, download, ...)
+        self.recorder = Recorder(record_dir, self.BASE_URL) if record_dir else None  # HAR + DOM snapshots for replay_harness.py
+        self.sampler = SamplingProfiler()  # Engine thread stacks, toggled with set_profiling()
+        self.tracer = JobTracer(self.root_folder / self.PROFILE_DIR, log=self.log)  # Playwright trace chunks per job
+        self.profiling_requests = queue.Queue()  # Applied on the browser thread (Playwright is not thread-safe)
 
         self.browser = None
         self.context = None
@@ -43,115 +127,431 @@ class KlingEngine:
         # Track videos generated in this session (to avoid downloading pre-existing ones)
         self.generated_in_session = set()  # Set of image paths that were queued in this session
 
+        self.store = JobStore()  # Every job of the current run (all batches)
+        self.planned_folders = deque()  # Folder plans already built (run plan, submitted batches): loaded right away
+        self.folder_sources = deque()  # Iterators of folder plans, loaded lazily into the store
+        self.incoming_batches = queue.Queue()  # Plans submitted while running (control API)
+        self.event_listeners: List[Callable] = []
+        self.listeners_lock = threading.Lock()
+
     def pause(self):
-        self.pause_event.set()
+        self.token.pause()
+        self.emit_event("paused")
 
     def resume(self):
-        self.pause_event.clear()
+        if self.session_monitor and self.session_monitor.state == EXPIRED:
+            self.session_monitor.reset()  # Re-check right away instead of trusting the old result
+        self.token.resume()
+        self.emit_event("resumed")
 
     def is_paused(self):
         return self.pause_event.is_set()
 
     def stop(self):
-        self.stop_event.set()
+        self.token.stop()
+        self.emit_event("stopping")
 
     def is_stopped(self):
         return self.stop_event.is_set()
 
     def wait_while_paused(self):
-        while self.pause_event.is_set() and not self.stop_event.is_set():
-            time.sleep(0.2)
+        """Block while paused (serving session saves); raises Cancelled on stop"""
+        self.token.wait_while_paused(tick=self._handle_save_session)
 
     def human_delay(self, a=0.6, b=1.4):
-        time.sleep(random.uniform(a, b))
+        self.token.sleep(random.uniform(a, b))
+
+    def wait_until(self, predicate: Callable, timeout: float, slice_ms: int = 200):
+        """Poll predicate() in short Playwright waits (which also deliver page events) until it
+        returns something truthy or timeout seconds pass (None). stop() interrupts within one slice."""
+        deadline = time.time() + timeout
+        while True:
+            result = predicate()
+            if result:
+                return result
+            if time.time() >= deadline:
+                return None
+            self.token.check()
+            self.page.wait_for_timeout(slice_ms)
 
     def log(self, level: str, message: str, callback: Optional[Callable] = None):
         if callback:
             callback(level, message)
         else:
             print(f"[{level}] {message}")
+        self.emit_event("log", level=level, message=message)
+
+    def add_event_listener(self, listener: Callable[[Dict], None]):
+        """listener(event) is called on the engine thread for every event; keep it cheap"""
+        with self.listeners_lock:
+            self.event_listeners.append(listener)
+
+    def remove_event_listener(self, listener: Callable[[Dict], None]):
+        with self.listeners_lock:
+            if listener in self.event_listeners:
+                self.event_listeners.remove(listener)
+
+    def emit_event(self, event_type: str, **data):
+        with self.listeners_lock:
+            listeners = list(self.event_listeners)
+        if not listeners:
+            return
+        event = {'type': event_type, 'time': time.time(), **data}
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception:
+                pass
+
+    def emit_job_event(self, q: Job, status: Optional[str] = None):
+        """Announce a job state change; status overrides q.status for transient states (downloading)"""
+        status = status or q.status
+        self.progress.set_status(q.id, status)
+        self.emit_event("job", job=self.job_label(q), folder=q.folder, status=status)
+
+    def report_progress(self, progress_callback):
+        done = self.store.count(JobState.DOWNLOADED)
+        progress_callback(done, len(self.store))
+        self.emit_event("progress", current=done, **self.progress.snapshot())
+        now = time.time()
+        if now - self.metrics_emitted_at >= self.METRICS_INTERVAL:
+            self.metrics_emitted_at = now
+            metrics = self.slots.snapshot()
+            if self.sink_writer:
+                metrics['sinks'] = self.sink_writer.report()
+            self.emit_event("metrics", **metrics)
+
+    def status_snapshot(self) -> Dict:
+        """Thread-safe-enough summary for status queries (reads only)"""
+        if self.is_stopped():
+            state = "stopped"
+        elif self.is_paused():
+            state = "paused"
+        elif self.page is None:
+            state = "starting"
+        else:
+            state = "running"
+        return {
+            'state': state,
+            'total': len(self.store),
+            'counts': self.store.status_counts(),
+            'folders_not_loaded': len(self.folder_sources) > 0,
+            'queued_batches': self.incoming_batches.qsize(),
+            'session': self.session_monitor.state if self.session_monitor else None,
+            'progress': self.progress.snapshot(),
+            'slots': self.slots.snapshot(series=False),
+            'dead_letter': self.retry.report_lines(),
+            'submit_backoff': self.submit_backoff.report(),
+            'sinks': self.sink_writer.report() if self.sink_writer else None,
+            'post': self.post.report() if self.post else None,
+            'fleet': {'worker': self.worker_id, 'leased': len(self.fleet_leased)} if self.fleet else None,
+            'profile': self.profiler.report(),
+            'profiling': {'sampler': self.sampler.report(), 'tracing': self.tracer.report()},
+        }
+
+    def submit_batch(self, root_folder: str, folders: Optional[List[str]] = None) -> Dict:
+        """Plan a batch (root + folder names) and hand it to the running engine; callable from any thread"""
+        planner = JobPlanner(root_folder, folders, self.max_concurrent, dedupe=self.dedupe)
+        plan = planner.build()
+        self.incoming_batches.put(plan)
+        self.emit_event("batch_submitted", root=root_folder, totals=plan['totals'])
+        return plan
 
     def list_images_sorted(self, dir_path: Path) -> List[Path]:
-        imgs = [p for p in dir_path.iterdir() if p.suffix.lower() in [".png", ".jpg", ".jpeg", ".webp"]]
-        def sort_key(p: Path):
-            m = re.match(r"^(\d+)$", p.stem)
-            if m:
-                return (0, int(m.group(1)))
-            m2 = re.match(r"^(\d+)[-_].*", p.stem)
-            if m2:
-                return (0, int(m2.group(1)))
-            return (1, p.name.lower())
-        return sorted(imgs, key=sort_key)
+        return list_images_sorted(dir_path)
 
     def read_prompts(self, dir_path: Path) -> List[str]:
-        txt = dir_path / "prompts.txt"
-        if not txt.exists():
-            raise FileNotFoundError(f"Không thấy {txt}")
-        lines = [ln.rstrip("\n") for ln in txt.read_text(encoding="utf-8").splitlines()]
-        return lines
+        return read_prompts(dir_path)
 
     def normalize_prompt_text(self, s: str) -> str:
-        if not s:
-            return ""
-        s = s.strip()
-        s = re.sub(r"^\s*\d+\s*[:.\\-]\s*", "", s)
-        return s.strip().lower()
+        return normalize_prompt_text(s)
+
+    def build_plan(self, log_callback: Optional[Callable] = None) -> Dict:
+        """Scan the selected folders offline and return a serializable job plan"""
+        planner = JobPlanner(str(self.root_folder), self.selected_folders, self.max_concurrent, dedupe=self.dedupe)
+        plan = planner.build()
+        for w in plan['warnings']:
+            self.log("WARNING", w, log_callback)
+        self.log("INFO", f"Kế hoạch: {plan_summary(plan)}", log_callback)
+        return plan
+
+    def start_preprocessing(self, folder_plan: Dict, log_callback):
+        """Kick off background downscaling for the pending images of a folder"""
+        if self.preprocess_max_side <= 0:
+            return
+        if self.preprocessor is None:
+            if not ImagePreprocessor.available():
+                self.log("WARNING", "Pillow chưa được cài đặt - tải ảnh gốc lên (pip install Pillow)", log_callback)
+                self.preprocess_max_side = 0
+                return
+            self.preprocessor = ImagePreprocessor(max_side=self.preprocess_max_side)
+            self.log("INFO", f"Pre-processing images in the background (max {self.preprocess_max_side}px)", log_callback)
+        pending_jobs = [j for j in folder_plan['jobs'] if not j['done'] and not j.get('reuse_from')]
+        pending = [Path(j['image']) for j in pending_jobs]
+        known_shas = {j['image']: j['image_sha'] for j in pending_jobs if j.get('image_sha')}
+        self.preprocessor.start(pending, known_shas)
+
+    def upload_source(self, img_path: Path) -> Path:
+        if self.preprocessor:
+            return self.preprocessor.get(img_path, check=self.token.check)
+        return img_path
+
+    def resolve_upload_input(self):
+        """File input handle, looked up once and reused while it is still in the page"""
+        if self.upload_input is not None:
+            try:
+                if self.upload_input.evaluate("el => el.isConnected"):
+                    return self.upload_input
+            except Exception:
+                pass  # Page navigated / element replaced
+            self.upload_input = None
+
+        inputs = self.selectors.find_all(self.page, 'upload_input')
+        for inp in inputs:
+            try:
+                if inp.is_visible():
+                    self.upload_input = inp
+                    return inp
+            except Exception:
+                continue
+        self.upload_input = inputs[0] if inputs else None
+        return self.upload_input
+
+    def is_upload_request(self, request) -> bool:
+        return (request.method in ("POST", "PUT")
+                and request.resource_type in ("xhr", "fetch")
+                and bool(self.UPLOAD_REQUEST_PATTERN.search(request.url)))
 
     def upload_image(self, img_path: Path, log_callback):
+        """Stage the image; returns once the page's upload request has finished"""
         self.log("INFO", f"Uploading: {img_path.name}", log_callback)
-        try:
-            inputs = self.page.query_selector_all("input[type=file]")
-        except Exception:
-            inputs = []
+        img_path = self.upload_source(img_path)
 
-        if inputs:
-            for inp in inputs:
-                try:
-                    if inp.is_visible():
-                        inp.set_input_files(str(img_path))
-                        self.human_delay(0.4, 1.0)
-                        return
-                except Exception:
-                    continue
+        for attempt in range(2):  # Second try with a fresh handle if the cached one went stale
+            inp = self.resolve_upload_input()
+            if inp is None:
+                break
             try:
-                inputs[0].set_input_files(str(img_path))
-                self.human_delay(0.4, 1.0)
+                if self.upload_confirm_by_network:
+                    self.set_files_and_confirm(inp, img_path, log_callback)
+                else:
+                    inp.set_input_files(str(img_path))
+                    self.wait_upload_overlay()
                 return
+            except JobFailure:
+                raise
             except Exception:
-                pass
+                self.upload_input = None
 
-        raise RuntimeError("Upload failed: could not find input[type=file]")
+        raise JobFailure(SELECTOR_MISSING, "Upload failed: could not find input[type=file]")
+
+    def carries_file(self, request, file_size: int) -> bool:
+        """The request whose body is the image itself (raw PUT, multipart form or a body at least the
+        file's size), as opposed to presign / finalize calls around it"""
+        if request.method == "PUT":
+            return True
+        try:
+            if "multipart/form-data" in (request.headers.get("content-type") or ""):
+                return True
+            return len(request.post_data_buffer or b"") >= file_size
+        except Exception:
+            return False
+
+    def set_files_and_confirm(self, inp, img_path: Path, log_callback):
+        """Set the file and wait until the request carrying it has finished and the upload requests
+        around it (presign, finalize) have gone quiet"""
+        file_size = img_path.stat().st_size
+        in_flight = set()
+        carried = []  # (request, failed) for the requests that carried the file
+        last_activity = [time.time()]
+
+        def on_request(request):
+            if self.is_upload_request(request):
+                in_flight.add(request)
+                last_activity[0] = time.time()
+
+        def on_request_done(request, failed=False):
+            if request in in_flight:
+                in_flight.discard(request)
+                last_activity[0] = time.time()
+                if self.carries_file(request, file_size):
+                    carried.append((request, failed))
+
+        def on_request_failed(request):
+            on_request_done(request, failed=True)
+
+        def upload_settled():
+            return (bool(carried) and not in_flight
+                    and time.time() - last_activity[0] >= self.UPLOAD_QUIET_SECONDS)
+
+        self.page.on("request", on_request)
+        self.page.on("requestfinished", on_request_done)
+        self.page.on("requestfailed", on_request_failed)
+        try:
+            inp.set_input_files(str(img_path))
+            settled = self.wait_until(upload_settled, self.UPLOAD_CONFIRM_TIMEOUT)
+        finally:
+            self.page.remove_listener("request", on_request)
+            self.page.remove_listener("requestfinished", on_request_done)
+            self.page.remove_listener("requestfailed", on_request_failed)
+        if not settled:
+            # No request we recognise carried the file: confirm this one by the overlay, and stop
+            # watching the network only once that keeps happening
+            self.upload_misses += 1
+            if self.upload_misses >= self.UPLOAD_CONFIRM_MISSES:
+                self.upload_confirm_by_network = False
+            self.log("DEBUG", f"No upload request seen ({self.upload_misses}/{self.UPLOAD_CONFIRM_MISSES}), "
+                              "falling back to the upload overlay wait", log_callback)
+            self.wait_upload_overlay()
+            return
+        self.upload_misses = 0
+        request, failed = carried[-1]  # The page may have retried: its last attempt is the one that counts
+        if failed:
+            raise JobFailure(REJECTED, f"Upload request failed: {request.failure or 'network error'}")
+        response = request.response()
+        if response is not None and not response.ok:
+            raise JobFailure(classify_status(response.status) or REJECTED,
+                             f"Upload request failed: HTTP {response.status}")
+
+    def wait_upload_overlay(self):
+        """Fallback readiness check: the processing overlay shows up and disappears again"""
+        overlay = self.selectors.best('upload_overlay')
+
+        def overlay_visible():
+            el = self.page.query_selector(overlay)
+            return el is not None and el.is_visible()
+        try:
+            if self.wait_until(overlay_visible, 3.0):
+                self.wait_until(lambda: self.page.query_selector(overlay) is None, 15.0)
+        except Exception:
+            pass
 
     def fill_prompt(self, prompt: str):
-        self.page.wait_for_selector(self.PROMPT_BOX, timeout=15000, state="visible")
-        self.page.fill(self.PROMPT_BOX, "")
+        box = self.selectors.find(self.page, 'prompt_box', timeout=15)
+        if not box:
+            raise JobFailure(SELECTOR_MISSING, "Prompt box not found")
+        box.fill("")
         self.human_delay(0.2, 0.6)
-        self.page.type(self.PROMPT_BOX, prompt, delay=random.randint(12, 30))
+        box.type(prompt, delay=random.randint(12, 30))
         self.human_delay(0.2, 0.6)
 
-    def click_generate(self):
-        self.page.wait_for_selector(self.GENERATE_BTN, timeout=15000, state="visible")
-        self.page.click(self.GENERATE_BTN)
-        self.human_delay(0.6, 1.4)
+    def click_generate(self, prompt: str):
+        """Click Generate and return once the new article is in the feed.
+        Raises SubmitRefused on a 429/4xx answer, an error or rate-limit notice, or no new article."""
+        btn = self.selectors.find(self.page, 'generate_button', timeout=15)
+        if not btn:
+            raise JobFailure(SELECTOR_MISSING, "Generate button not found")
+        feed_marked = self.mark_feed_top()
+        notices_before = self.notice_texts()
+        refusals = []
+
+        def on_response(response):
+            try:
+                failure_class = self.submit_response_failure(response)
+            except Exception:
+                return
+            if failure_class:
+                refusals.append((failure_class, f"HTTP {response.status} {response.request.method} {response.url[:80]}"))
+
+        self.page.on("response", on_response)
+        try:
+            btn.click()
+            self.confirm_submission(prompt, feed_marked, notices_before, refusals)
+        finally:
+            self.page.remove_listener("response", on_response)
+
+    def submit_response_failure(self, response) -> Optional[str]:
+        request = response.request
+        if request.resource_type not in ("xhr", "fetch"):
+            return None
+        if response.status == 429:
+            return THROTTLED  # Throttling, whichever endpoint says it
+        if request.method != "POST" or self.UPLOAD_REQUEST_PATTERN.search(request.url) \
+                or not self.SUBMIT_REQUEST_PATTERN.search(request.url):
+            return None
+        return classify_status(response.status)
+
+    def mark_feed_top(self) -> bool:
+        """Tag the newest article so the next one is recognised even with the same prompt; False for an empty feed"""
+        article = self.selectors.find(self.page, 'feed_article', visible=False, idx=1)
+        if not article:
+            return False
+        try:
+            article.evaluate("el => { el.dataset.klingSeen = '1' }")
+            return True
+        except Exception:
+            return False
+
+    def notice_texts(self) -> set:
+        texts = set()
+        for el in self.selectors.find_all(self.page, 'site_notices'):
+            try:
+                text = (el.text_content() or "").strip()
+            except Exception:
+                continue
+            if text:
+                texts.add(text)
+        return texts
+
+    def new_feed_article(self, prompt_norm: str, feed_marked: bool):
+        """The top article if it appeared since mark_feed_top() and carries our prompt"""
+        article = self.selectors.find(self.page, 'feed_article', visible=False, idx=1)
+        if not article:
+            return None
+        try:
+            if feed_marked and article.get_attribute("data-kling-seen") is not None:
+                return None
+            prompt_element = self.selectors.find(article, 'article_prompt', visible=False)
+            if prompt_element:
+                shown = normalize_prompt_text((prompt_element.text_content() or "").rstrip(".… "))
+                if shown and prompt_similarity(shown, prompt_norm) < PROMPT_MIN_SCORE:
+                    return None  # Someone else's render (another tab or device)
+        except Exception:
+            return None
+        return article
+
+    def confirm_submission(self, prompt: str, feed_marked: bool, notices_before: set, refusals: list):
+        prompt_norm = normalize_prompt_text(prompt)
+        deadline = time.time() + self.SUBMIT_CONFIRM_TIMEOUT
+        while True:
+            if refusals:
+                failure_class, detail = refusals[0]
+                raise SubmitRefused(failure_class, f"Submission refused: {detail}")
+            for text in self.notice_texts() - notices_before:
+                failure_class = classify_message(text)
+                if failure_class:
+                    raise SubmitRefused(failure_class, f"Site notice: {text[:120]}")
+            article = self.new_feed_article(prompt_norm, feed_marked)
+            if article is not None:
+                badge = self.selectors.find(article, 'article_status', visible=False)
+                text = (badge.text_content() or "").strip() if badge else ""
+                failure_class = classify_message(text) if text else None
+                if failure_class:
+                    raise SubmitRefused(failure_class, f"New article failed: {text[:80]}", article_added=True)
+                return
+            if time.time() >= deadline:
+                raise SubmitRefused(REJECTED, f"No new article {self.SUBMIT_CONFIRM_TIMEOUT:.0f}s after Generate")
+            self.token.check()
+            self.page.wait_for_timeout(250)  # Also delivers the response events
 
     def click_delete_uploaded_image(self):
         try:
-            el = self.page.wait_for_selector(f'xpath={self.DELETE_IMG_BTN_XPATH}', timeout=8000, state="visible")
-            el.click()
-            self.human_delay(0.4, 1.0)
+            el = self.selectors.find(self.page, 'delete_image_button', timeout=self.DELETE_BUTTON_TIMEOUT)
+            if el:
+                el.click()
+                self.human_delay(0.4, 1.0)
         except PWTimeoutError:
             pass
 
     def is_article_done(self, article_idx: int, log_callback=None) -> bool:
         """Check if article is done (no longer generating)"""
         try:
-            article_sel = f"article:nth-child({article_idx})"
-            article = self.page.query_selector(article_sel)
+            article = self.selectors.find(self.page, 'feed_article', visible=False, idx=article_idx)
             if not article:
                 return False
 
             # First check StatusBadge - if still generating, no need to hover
-            status_badge = article.query_selector("[data-sentry-component='StatusBadge']")
+            status_badge = self.selectors.find(article, 'article_status', visible=False)
             if status_badge:
                 txt = (status_badge.text_content() or "").strip().lower()
                 if "in queue" in txt or "in progress" in txt or "render" in txt or "generat" in txt or "queue" in txt or "progress" in txt:
@@ -160,16 +560,13 @@ class KlingEngine:
             # Hover to reveal the download button
             try:
                 article.hover(timeout=2000)
-                time.sleep(0.3)
+                self.token.sleep(0.3)
             except Exception:
                 pass
 
             # Check for download button - ONLY indicator of completion
-            download_btn = article.query_selector("button.button--fixed svg[viewBox='0 0 24 24']")
-            if download_btn:
-                parent_btn = download_btn.evaluate("el => el.closest('button')")
-                if parent_btn:
-                    return True
+            if self.selectors.find(article, 'article_download_button', visible=False):
+                return True
 
             # No download button = not ready yet
             return False
@@ -177,75 +574,103 @@ class KlingEngine:
             return False
 
     def count_active_generating(self, log_callback, max_articles=24) -> int:
+        """Rendering articles in the feed; may exceed max_concurrent (oversubscription is reported, not hidden)"""
         count = 0
-        try:
-            all_articles = self.page.query_selector_all("article")
-        except Exception:
-            all_articles = []
+        all_articles = self.selectors.find_all(self.page, 'feed_articles')
 
-        for idx, article in enumerate(all_articles[:max_articles], start=1):
+        for article in all_articles[:max_articles]:
             try:
-                status_badge = article.query_selector("[data-sentry-component='StatusBadge']")
-                if status_badge:
-                    txt = (status_badge.text_content() or "").strip().lower()
-                    if txt and ("in queue" in txt or "in progress" in txt or "render" in txt or "generat" in txt or "queue" in txt or "progress" in txt):
-                        count += 1
-                        continue
-
-                rendering_badge = article.query_selector("div.rounded-lg.absolute.inset-0.size-full.flex.flex-col.items-center.justify-center")
-                if rendering_badge and rendering_badge.is_visible():
+                if self.article_is_rendering(article):
                     count += 1
-                    continue
             except Exception:
                 continue
 
-        return min(count, self.max_concurrent)
+        return count
 
-    def find_download_buttons(self, max_articles=36):
-        found = []
-        for i in range(1, max_articles+1):
-            sel = self.DOWNLOAD_BTN_TEMPLATE.format(idx=i)
+    def article_is_rendering(self, article) -> bool:
+        status_badge = self.selectors.find(article, 'article_status', visible=False)
+        if status_badge:
+            txt = (status_badge.text_content() or "").strip().lower()
+            if txt and ("queue" in txt or "progress" in txt or "render" in txt or "generat" in txt):
+                return True
+        return self.selectors.find(article, 'article_rendering') is not None
+
+    def scan_feed(self, log_callback) -> List[FeedArticle]:
+        """Prompt and render state of the newest feed articles (one pass, no hovering)"""
+        articles = []
+        for idx, article in enumerate(self.selectors.find_all(self.page, 'feed_articles')[:self.RECONCILE_MAX_ARTICLES], start=1):
             try:
-                el = self.page.query_selector(sel)
-                if el and el.is_visible():
-                    found.append(i)
+                prompt_element = self.selectors.find(article, 'article_prompt', visible=False)
+                if not prompt_element:
+                    continue
+                articles.append(FeedArticle(idx, prompt_element.text_content() or "", self.article_is_rendering(article)))
             except Exception:
                 continue
+        return articles
+
+    def reconcile_feed(self, log_callback) -> int:
+        """Hand pending jobs whose render is already in the feed to the normal download path.
+        Matched jobs become 'generating' at the article's position, so they are downloaded
+        (finished) or waited for (still rendering) instead of being submitted again."""
+        if not self.feed_inventory:
+            return 0
+        reconciler = FeedReconciler()
+        adopted = 0
+        for article, q, score in reconciler.match(self.feed_inventory, self.store):
+            self.feed_inventory.remove(article)
+            if not article.rendering and not self.is_article_done(article.position, log_callback):
+                continue  # Failed or cancelled render: nothing to download
+            self.store.set_state(q, JobState.GENERATING)
+            q.article_position = article.position
+            q.queued_timestamp = time.time()
+            self.emit_job_event(q)
+            adopted += 1
+            state = "đang render" if article.rendering else "đã xong"
+            self.log("INFO", f"Reconcile: {self.job_label(q)} ← bài #{article.position} ({state}, độ khớp {score:.2f})", log_callback)
+        if reconciler.ambiguous:
+            self.log("INFO", f"Reconcile: bỏ qua {reconciler.ambiguous} bài trùng prompt với ảnh khác", log_callback)
+        return adopted
+
+    def find_download_buttons(self, max_articles=36):
+        found = []
+        for i in range(1, max_articles+1):
+            if self.selectors.find(self.page, 'feed_download_button', idx=i):
+                found.append(i)
         return found
 
-    def fuzzy_match_prompt(self, prompt_norm: str, queued: List[Dict]) -> Optional[int]:
+    def fuzzy_match_prompt(self, prompt_norm: str, queued: List[Job]) -> Optional[int]:
         if not prompt_norm:
             return None
         for i, q in enumerate(queued):
-            if q['downloaded']:
+            if q.downloaded:
                 continue
-            if q['prompt_norm'] == prompt_norm:
+            if q.prompt_norm == prompt_norm:
                 return i
         for i, q in enumerate(queued):
-            if q['downloaded']:
+            if q.downloaded:
                 continue
-            a = q['prompt_norm']
+            a = q.prompt_norm
             if prompt_norm.startswith(a[:40]) or a.startswith(prompt_norm[:40]):
                 return i
         for i, q in enumerate(queued):
-            if q['downloaded']:
+            if q.downloaded:
                 continue
-            if prompt_norm in q['prompt_norm'] or q['prompt_norm'] in prompt_norm:
+            if prompt_norm in q.prompt_norm or q.prompt_norm in prompt_norm:
                 return i
         pshort = prompt_norm[:20]
         for i, q in enumerate(queued):
-            if q['downloaded']:
+            if q.downloaded:
                 continue
-            if q['prompt_norm'].startswith(pshort) or pshort in q['prompt_norm']:
+            if q.prompt_norm.startswith(pshort) or pshort in q.prompt_norm:
                 return i
         return None
 
-    def download_video_by_position(self, article_position: int, queued: List[Dict], log_callback) -> bool:
+    def download_video_by_position(self, article_position: int, log_callback) -> bool:
         """Download video by matching article position with queued item"""
         # Find queued item with matching article_position
         matched_q = None
-        for q in queued:
-            if q.get('article_position') == article_position and q['status'] == 'generating' and not q['downloaded']:
+        for q in self.store.by_state[JobState.GENERATING]:
+            if q.article_position == article_position:
                 matched_q = q
                 break
 
@@ -253,28 +678,65 @@ class KlingEngine:
             return False
 
         # Check if article is done
-        if not self.is_article_done(article_position, log_callback):
+        with self.profiler.stage("poll_article"):
+            done = self.is_article_done(article_position, log_callback)
+        if not done:
+            return False
+
+        # Verify prompt matches before downloading
+        with self.profiler.stage("match_prompt"):
+            verified = self.verify_article_prompt(matched_q, article_position, log_callback)
+        if not verified:
             return False
 
-        # Check timestamp (safety: only download videos queued < 30 min ago)
-        if matched_q.get('queued_timestamp'):
-            elapsed = time.time() - matched_q['queued_timestamp']
-            if elapsed > 1800:  # 30 minutes
-                self.log("WARNING", f"Video too old (queued {elapsed/60:.1f} min ago), skipping", log_callback)
+        target = matched_q.img_path.with_suffix('.mp4')
+        download_started = time.time()
+        for attempt in range(1, self.DOWNLOAD_VERIFY_ATTEMPTS + 1):
+            try:
+                suffix = f" (attempt {attempt}/{self.DOWNLOAD_VERIFY_ATTEMPTS})" if attempt > 1 else ""
+                self.log("INFO", f"Downloading: {target.name}{suffix}", log_callback)
+                with self.profiler.stage("download"), self.tracer.span(self.job_label(matched_q), "download"):
+                    ok, reason = self.fetch_download(matched_q, article_position, target)
+            except Exception as ex:
+                self.log("WARNING", f"Download failed: {ex}", log_callback)
+                self.emit_job_event(matched_q)
+                self.record_job_failure(matched_q, DOWNLOAD_ERROR, str(ex), log_callback)
                 return False
 
-        # Verify prompt matches before downloading
-        article_sel = f"article:nth-child({article_position})"
-        article = self.page.query_selector(article_sel)
+            if ok:
+                self.store.set_state(matched_q, JobState.DOWNLOADED)
+                matched_q.finished_at = time.time()
+                self.slots.job_finished(download_started - matched_q.queued_timestamp if matched_q.queued_timestamp else None,
+                                        matched_q.finished_at - download_started)
+                self.emit_job_event(matched_q)
+                self.log("SUCCESS", f"✓ {target.name}", log_callback)
+                if matched_q.submitted_at:
+                    self.record_history(matched_q, DOWNLOADED, download_started - matched_q.submitted_at)
+                self.deliver(target)
+                self.on_video_downloaded(matched_q, target, log_callback)
+                self.human_delay(0.8, 1.8)
+                return True
+
+            self.log("WARNING", f"{target.name} failed verification ({reason}), re-downloading...", log_callback)
+            self.emit_job_event(matched_q)
+            self.human_delay(0.8, 1.8)
+
+        self.log("ERROR", f"{target.name}: download failed verification {self.DOWNLOAD_VERIFY_ATTEMPTS} times", log_callback)
+        self.record_job_failure(matched_q, DOWNLOAD_ERROR, f"verification failed: {reason}", log_callback)
+        return False
+
+    def verify_article_prompt(self, matched_q: Job, article_position: int, log_callback) -> bool:
+        """The article at this feed position shows the job's prompt"""
+        article = self.selectors.find(self.page, 'feed_article', visible=False, idx=article_position)
         if not article:
             return False
 
         try:
             # Extract prompt from article
-            prompt_element = article.query_selector("[data-sentry-component='ViewPromptInteractable']")
+            prompt_element = self.selectors.find(article, 'article_prompt', visible=False)
             if prompt_element:
                 article_prompt = prompt_element.text_content().strip().lower()
-                expected_prompt = matched_q['prompt_norm'].lower()
+                expected_prompt = matched_q.prompt_norm.lower()
 
                 # Flexible matching: check if one contains the other (at least first 50 chars)
                 expected_short = expected_prompt[:50] if len(expected_prompt) > 50 else expected_prompt
@@ -286,215 +748,750 @@ class KlingEngine:
                     self.log("INFO", f"  Got: {article_prompt[:80]}...", log_callback)
                     return False
 
-                self.log("INFO", f"✓ Prompt verified for {matched_q['img_path'].name}", log_callback)
+                self.log("INFO", f"✓ Prompt verified for {matched_q.img_path.name}", log_callback)
             else:
                 self.log("WARNING", f"Cannot find prompt element at position {article_position}, skipping", log_callback)
                 return False
         except Exception as e:
             self.log("WARNING", f"Prompt verification failed: {e}", log_callback)
             return False
+        return True
+
+    def fetch_download(self, q: Job, article_position: int, target: Path) -> tuple[bool, str]:
+        """Click the article's download button and save the file through verification"""
+        download_btn = self.find_article_download_button(article_position)
+        if not download_btn:
+            raise Exception("Download button not found")
+
+        self.emit_job_event(q, status='downloading')
+        downloads = []
+
+        def on_download(download):
+            downloads.append(download)
 
-        # Hover on article to reveal download button
+        self.page.on("download", on_download)
         try:
-            article.hover(timeout=3000)
-            time.sleep(0.5)
-        except Exception:
-            pass
+            download_btn.click()
+            download = self.wait_until(lambda: downloads[0] if downloads else None, self.DOWNLOAD_START_TIMEOUT)
+        finally:
+            self.page.remove_listener("download", on_download)
+        if download is None:
+            raise Exception(f"Download did not start within {self.DOWNLOAD_START_TIMEOUT:.0f}s")
+        return self.save_verified_download(download, target)
+
+    def find_article_download_button(self, article_position: int):
+        """Hover the article to reveal its download button and return the button handle"""
+        article = self.selectors.find(self.page, 'feed_article', visible=False, idx=article_position)
+        if article:
+            try:
+                article.hover(timeout=3000)
+                self.token.sleep(0.5)
+            except Exception:
+                pass
 
-        # Find and click download button
+        download_btn = None
+        article = self.selectors.find(self.page, 'feed_article', visible=False, idx=article_position)
+        if article:
+            download_btn = self.selectors.find(article, 'article_download_button', visible=False)
+
+        if not download_btn:
+            download_btn = self.selectors.find(self.page, 'feed_download_button', visible=False, idx=article_position)
+        return download_btn
+
+    def save_verified_download(self, dl, target: Path) -> tuple[bool, str]:
+        """Save to a temp file, validate size/hash/MP4 boxes, then atomically move into place"""
+        part = target.with_name(target.name + ".part")
         try:
-            self.log("INFO", f"Downloading: {matched_q['img_path'].stem}.mp4", log_callback)
-
-            download_btn = None
-            article = self.page.query_selector(article_sel)
-            if article:
-                download_btn = article.query_selector("button.button--fixed svg[viewBox='0 0 24 24']")
-                if download_btn:
-                    download_btn = download_btn.evaluate_handle("el => el.closest('button')").as_element()
-
-            if not download_btn:
-                sel = self.DOWNLOAD_BTN_TEMPLATE.format(idx=article_position)
-                download_btn = self.page.query_selector(sel)
-
-            if not download_btn:
-                raise Exception("Download button not found")
-
-            with self.page.expect_download(timeout=90_000) as dl_info:
-                download_btn.click()
-            dl = dl_info.value
-            target = matched_q['img_path'].with_suffix('.mp4')
-            dl.save_as(str(target))
-            matched_q['downloaded'] = True
-            matched_q['status'] = 'downloaded'
-            self.log("SUCCESS", f"✓ {target.name}", log_callback)
-            self.human_delay(0.8, 1.8)
-            return True
-        except Exception as ex:
-            self.log("WARNING", f"Download failed: {ex}", log_callback)
+            dl.save_as(str(part))
+            failure = dl.failure()
+            if failure:
+                return False, failure
+            ok, reason = validate_mp4(part)
+            if not ok:
+                return False, reason
+            sha = file_sha256(part)
+            os.replace(part, target)
+            self.verified_index.add(target, sha)
+            self.verified_index.save()
+            return True, sha
+        finally:
+            part.unlink(missing_ok=True)
+
+    def reuse_result(self, q: Job, source: Path, log_callback) -> bool:
+        """Fill q's output from an identical, already-downloaded render"""
+        target = q.img_path.with_suffix('.mp4')
+        try:
+            if source.resolve() != target.resolve():
+                link_or_copy(source, target)
+            ok, reason = self.verified_index.check(target)
+            if not ok:
+                target.unlink(missing_ok=True)
+                raise OSError(f"cached video failed verification ({reason})")
+            self.verified_index.save()
+        except OSError as e:
+            self.log("WARNING", f"Cannot reuse {source.name} for {target.name}: {e}", log_callback)
+            return False
+        self.store.set_state(q, JobState.DOWNLOADED)
+        q.finished_at = time.time()
+        self.emit_job_event(q)
+        self.log("SUCCESS", f"♻ {target.name} (reused {source.parent.name}/{source.name})", log_callback)
+        self.deliver(target)
+        return True
+
+    def start_sinks(self, log_callback):
+        self.sink_writer = None
+        sinks = []
+        for spec in self.sink_specs:
+            try:
+                sinks.append(build_sink(spec))
+            except (ValueError, RuntimeError) as e:
+                self.log("ERROR", f"Output sink bỏ qua: {e}", log_callback)
+        if sinks:
+            self.sink_writer = SinkWriter(sinks, log=self.log)
+            self.log("INFO", f"Video sẽ được sao chép tới: {', '.join(s.name for s in sinks)}", log_callback)
+
+    def deliver(self, target: Path):
+        """Queue a finished video for the output sinks and post-processing (both off this thread)"""
+        if self.sink_writer:
+            self.sink_writer.submit(target, f"{target.parent.name}/{target.name}")
+        if self.post:
+            self.post.video_done(target)
+
+    def start_post(self, log_callback):
+        self.post = None
+        if not self.post_steps:
+            return
+        try:
+            self.post = PostProcessor(self.post_steps, log=lambda level, msg: self.log(level, msg, log_callback))
+        except ValueError as e:
+            self.log("ERROR", str(e), log_callback)
+            return
+        if self.post.steps:
+            self.log("INFO", f"Hậu xử lý: {', '.join(self.post.steps)}", log_callback)
+
+    def post_folder(self, jobs: List[Job]):
+        if not self.post or self.fleet:
+            return  # Fleet workers hold only part of a folder; sync_fleet() posts it once it is done fleet-wide
+        items = [{'video': str(q.img_path.with_suffix('.mp4')), 'image': q.img_path.name, 'prompt': q.prompt_raw}
+                 for q in jobs if q.downloaded]
+        self.post.folder_done(Path(jobs[0].folder_path), items)
+
+    def finish_post(self, log_callback):
+        if not self.post:
+            return
+        pending = self.post.report()['pending']
+        if pending:
+            self.log("INFO", f"Đang chờ {pending} tác vụ hậu xử lý...", log_callback)
+        self.post.shutdown(wait=not self.is_stopped())
+        for line in self.post.summary_lines():
+            self.log("INFO", f"Post-process {line}", log_callback)
+
+    def finish_sinks(self, log_callback):
+        """Wait for queued deliveries (not after a stop: those are dropped and listed) and log per-sink throughput"""
+        if not self.sink_writer:
+            return
+        stopped = self.is_stopped()
+        queued = self.sink_writer.report()['queued']
+        if queued and not stopped:
+            self.log("INFO", f"Đang chờ sao chép {queued} video còn lại...", log_callback)
+        self.sink_writer.close(wait=not stopped)
+        for line in self.sink_writer.summary_lines():
+            self.log("INFO", f"Sink {line}", log_callback)
+        for failed in self.sink_writer.failed:
+            self.log("WARNING", f"Not delivered: {failed}", log_callback)
+        for dropped in self.sink_writer.dropped:
+            self.log("WARNING", f"Not delivered (stopped): {dropped}", log_callback)
+        unfinished = self.sink_writer.report()['queued']
+        if unfinished:
+            self.log("WARNING", f"Stopped during {unfinished} deliveries; they may be incomplete", log_callback)
+
+    def on_video_downloaded(self, q: Job, target: Path, log_callback):
+        """Remember the result and fill pending duplicates of the same (image, prompt)"""
+        key = q.dedupe_key
+        if not key or self.result_cache is None:
+            return
+        try:
+            self.result_cache.record(key, target)
+            self.result_cache.save()
+        except OSError as e:
+            self.log("WARNING", f"Result cache update failed: {e}", log_callback)
+            return
+        for other in self.store.duplicates(q):
+            if other.state == JobState.PENDING:
+                self.reuse_result(other, target, log_callback)
+
+    def job_label(self, q: Job) -> str:
+        img_path = q.img_path
+        return f"{img_path.parent.name}/{img_path.name}"
+
+    def image_bytes(self, q: Job) -> int:
+        try:
+            return os.path.getsize(q.image)
+        except OSError:
+            return 0
+
+    def schedule_first_check(self, q: Job, log_callback):
+        """Leave a new render alone until the history says it could be done (its p10 render time)"""
+        estimate = self.predictor.estimate(len(q.prompt_raw), self.image_bytes(q))
+        if estimate is None:
+            q.check_after = 0.0
+            return
+        early, typical, late = estimate
+        q.check_after = q.submitted_at + early
+        self.log("DEBUG", f"{self.job_label(q)}: dự kiến xong sau {format_duration(typical)} "
+                          f"(sớm nhất {format_duration(early)}, muộn {format_duration(late)})", log_callback)
+
+    def record_history(self, q: Job, outcome: str, render_seconds: Optional[float] = None):
+        """One history row per finished/failed attempt; successful renders also train the predictor"""
+        if not self.history:
+            return
+        prompt_len, image_bytes = len(q.prompt_raw), self.image_bytes(q)
+        queue_wait = q.submitted_at - q.loaded_at if q.submitted_at and q.loaded_at else None
+        try:
+            self.history.record(q.folder, q.img_path.name, prompt_len, image_bytes, queue_wait, render_seconds, outcome)
+        except sqlite3.Error as e:
+            self.log("WARNING", f"Run history write failed: {e}")
+        if outcome == DOWNLOADED and render_seconds:
+            self.predictor.add(prompt_len, image_bytes, render_seconds)
+            self.progress.render_seconds = self.predictor.typical() or self.progress.render_seconds
+
+    def open_history(self, log_callback):
+        try:
+            self.history = RunHistory()
+            self.predictor = RenderPredictor(self.history.render_samples())
+        except sqlite3.Error as e:
+            self.log("WARNING", f"Run history unavailable: {e}", log_callback)
+            self.history = None
+            return
+        typical = self.predictor.typical()
+        if typical:
+            self.progress.render_seconds = typical
+            self.log("INFO", f"Lịch sử: {len(self.predictor)} video, render trung bình {format_duration(typical)}", log_callback)
+
+    def record_job_failure(self, q: Job, failure_class: str, detail: str, log_callback):
+        """Spend one retry of q's budget for this failure class, or dead-letter it"""
+        if q.submitted_at:
+            self.record_history(q, failure_class)
+        delay = self.retry.record_failure(q.id, failure_class, self.job_label(q), detail)
+        if delay is None:
+            self.store.set_state(q, JobState.FAILED)
+            self.emit_job_event(q)
+            self.log("ERROR", f"{self.job_label(q)}: giving up ({failure_class}: {detail})", log_callback)
+        else:
+            q.retry_at = time.time() + delay
+            self.log("WARNING", f"{self.job_label(q)}: {failure_class}, retry in {delay:.0f}s", log_callback)
+
+    def is_waiting_retry(self, q: Job) -> bool:
+        return q.retry_at > time.time()
+
+    def session_expired(self) -> bool:
+        """Immediate logout check (login redirect or auth cookies gone)"""
+        if not self.session_monitor:
+            return False
+        try:
+            return self.session_monitor.probe()[0] == EXPIRED
+        except Exception:
             return False
 
-    def check_and_download_done_videos(self, queued: List[Dict], log_callback) -> int:
+    def check_session(self, log_callback, force: bool = False) -> bool:
+        """Scheduled session check (browser thread). Pauses submissions when the session has expired.
+        Returns False while the session is known to be expired."""
+        monitor = self.session_monitor
+        if not monitor:
+            return True
+        try:
+            changed = monitor.check(force=force)
+        except Exception as e:
+            self.log("DEBUG", f"Session check failed: {e}", log_callback)
+            return True
+        if changed == EXPIRED:
+            self.log("ERROR", f"Phiên đăng nhập đã hết hạn ({monitor.reason})! Đã tạm dừng - hãy đăng nhập lại rồi nhấn 'Tiếp tục'.", log_callback)
+            self.emit_event("session_expired", reason=monitor.reason)
+            self.pause()
+        elif changed == EXPIRING:
+            self.log("WARNING", f"Phiên đăng nhập sắp hết hạn: {monitor.reason}", log_callback)
+            self.emit_event("session_expiring", reason=monitor.reason)
+        elif changed == HEALTHY:
+            self.emit_event("session_ok")
+        return monitor.state != EXPIRED
+
+    def check_and_download_done_videos(self, log_callback) -> int:
         """Check all generating videos and download those that are done"""
         downloaded_count = 0
-        for q in queued:
-            if q['status'] == 'generating' and not q['downloaded'] and q.get('article_position'):
-                if self.download_video_by_position(q['article_position'], queued, log_callback):
-                    downloaded_count += 1
-        return downloaded_count
+        for q in self.store.in_state(JobState.GENERATING):
+            if q.state != JobState.GENERATING or not q.article_position:
+                continue  # Changed while iterating (e.g. filled as a duplicate)
+            if self.is_waiting_retry(q):
+                continue
 
-    def process_subfolder(self, sub_dir: Path, log_callback, progress_callback):
-        self.log("INFO", f"Processing folder: {sub_dir.name}", log_callback)
-        images = self.list_images_sorted(sub_dir)
+            # Safety: never download a render queued too long ago - it may be someone else's article by now
+            elapsed = self.token.active_since(q.queued_timestamp)  # Time paused does not count
+            if elapsed > self.MAX_RENDER_AGE:
+                self.log("WARNING", f"{q.img_path.name}: render not done after {elapsed/60:.1f} min", log_callback)
+                self.record_job_failure(q, TIMEOUT, f"render exceeded {self.MAX_RENDER_AGE // 60} min", log_callback)
+                if q.state != JobState.FAILED:
+                    # Resubmit; the stale article stays in the feed and keeps other jobs' positions valid
+                    self.store.set_state(q, JobState.PENDING)
+                    q.article_position = None
+                    self.scheduler.push(q)
+                    self.emit_job_event(q)
+                continue
 
-        try:
-            prompts = self.read_prompts(sub_dir)
-        except FileNotFoundError as e:
-            self.log("WARNING", f"Skip folder: {e}", log_callback)
-            return
+            if time.time() < q.check_after:
+                self.checks_skipped += 1  # Cannot be done yet by the render history
+                continue
 
-        if len(prompts) < len(images):
-            self.log("WARNING", f"prompts.txt has fewer lines ({len(prompts)}) than images ({len(images)}). Processing first {len(prompts)} images.", log_callback)
-            images = images[:len(prompts)]
-
-        # Build prompt map using number-based mapping (from auto_video_with_slots.py logic)
-        prompt_map = {}
-        for idx, prompt in enumerate(prompts):
-            # Extract number from prompt (e.g., "1: text" -> 1)
-            m = re.match(r"^\s*(\d+)\s*[:.–—-]\s*", prompt)
-            if m:
-                num = int(m.group(1))
-                prompt_map[num] = prompt
-            else:
-                prompt_map[idx + 1] = prompt
+            if self.download_video_by_position(q.article_position, log_callback):
+                downloaded_count += 1
+        return downloaded_count
 
+    def submit_job(self, q: Job, log_callback):
+        """Upload the image, type the prompt and click Generate for one job"""
+        with self.profiler.stage("upload"):
+            self.upload_image(q.img_path, log_callback)
+        with self.profiler.stage("prompt"):
+            self.fill_prompt(q.prompt_raw)
+        with self.profiler.stage("generate"):
+            self.click_generate(q.prompt_raw)
+            self.human_delay(0.6, 1.4)
+        with self.profiler.stage("delete_image"):
+            self.click_delete_uploaded_image()
+
+    def make_jobs(self, folder_plan: Dict, log_callback) -> List[Job]:
+        """Turn a folder plan into job records in the store (reusing cached results where possible).
+        Images already in the store are skipped, so a folder can be planned again when it changes;
+        only a job still pending picks up an edited prompt."""
         queued = []
-        for img in images:
-            # Extract number from filename
-            m = re.match(r"^(\d+)", img.stem)
-            if not m:
-                self.log("WARNING", f"Cannot extract number from {img.name}, skipping...", log_callback)
+        new_plans = []
+        folder_path = folder_plan['path']
+        for job in folder_plan['jobs']:
+            existing = self.store.by_image.get(job['image'])
+            if existing:
+                if existing.state == JobState.PENDING and existing.prompt_raw != job['prompt_raw']:
+                    self.store.update_prompt(existing, job['prompt_raw'], job.get('dedupe_key'))
+                    self.log("INFO", f"Prompt updated: {self.job_label(existing)}", log_callback)
                 continue
-
-            img_num = int(m.group(1))
-            raw = prompt_map.get(img_num)
-            if raw is None:
-                self.log("WARNING", f"No prompt found for image number {img_num} ({img.name}), skipping...", log_callback)
+            new_plans.append(job)
+            deadline_minutes = job.get('deadline_minutes')
+            queued.append(self.store.new_job(
+                image=job['image'],
+                folder=folder_plan['name'],
+                folder_path=folder_path,
+                prompt_raw=job['prompt_raw'],
+                state=JobState.DOWNLOADED if job['done'] else JobState.PENDING,
+                dedupe_key=job.get('dedupe_key'),
+                folder_priority=folder_plan.get('priority', 0),
+                priority=job.get('priority', 0),
+                deadline=self.run_started_at + deadline_minutes * 60 if deadline_minutes is not None else None,
+            ))
+
+        for q, job in zip(queued, new_plans):
+            if not q.downloaded and job.get('reuse_from'):
+                self.reuse_result(q, Path(job['reuse_from']), log_callback)
+        return queued
+
+    def load_folder(self, folder_plan: Dict, log_callback) -> List[Job]:
+        for w in folder_plan['warnings']:
+            self.log("WARNING", f"[{folder_plan['name']}] {w}", log_callback)
+        if folder_plan['skipped']:
+            return []
+        self.start_preprocessing(folder_plan, log_callback)
+        return self.make_jobs(folder_plan, log_callback)
+
+    def load_more_jobs(self, log_callback) -> List[Job]:
+        """Load every folder plan that is already built (so totals and folder priorities cover the
+        whole batch), then pull unplanned folders from the sources until enough jobs are pending,
+        so huge roots are never planned (and held in memory) all at once"""
+        new_jobs = []
+        while self.planned_folders:
+            new_jobs.extend(self.load_folder(self.planned_folders.popleft(), log_callback))
+        low_water = max(self.PREFETCH_PENDING, 10 * self.max_concurrent)
+        while self.folder_sources and self.store.count(JobState.PENDING) < low_water:
+            folder_plan = next(self.folder_sources[0], None)
+            if folder_plan is None:
+                self.folder_sources.popleft()
+                continue
+            new_jobs.extend(self.load_folder(folder_plan, log_callback))
+        if self.fleet:
+            # Lease only what the slots can take next: whatever sits pending here is work other workers cannot do
+            new_jobs.extend(self.lease_fleet_jobs(self.max_concurrent - self.store.count(JobState.PENDING), log_callback))
+        return new_jobs
+
+    def start_fleet(self, log_callback):
+        self.fleet = FleetQueue(self.fleet_queue_path)
+        self.fleet.register(self.worker_id)
+        self.fleet_leased = {}
+        self.token.check()  # browser start-up can be slow: count liveness from here
+        self.lease_keeper = LeaseKeeper(self.fleet_queue_path, self.worker_id, self.fleet_stats,
+                                        seen_at=lambda: self.token.seen_at,
+                                        log=lambda level, msg: self.log(level, msg, log_callback))
+        self.lease_keeper.start()
+        self.log("INFO", f"Fleet worker {self.worker_id}: {self.fleet.unfinished()} jobs open in the shared queue", log_callback)
+
+    def fleet_stats(self) -> Dict:
+        """Heartbeat thread: a small read-only summary for the fleet view"""
+        return {
+            'counts': self.store.status_counts(),
+            'active': self.slots.last_active,
+            'max_concurrent': self.max_concurrent,
+            'paused': self.is_paused(),
+            'session': self.session_monitor.state if self.session_monitor else None,
+            'backoff': round(self.submit_backoff.remaining()),
+        }
+
+    def lease_fleet_jobs(self, wanted: int, log_callback) -> List[Job]:
+        """Lease up to wanted jobs from the shared queue and load them like folder plans"""
+        leased = self.fleet.lease(self.worker_id, wanted)
+        folders: Dict[str, Dict] = {}
+        for job in leased:
+            folder = folders.get(job['folder_path'])
+            if folder is None:
+                folder = folders[job['folder_path']] = {
+                    'name': job['folder'], 'path': job['folder_path'], 'priority': job['folder_priority'],
+                    'skipped': False, 'warnings': [], 'jobs': [],
+                }
+            folder['jobs'].append(job)
+        new_jobs = []
+        for folder_plan in folders.values():
+            self.start_preprocessing(folder_plan, log_callback)
+            new_jobs.extend(self.make_jobs(folder_plan, log_callback))
+        for job in leased:
+            # A job leased again after its lease lapsed is already in the store: report it back all the same
+            self.fleet_leased[job['image']] = self.store.by_image[job['image']]
+        return new_jobs
+
+    def sync_fleet(self, log_callback):
+        """Report finished leased jobs; whoever closes a folder fleet-wide post-processes it"""
+        for image, q in list(self.fleet_leased.items()):
+            if q.state not in FINISHED:
                 continue
+            del self.fleet_leased[image]
+            video = str(q.img_path.with_suffix('.mp4')) if q.downloaded else None
+            if self.fleet.complete(self.worker_id, image, q.downloaded, video):
+                self.log("INFO", f"Folder {q.folder} finished across the fleet", log_callback)
+                if self.post:
+                    self.post.folder_done(Path(q.folder_path), self.fleet.folder_items(q.folder_path))
+
+    def fleet_has_work(self, log_callback) -> bool:
+        """Jobs still open in the shared queue (other workers' leases may come back)"""
+        if not self.fleet:
+            return False
+        self.sync_fleet(log_callback)
+        return self.fleet.unfinished() > 0
 
-            queued.append({
-                'img_path': img,
-                'prompt_raw': raw,
-                'prompt_norm': self.normalize_prompt_text(raw),
-                'status': 'pending',   # pending / queued / generating / downloaded
-                'downloaded': False,
-                'article_position': None,  # Will be set after queuing
-                'session_uuid': str(uuid.uuid4()),  # Unique ID for this queue
-                'queued_timestamp': None  # Will be set when queued
-            })
-
-        for q in queued:
-            out = q['img_path'].with_suffix('.mp4')
-            if out.exists():
-                q['downloaded'] = True
-                q['status'] = 'downloaded'
-
-        total_to_download = sum(1 for q in queued if not q['downloaded'])
-        if total_to_download == 0:
-            self.log("INFO", f"All videos already exist for {sub_dir.name}. Skipping.", log_callback)
+    def finish_fleet(self, log_callback):
+        """Report what finished and hand unfinished leases back to the queue"""
+        if not self.fleet:
+            return
+        try:
+            self.sync_fleet(log_callback)
+            released = self.fleet.release(self.worker_id)
+            if released:
+                self.log("INFO", f"Returned {released} unfinished jobs to the shared queue", log_callback)
+        except sqlite3.Error as e:
+            self.log("WARNING", f"Fleet queue update failed: {e}", log_callback)
+        self.lease_keeper.stop()
+        self.lease_keeper = None
+        self.fleet.close()
+        self.fleet = None
+
+    def process_subfolder(self, sub_dir: Path, log_callback, progress_callback, folder_plan: Optional[Dict] = None):
+        self.log("INFO", f"Processing folder: {sub_dir.name}", log_callback)
+        if folder_plan is None:
+            planner = JobPlanner(str(self.root_folder), verified_index=self.verified_index)
+            folder_plan = planner.plan_folder(sub_dir)
+            self.verified_index.save()
+
+        self.planned_folders.append(folder_plan)
+        self.process_jobs(log_callback, progress_callback)
+
+    def set_folder_priority(self, folder: str, priority: int):
+        """Reorder pending work while running (thread-safe); higher runs first"""
+        self.scheduler.set_folder_priority(folder, priority)
+
+    def prioritize_folder(self, folder: str):
+        """Move a folder ahead of everything currently queued"""
+        self.set_folder_priority(folder, self.scheduler.max_folder_priority() + 1)
+
+    def set_schedule_policy(self, policy: str):
+        self.scheduler.set_policy(policy)
+
+    def start_watcher(self, log_callback):
+        """Feed folders that appear or change under the root into the running queue"""
+        self.watch_initial_folders = {c.name for c in self.root_folder.iterdir() if c.is_dir()}
+        self.watcher = FolderWatcher(
+            str(self.root_folder), self.on_watched_change,
+            debounce=self.WATCH_DEBOUNCE,
+            poll_interval=max(5.0, self.poll_interval),
+            log=lambda level, msg: self.log(level, msg, log_callback),
+        )
+        self.watcher.start()
+
+    def on_watched_change(self, folders: List[str]):
+        """Watcher thread: plan the changed folders and hand them to the engine like any batch.
+        Unselected folders that existed at start stay ignored; new folders are always taken."""
+        folders = [name for name in folders
+                   if not self.selected_folders or name in self.selected_folders or name not in self.watch_initial_folders]
+        if folders and not self.is_stopped():
+            self.submit_batch(str(self.root_folder), folders)
+
+    def ingest_batches(self, log_callback):
+        """Queue the folders of batches submitted since the last tick"""
+        while True:
+            try:
+                plan = self.incoming_batches.get_nowait()
+            except queue.Empty:
+                break
+            self.log("INFO", f"Nhận lô mới: {plan_summary(plan)}", log_callback)
+            self.planned_folders.extend(plan['folders'])
+
+    def process_jobs(self, log_callback, progress_callback, keep_alive: bool = False):
+        """Main loop: one feed, one set of slots, every job from every folder.
+        Each tick only touches the jobs whose state matters (rendering, newly loaded, picked).
+        With keep_alive the loop idles when everything is done and waits for submit_batch()."""
+        store = self.store
+
+        def track(jobs: List[Job]):
+            now = time.time()
+            for q in jobs:
+                q.loaded_at = now
+                self.progress.add_job(q.id, q.status)
+                if q.state == JobState.PENDING:
+                    self.scheduler.push(q)
+            if jobs and self.feed_inventory:
+                self.reconcile_feed(log_callback)
+
+        if self.reconcile and self.page is not None:
+            self.feed_inventory = self.scan_feed(log_callback)
+        track(self.load_more_jobs(log_callback))
+        if store.all_finished() and not self.folder_sources and not keep_alive and not self.fleet_has_work(log_callback):
+            self.log("INFO", "All videos already exist. Skipping.", log_callback)
             return
 
-        self.log("INFO", f"To process: {total_to_download} videos", log_callback)
-
-        start_time = time.time()
-        downloaded_total = sum(1 for q in queued if q['downloaded'])
+        more = " (more folders load as the queue drains)" if self.folder_sources else ""
+        self.log("INFO", f"To process: {len(store) - store.count(JobState.DOWNLOADED)} videos{more}", log_callback)
 
-        while downloaded_total < len(queued):
+        while True:
             if self.is_stopped():
                 self.log("WARNING", "Tiến trình bị dừng bởi người dùng", log_callback)
                 break
 
             self.wait_while_paused()
+            self._handle_save_session()
+            self.apply_profiling_requests(log_callback)
+            if not self.check_session(log_callback):
+                continue
+            self.record_tick()
 
-            elapsed = time.time() - start_time
-            if elapsed > self.DOWNLOAD_POLL_TIMEOUT:
-                self.log("ERROR", f"Timeout cho thư mục {sub_dir.name}. Đã tải {downloaded_total}/{len(queued)}", log_callback)
-                break
+            self.ingest_batches(log_callback)
+            track(self.load_more_jobs(log_callback))
 
-            progress_callback(downloaded_total, len(queued))
+            if store.all_finished() and not self.folder_sources:
+                if not keep_alive and not self.fleet_has_work(log_callback):
+                    break
+                self.idle_wait()
+                continue
+
+            self.report_progress(progress_callback)
 
             # STEP 1: Kiểm tra và download các video đã xong
-            downloaded_now = self.check_and_download_done_videos(queued, log_callback)
+            downloaded_now = self.check_and_download_done_videos(log_callback)
+            for folder in store.take_finished_folders():
+                jobs = store.folder_jobs[folder]
+                self.log_folder_finished(jobs[0].folder, jobs, log_callback)
+                self.post_folder(jobs)
+            if self.fleet:
+                self.sync_fleet(log_callback)
             if downloaded_now > 0:
-                downloaded_total += downloaded_now
-                progress_callback(downloaded_total, len(queued))
-                self.log("INFO", f"Đã tải: {downloaded_total}/{len(queued)}", log_callback)
+                # Count from the store: one download can also fill duplicates
+                self.report_progress(progress_callback)
+                self.log("INFO", f"Đã tải: {store.count(JobState.DOWNLOADED)}/{len(store)}", log_callback)
                 continue
 
             # STEP 2: Đếm số video đang generate
-            time.sleep(2.0)
-            active_generating = self.count_active_generating(log_callback, max_articles=36)
+            self.token.sleep(2.0)
+            with self.profiler.stage("count_active"):
+                active_generating = self.count_active_generating(log_callback, max_articles=36)
             available_slots = self.max_concurrent - active_generating
+            self.slots.observe(active_generating, store.count(JobState.PENDING))
 
-            self.log("INFO", f"Active: {active_generating}/{self.max_concurrent} | Slots: {available_slots}", log_callback)
+            over = " (oversubscribed)" if available_slots < 0 else ""
+            backoff = ""
+            if self.submit_backoff.active():
+                backoff = f" | Backoff: {self.submit_backoff.remaining():.0f}s ({self.submit_backoff.reason})"
+                available_slots = min(available_slots, 0)
+            self.log("INFO", f"Active: {active_generating}/{self.max_concurrent}{over} | Slots: {max(0, available_slots)}{backoff}", log_callback)
 
             # STEP 3: Nếu có slot trống → Queue videos mới
             queued_count = 0
             if available_slots > 0:
-                for q in queued:
+                generating = store.by_state[JobState.GENERATING]
+                in_flight_keys = {q.dedupe_key for q in generating if q.dedupe_key}
+
+                def is_ready(job):
+                    # Identical job already rendering - filled when it downloads
+                    return not self.is_waiting_retry(job) and job.dedupe_key not in in_flight_keys
+
+                while queued_count < available_slots:
                     if self.is_stopped():
                         break
                     self.wait_while_paused()
-                    if queued_count >= available_slots:
+                    q = self.scheduler.pop_next(is_ready)
+                    if q is None:
                         break
-                    if q['downloaded'] or q.get('status') in ('generating', 'downloaded'):
-                        continue
-
-                    self.log("INFO", f"Queue: {q['img_path'].name}", log_callback)
 
-                    self.upload_image(q['img_path'], log_callback)
-                    self.fill_prompt(q['prompt_raw'])
+                    self.log("INFO", f"Queue: {self.job_label(q)}", log_callback)
 
                     try:
-                        self.page.wait_for_selector(
-                            "div.rounded-lg.absolute.inset-0.size-full.flex.flex-col.items-center.justify-center",
-                            state="visible",
-                            timeout=3000
-                        )
-                        self.page.wait_for_selector(
-                            "div.rounded-lg.absolute.inset-0.size-full.flex.flex-col.items-center.justify-center",
-                            state="detached",
-                            timeout=15000
-                        )
-                    except Exception:
-                        pass
-
-                    self.click_generate()
-                    self.human_delay(0.6, 1.4)
-                    self.click_delete_uploaded_image()
-
-                    # Mark as generating and track position
-                    q['status'] = 'generating'
-                    q['queued_timestamp'] = time.time()
-                    q['article_position'] = 1
+                        with self.tracer.span(self.job_label(q), "submit"):
+                            self.submit_job(q, log_callback)
+                    except Exception as e:
+                        self.log("WARNING", f"Queue failed for {q.img_path.name}: {e}", log_callback)
+                        self.click_delete_uploaded_image()
+                        failure_class = SESSION_EXPIRED if self.session_expired() else classify_exception(e)
+                        if getattr(e, 'article_added', False):
+                            self.shift_feed_positions(generating)  # A failed article still took the top slot
+                        if failure_class == SESSION_EXPIRED:
+                            self.scheduler.push(q)
+                            self.check_session(log_callback, force=True)
+                            break
+                        if failure_class in (THROTTLED, REJECTED):
+                            delay = self.submit_backoff.record(str(e))
+                            self.emit_event("submit_backoff", failure_class=failure_class, reason=str(e), delay=delay)
+                            self.log("WARNING", f"Trang web từ chối/giới hạn ({failure_class}): tạm dừng gửi job {delay:.0f}s", log_callback)
+                        if failure_class == THROTTLED:
+                            self.scheduler.push(q)  # Back to pending; throttling is not the job's fault
+                            break
+                        self.record_job_failure(q, failure_class, str(e), log_callback)
+                        if q.state == JobState.PENDING:
+                            self.scheduler.push(q)
+                        if failure_class == REJECTED:
+                            break
+                        continue
 
-                    # Shift other generating videos' positions
-                    for other_q in queued:
-                        if other_q != q and other_q.get('article_position') and other_q['status'] == 'generating':
-                            other_q['article_position'] += 1
+                    self.submit_backoff.record_success()
+                    self.shift_feed_positions(generating)
 
-                    time.sleep(4.0)
+                    # Mark as generating and track position
+                    store.set_state(q, JobState.GENERATING)
+                    q.queued_timestamp = q.submitted_at = time.time()
+                    q.article_position = 1
+                    self.schedule_first_check(q, log_callback)
+                    if q.dedupe_key:
+                        in_flight_keys.add(q.dedupe_key)
+                    self.emit_job_event(q)
+
+                    self.token.sleep(4.0)
                     queued_count += 1
 
+            if queued_count:
+                self.slots.observe(active_generating + queued_count, store.count(JobState.PENDING))
+
             # STEP 4: Không có gì để làm → Sleep theo poll_interval
             if queued_count == 0:
-                for _ in range(int(self.poll_interval / 0.5)):
-                    if self.is_stopped():
-                        break
-                    self.wait_while_paused()
-                    time.sleep(0.5)
-
-        self.log("SUCCESS", f"Folder {sub_dir.name} finished. Downloaded: {sum(1 for q in queued if q['downloaded'])}/{len(queued)}", log_callback)
-        progress_callback(downloaded_total, len(queued))
+                with self.profiler.stage("idle"):
+                    self.idle_wait()
+
+        downloaded_total = store.count(JobState.DOWNLOADED)
+        failed = store.count(JobState.FAILED)
+        self.log("SUCCESS", f"Downloaded: {downloaded_total}/{len(store)}" + (f" | Failed: {failed}" if failed else ""), log_callback)
+        self.report_progress(progress_callback)
+
+    def shift_feed_positions(self, generating):
+        """A new article went on top of the feed: every tracked position moves down one"""
+        for other_q in generating:
+            if other_q.article_position:
+                other_q.article_position += 1
+        for article in self.feed_inventory:
+            article.position += 1
+
+    def idle_wait(self):
+        """Sleep one poll interval, waking early for stop, pause, session saves and new batches"""
+        for _ in range(int(self.poll_interval / 0.5)):
+            if self.is_stopped() or not self.incoming_batches.empty():
+                break
+            self.wait_while_paused()
+            self._handle_save_session()
+            self.record_tick()
+            self.token.sleep(0.5)
+
+    def log_folder_finished(self, name: str, jobs: List[Job], log_callback):
+        downloaded = sum(1 for q in jobs if q.downloaded)
+        failed = sum(1 for q in jobs if q.state == JobState.FAILED)
+        late = sum(1 for q in jobs if q.deadline is not None and q.finished_at > q.deadline)
+        msg = f"Folder {name} finished. Downloaded: {downloaded}/{len(jobs)}"
+        if failed:
+            msg += f" | Failed: {failed}"
+        if late:
+            msg += f" | Missed deadline: {late}"
+        self.log("SUCCESS", msg, log_callback)
+
+    def set_profiling(self, sampling: Optional[bool] = None, trace: Optional[str] = None,
+                      slow_seconds: Optional[float] = None, trace_jobs: Optional[List[str]] = None):
+        """Toggle profilers while running (any thread); None leaves a setting unchanged.
+        trace is 'off', 'slow' (keep chunks slower than slow_seconds) or 'all';
+        trace_jobs are job labels ('folder/image.png') traced whatever the mode."""
+        self.profiling_requests.put(dict(sampling=sampling, trace=trace, slow_seconds=slow_seconds, trace_jobs=trace_jobs))
+
+    def apply_profiling_requests(self, log_callback):
+        """Apply set_profiling() calls (browser thread)"""
+        while True:
+            try:
+                req = self.profiling_requests.get_nowait()
+            except queue.Empty:
+                break
+            if req['trace'] is not None or req['slow_seconds'] is not None or req['trace_jobs'] is not None:
+                before = (self.tracer.mode, self.tracer.slow_seconds, self.tracer.jobs)
+                try:
+                    self.tracer.configure(req['trace'], req['slow_seconds'], req['trace_jobs'])
+                except ValueError as e:
+                    self.log("WARNING", str(e), log_callback)
+                if (self.tracer.mode, self.tracer.slow_seconds, self.tracer.jobs) != before:
+                    self.log("INFO", f"Tracing: {self.tracer.mode} (slow ≥ {self.tracer.slow_seconds:.0f}s, {len(self.tracer.jobs)} chosen job(s))", log_callback)
+            if req['sampling'] and not self.sampler.running:
+                self.sampler.reset()
+                self.sampler.start()
+                self.log("INFO", "Sampling profiler started", log_callback)
+            elif req['sampling'] is False and self.sampler.running:
+                self.stop_sampler(log_callback)
+
+    def stop_sampler(self, log_callback):
+        """Stop sampling and write the folded stacks next to the folders"""
+        self.sampler.stop()
+        if not self.sampler.samples:
+            return
+        path = self.root_folder / self.PROFILE_DIR / f"samples_{time.strftime('%Y%m%d-%H%M%S')}.folded"
+        try:
+            self.sampler.save_folded(path)
+        except OSError as e:
+            self.log("WARNING", f"Could not write profile: {e}", log_callback)
+            path = None
+        for line in self.sampler.report_lines():
+            self.log("INFO", f"Profile {line}", log_callback)
+        if path:
+            self.log("INFO", f"Flame graph stacks: {path}", log_callback)
+
+    def record_tick(self):
+        if self.recorder:
+            self.recorder.maybe_snapshot(self.page)
+
+    def report_profile(self, log_callback):
+        for line in self.profiler.report_lines():
+            self.log("DEBUG", f"Stage {line}", log_callback)
+        t = self.tracer.report()
+        if t['kept'] or t['discarded']:
+            self.log("INFO", f"Traces: {t['kept']} kept, {t['discarded']} discarded, overhead {t['overhead_seconds']:.2f}s", log_callback)
+
+    def report_selector_stats(self, log_callback):
+        for line in self.selectors.summary_lines():
+            self.log("DEBUG", f"Selector {line}", log_callback)
+
+    def report_dead_letters(self, log_callback):
+        if not self.retry.dead_letter:
+            return
+        self.log("ERROR", f"{len(self.retry.dead_letter)} job(s) failed permanently:", log_callback)
+        for line in self.retry.report_lines():
+            self.log("ERROR", f"  {line}", log_callback)
 
     def request_save_session(self) -> tuple[bool, str]:
         """Request session save from main thread (non-blocking)
@@ -523,13 +1520,27 @@ class KlingEngine:
             self.save_session_event.clear()
             try:
                 if self.context:
-                    self.context.storage_state(path=self.STATE_FILE)
+                    atomic_write_json(self.STATE_FILE, self.context.storage_state())
                     self.save_session_result = (True, "Session saved successfully")
                 else:
                     self.save_session_result = (False, "Context not available")
             except Exception as e:
                 self.save_session_result = (False, f"Error: {str(e)}")
 
+    def context_options(self, storage_state: Optional[str]) -> Dict:
+        options = dict(
+            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            accept_downloads=True,
+            viewport={"width": 1600, "height": 900},
+            storage_state=storage_state
+        )
+        if self.recorder:
+            options.update(self.recorder.context_options())
+        return options
+
+    def setup_context(self, context):
+        """Hook for subclasses (replay routes) before the first page opens"""
+
     def launch_browser(self, log_callback: Optional[Callable] = None):
         """Launch browser and open page, but don't start processing yet"""
         if not log_callback:
@@ -540,13 +1551,18 @@ class KlingEngine:
         self.browser = self.playwright.chromium.launch(headless=self.headless)
         storage_state = self.STATE_FILE if Path(self.STATE_FILE).exists() else None
 
-        self.context = self.browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            accept_downloads=True,
-            viewport={"width": 1600, "height": 900},
-            storage_state=storage_state
-        )
+        self.context = self.browser.new_context(**self.context_options(storage_state))
+        self.setup_context(self.context)
+        self.tracer.attach(self.context)
         self.page = self.context.new_page()
+        self.session_monitor = SessionMonitor(
+            get_url=lambda: self.page.url,
+            get_cookies=self.context.cookies,
+            get_storage_state=self.context.storage_state,
+            state_file=self.STATE_FILE,
+            check_interval=self.SESSION_CHECK_INTERVAL,
+            refresh_interval=self.SESSION_REFRESH_INTERVAL,
+        )
         self.page.goto(self.BASE_URL, wait_until="load")
         self.human_delay(1.2, 2.6)
 
@@ -556,8 +1572,10 @@ class KlingEngine:
         else:
             self.log("SUCCESS", "Đã tự động đăng nhập bằng phiên đã lưu", log_callback)
 
-    def run(self, log_callback: Optional[Callable] = None, progress_callback: Optional[Callable] = None):
-        """Start processing folders (browser must be already launched)"""
+    def run(self, log_callback: Optional[Callable] = None, progress_callback: Optional[Callable] = None, keep_alive: bool = False):
+        """Start processing folders (browser must be already launched).
+        keep_alive keeps the browser up after the plan is done, waiting for submit_batch() until stop().
+        Watch mode implies keep_alive."""
         if not log_callback:
             log_callback = lambda level, msg: print(f"[{level}] {msg}")
         if not progress_callback:
@@ -566,39 +1584,101 @@ class KlingEngine:
         if not self.browser or not self.page:
             self.log("ERROR", "Browser not launched. Call launch_browser() first.", log_callback)
             return
+        keep_alive = keep_alive or self.watch
 
         try:
-            # Get folders to process
-            if self.selected_folders:
-                # Process only selected folders in order
-                folders_to_process = []
-                for folder_name in self.selected_folders:
-                    folder_path = self.root_folder / folder_name
-                    if folder_path.is_dir():
-                        folders_to_process.append(folder_path)
-                    else:
-                        self.log("WARNING", f"Folder not found: {folder_name}", log_callback)
+            self.verified_index = VerifiedIndex()  # Reload: planning may have added entries
+            if self.dedupe:
+                self.result_cache = ResultCache()
+            if self.fleet_queue_path:
+                # Fleet worker: the launcher planned everything into the shared queue
+                self.start_fleet(log_callback)
+                folder_count = self.fleet.open_folders()
+                planned, source = [], None
+            elif self.plan is not None:
+                folder_count = len(self.plan['folders'])
+                planned, source = self.plan['folders'], None
             else:
-                # Process all folders
-                folders_to_process = sorted([child for child in self.root_folder.iterdir() if child.is_dir()])
-
-            if not folders_to_process:
+                # No plan up front: folders are planned one by one as the queue drains
+                planner = JobPlanner(str(self.root_folder), self.selected_folders, self.max_concurrent,
+                                     dedupe=self.dedupe, verified_index=self.verified_index)
+                warnings = []
+                folders = planner.folders_to_plan(warnings)
+                for w in warnings:
+                    self.log("WARNING", w, log_callback)
+                folder_count = len(folders)
+                planned, source = [], planner.iter_folders(folders)
+
+            if not folder_count and not keep_alive:
                 self.log("WARNING", "Không có thư mục nào để xử lý!", log_callback)
                 return
 
-            self.log("INFO", f"Sẽ xử lý {len(folders_to_process)} thư mục", log_callback)
+            self.log("INFO", f"Sẽ xử lý {folder_count} thư mục", log_callback)
+
+            self.run_started_at = time.time()
+            self.progress = ProgressTracker(self.max_concurrent)
+            self.slots = SlotMeter(self.max_concurrent)
+            self.checks_skipped = 0
+            self.open_history(log_callback)
+            self.profiler.reset()
+            self.apply_profiling_requests(log_callback)
+            self.store = JobStore()
+            self.planned_folders = deque(planned)
+            self.folder_sources = deque([source] if source else [])
+            self.start_sinks(log_callback)
+            self.start_post(log_callback)
+            if self.watch:
+                self.start_watcher(log_callback)
 
-            for folder in folders_to_process:
-                if self.is_stopped():
-                    break
-                self.wait_while_paused()
-                self.process_subfolder(folder, log_callback, progress_callback)
-
-            self.log("SUCCESS", "Tất cả thư mục đã được xử lý!", log_callback)
+            try:
+                self.process_jobs(log_callback, progress_callback, keep_alive=keep_alive)
+            except Cancelled:
+                # stop() interrupted a wait mid-step; the job it was on stays pending/rendering
+                self.log("WARNING", "Tiến trình bị dừng bởi người dùng", log_callback)
+                self.report_progress(progress_callback)
+
+            if not self.is_stopped():  # A stopped run is not a finished one
+                self.log("SUCCESS", "Tất cả thư mục đã được xử lý!", log_callback)
+            self.report_dead_letters(log_callback)
+            self.log("INFO", f"Slots: {self.slots.summary()}", log_callback)
+            if self.checks_skipped:
+                self.log("INFO", f"Render predictor: skipped {self.checks_skipped} feed checks of renders not due yet", log_callback)
+            self.report_selector_stats(log_callback)
+            self.report_profile(log_callback)
         finally:
-            if self.context:
-                self.context.close()
-            if self.browser:
-                self.browser.close()
-            if self.playwright:
-                self.playwright.stop()
\ No newline at end of file
+            if self.watcher:
+                self.watcher.stop()
+                self.watcher = None
+            if self.sampler.running:
+                self.stop_sampler(log_callback)
+            self.tracer.stop()
+            self.finish_fleet(log_callback)
+            self.finish_sinks(log_callback)
+            self.finish_post(log_callback)
+            if self.history:
+                self.history.close()
+                self.history = None
+            self.emit_event("finished", **self.status_snapshot())
+            try:
+                self.selectors.save()
+            except OSError:
+                pass
+            if self.recorder:
+                self.recorder.maybe_snapshot(self.page, force=True)
+                self.recorder.finish()
+            if self.preprocessor:
+                self.preprocessor.shutdown()
+                self.preprocessor = None
+            self.close_browser()
+
+    def close_browser(self):
+        """Close the context, browser and Playwright driver (safe to call twice)"""
+        if self.context:
+            self.context.close()
+            self.context = None
+        if self.browser:
+            self.browser.close()
+            self.browser = None
+        if self.playwright:
+            self.playwright.stop()
+            self.playwright = None
\ No newline at end of file
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""Where finished videos are delivered, written off the automation thread.
+
+The browser download always lands next to the source image first (that
+file is what the planner, dedupe cache and integrity index look at).
+Sinks are extra destinations, described by a spec string:
+
+    local:/path/to/dir      copy into a directory tree (<folder>/<name>.mp4)
+    mirror:/path/to/dir     same, but fsync'ed before the rename - for network shares
+    s3://bucket/prefix      S3-compatible storage (needs boto3); for MinIO and other
+                            stand-ins add ?endpoint=http://127.0.0.1:9000
+                            (credentials come from the usual AWS_* variables)
+
+SinkWriter copies each finished file to every sink on a small thread pool,
+so delivery overlaps with generation instead of being a second pass.
+Files are streamed from disk (S3 uses multipart upload).  submit() never
+blocks: deliveries wait as (path, key) entries in a backlog, and a feeder
+thread hands at most max_queued of them to the pool at a time, so a slow
+sink holds up deliveries but never the engine.
+"""
+import os
+import time
+import shutil
+import threading
+from collections import deque
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from kling_cache import link_or_copy
+
+try:
+    import boto3
+except ImportError:  # boto3 is optional (only for s3:// sinks)
+    boto3 = None
+
+DEFAULT_WORKERS = 2
+MAX_QUEUED = 32  # deliveries handed to the pool at once (the rest wait in the backlog)
+ATTEMPTS = 3
+RETRY_DELAY = 5.0
+COPY_CHUNK = 1024 * 1024
+
+
+class OutputSink:
+    """Destination for finished videos; put() runs on a writer thread"""
+    name = "sink"
+
+    def put(self, src: Path, key: str):
+        raise NotImplementedError
+
+    def exists(self, key: str, size: int) -> bool:
+        return False
+
+
+class LocalSink(OutputSink):
+    def __init__(self, root: str, durable: bool = False):
+        self.root = Path(root)
+        self.durable = durable  # fsync before rename (mirror:)
+        self.name = f"{'mirror' if durable else 'local'}:{self.root}"
+
+    def put(self, src: Path, key: str):
+        dst = self.root / key
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        part = dst.with_name(dst.name + ".part")
+        try:
+            if self.durable:
+                with open(src, "rb") as fin, open(part, "wb") as fout:
+                    shutil.copyfileobj(fin, fout, COPY_CHUNK)
+                    fout.flush()
+                    os.fsync(fout.fileno())
+            else:
+                link_or_copy(src, part)
+            os.replace(part, dst)
+        finally:
+            part.unlink(missing_ok=True)
+
+    def exists(self, key: str, size: int) -> bool:
+        try:
+            return (self.root / key).stat().st_size == size
+        except OSError:
+            return False
+
+
+class S3Sink(OutputSink):
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None):
+        if boto3 is None:
+            raise RuntimeError("boto3 is not installed (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.name = f"s3://{bucket}/{self.prefix}"
+        # One client shared by the writer threads (boto3 clients are thread-safe)
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, src: Path, key: str):
+        # upload_file streams from disk in parts; the video is never read into memory whole
+        self.client.upload_file(str(src), self.bucket, self.object_key(key),
+                                ExtraArgs={"ContentType": "video/mp4"})
+
+    def exists(self, key: str, size: int) -> bool:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))["ContentLength"] == size
+        except Exception:
+            return False
+
+
+def build_sink(spec: str) -> OutputSink:
+    """OutputSink for a spec string (see module docstring); ValueError when it is not understood"""
+    if spec.startswith("s3://"):
+        url = urlparse(spec)
+        endpoint = parse_qs(url.query).get("endpoint", [None])[0]
+        if not url.netloc:
+            raise ValueError(f"Missing bucket in sink {spec!r}")
+        return S3Sink(url.netloc, url.path, endpoint_url=endpoint)
+    kind, sep, path = spec.partition(":")
+    if sep and kind in ("local", "mirror") and path:
+        return LocalSink(path, durable=kind == "mirror")
+    if os.path.isabs(spec):
+        return LocalSink(spec)
+    raise ValueError(f"Unknown output sink {spec!r} (use local:DIR, mirror:DIR or s3://bucket/prefix)")
+
+
+class SinkStats:
+    __slots__ = ('files', 'bytes', 'seconds', 'failures', 'skipped')
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0  # time spent writing (per sink, summed over workers)
+        self.failures = 0
+        self.skipped = 0  # already present with the same size
+
+
+class SinkWriter:
+    def __init__(self, sinks: List[OutputSink], workers: int = DEFAULT_WORKERS, max_queued: int = MAX_QUEUED,
+                 log: Optional[Callable[[str, str], None]] = None):
+        self.sinks = sinks
+        self.log = log or (lambda level, msg: None)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sink-writer")
+        self.slots = threading.BoundedSemaphore(max_queued)
+        self.lock = threading.Lock()
+        self.backlog_changed = threading.Condition(self.lock)
+        self.backlog = deque()  # (sink, src, key) not handed to the pool yet
+        self.closing = False
+        self.stats: Dict[str, SinkStats] = {sink.name: SinkStats() for sink in sinks}
+        self.queued = 0  # deliveries not finished yet (backlog + pool)
+        self.started_at = time.time()
+        self.failed: List[str] = []  # "sink: key" of deliveries that gave up
+        self.dropped: List[str] = []  # "sink: key" of deliveries close(wait=False) never started
+        self.feeder = threading.Thread(target=self._feed, name="sink-feeder", daemon=True)
+        self.feeder.start()
+
+    def submit(self, src: Path, key: str):
+        """Queue src for every sink; never blocks"""
+        with self.backlog_changed:
+            for sink in self.sinks:
+                self.backlog.append((sink, Path(src), key))
+                self.queued += 1
+            self.backlog_changed.notify()
+
+    def _feed(self):
+        """Feeder thread: waits for a free pool slot so that the engine never has to"""
+        while True:
+            with self.backlog_changed:
+                while not self.backlog and not self.closing:
+                    self.backlog_changed.wait()
+                if not self.backlog:
+                    return
+            self.slots.acquire()  # before taking a delivery, so close(wait=False) still finds it in the backlog
+            with self.lock:
+                if not self.backlog:  # dropped by close(wait=False) meanwhile
+                    self.slots.release()
+                    continue
+                delivery = self.backlog.popleft()
+            try:
+                future = self.executor.submit(self._deliver, *delivery)
+            except RuntimeError:  # close(wait=False) shut the pool down meanwhile
+                self._drop(delivery)
+                return
+            future.add_done_callback(lambda f, d=delivery: self._drop(d) if f.cancelled() else None)
+
+    def _drop(self, delivery):
+        """A delivery that holds a pool slot but will never run"""
+        sink, _, key = delivery
+        with self.lock:
+            self.queued -= 1
+            self.dropped.append(f"{sink.name}: {key}")
+        self.slots.release()
+
+    def _deliver(self, sink: OutputSink, src: Path, key: str):
+        stats = self.stats[sink.name]
+        try:
+            size = src.stat().st_size
+            if sink.exists(key, size):
+                with self.lock:
+                    stats.skipped += 1
+                return
+            for attempt in range(1, ATTEMPTS + 1):
+                t0 = time.perf_counter()
+                try:
+                    sink.put(src, key)
+                except Exception as e:
+                    if attempt == ATTEMPTS:
+                        raise
+                    self.log("WARNING", f"{sink.name}: {key} failed ({e}), retrying")
+                    time.sleep(RETRY_DELAY * attempt)
+                    continue
+                with self.lock:
+                    stats.files += 1
+                    stats.bytes += size
+                    stats.seconds += time.perf_counter() - t0
+                return
+        except Exception as e:
+            with self.lock:
+                stats.failures += 1
+                self.failed.append(f"{sink.name}: {key}")
+            self.log("ERROR", f"{sink.name}: could not deliver {key}: {e}")
+        finally:
+            with self.lock:
+                self.queued -= 1
+            self.slots.release()
+
+    def report(self) -> Dict:
+        """Per-sink throughput; mb_per_s is measured over write time, not wall time"""
+        with self.lock:
+            sinks = {
+                name: {
+                    'files': s.files,
+                    'mb': round(s.bytes / 1e6, 1),
+                    'mb_per_s': round(s.bytes / 1e6 / s.seconds, 2) if s.seconds else None,
+                    'failures': s.failures,
+                    'skipped': s.skipped,
+                }
+                for name, s in self.stats.items()
+            }
+            return {'queued': self.queued, 'sinks': sinks}
+
+    def summary_lines(self) -> List[str]:
+        lines = []
+        for name, s in self.report()['sinks'].items():
+            rate = f", {s['mb_per_s']} MB/s" if s['mb_per_s'] else ""
+            line = f"{name}: {s['files']} files, {s['mb']} MB{rate}"
+            if s['skipped']:
+                line += f", {s['skipped']} already there"
+            if s['failures']:
+                line += f", {s['failures']} failed"
+            lines.append(line)
+        return lines
+
+    def close(self, wait: bool = True):
+        """wait: deliver the backlog first; otherwise drop whatever has not started"""
+        with self.backlog_changed:
+            self.closing = True
+            if not wait:
+                self.dropped.extend(f"{sink.name}: {key}" for sink, _, key in self.backlog)
+                self.queued -= len(self.backlog)
+                self.backlog.clear()
+            self.backlog_changed.notify()
+        if wait:
+            self.feeder.join()
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""Post-download processing off the automation thread.
+
+Finished videos and finished folders are handed to a process pool; the
+engine only submits and moves on.  Steps (enable any subset):
+
+    poster    first-second frame as <folder>/_post/posters/<name>.jpg (needs ffmpeg)
+    manifest  <folder>/_post/manifest.json: every finished video with size, sha256,
+              duration (read from the MP4 header), source image and prompt
+    reel      all videos of a folder concatenated into <folder>/_post/reel.mp4 (needs ffmpeg)
+
+Outputs newer than their inputs are left alone, and manifest entries are
+reused while a video's size and mtime are unchanged, so reruns only
+process what is new.  Outputs live in a subfolder so they are never
+planned as new images.
+"""
+import json
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor, Future
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from kling_cache import file_sha256
+from video_integrity import mp4_duration
+
+POSTER = "poster"
+MANIFEST = "manifest"
+REEL = "reel"
+STEPS = (POSTER, MANIFEST, REEL)
+NEEDS_FFMPEG = (POSTER, REEL)
+
+POST_DIR = "_post"
+POSTER_AT_SECONDS = 1.0
+DEFAULT_WORKERS = 2
+FFMPEG_TIMEOUT = 600
+
+
+def post_dir(folder: Path) -> Path:
+    return Path(folder) / POST_DIR
+
+
+def poster_path(video: Path) -> Path:
+    return post_dir(video.parent) / "posters" / (video.stem + ".jpg")
+
+
+def is_fresh(output: Path, inputs: List[Path]) -> bool:
+    """output exists and is newer than every input"""
+    try:
+        made = output.stat().st_mtime_ns
+        return all(p.stat().st_mtime_ns <= made for p in inputs)
+    except OSError:
+        return False
+
+
+def _ffmpeg(ffmpeg: str, args: List[str], out: Path):
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.stem + ".tmp" + out.suffix)
+    try:
+        result = subprocess.run([ffmpeg, "-hide_banner", "-loglevel", "error", "-y", *args, str(tmp)],
+                                capture_output=True, text=True, timeout=FFMPEG_TIMEOUT)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip()[-300:] or f"ffmpeg exited with {result.returncode}")
+        os.replace(tmp, out)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+# --- worker process functions (module level so they can be pickled) ---
+
+def make_poster(video: str, ffmpeg: str) -> Tuple[str, str]:
+    video = Path(video)
+    out = poster_path(video)
+    if is_fresh(out, [video]):
+        return str(out), "cached"
+    _ffmpeg(ffmpeg, ["-ss", str(POSTER_AT_SECONDS), "-i", str(video), "-frames:v", "1", "-q:v", "3"], out)
+    return str(out), "done"
+
+
+def make_manifest(folder: str, items: List[Dict], with_posters: bool = False) -> Tuple[str, str]:
+    """items: [{'video': path, 'image': name, 'prompt': text}] of the folder's finished jobs.
+    with_posters: posters are being made (possibly still running), list their paths anyway"""
+    folder = Path(folder)
+    out = post_dir(folder) / "manifest.json"
+    try:
+        previous = {e['video']: e for e in json.loads(out.read_text(encoding="utf-8")).get('videos', [])}
+    except (OSError, ValueError, AttributeError):
+        previous = {}
+    entries, reused = [], 0
+    for item in items:
+        video = Path(item['video'])
+        try:
+            st = video.stat()
+        except OSError:
+            continue
+        old = previous.get(video.name)
+        if old and old.get('bytes') == st.st_size and old.get('mtime_ns') == st.st_mtime_ns:
+            entry = dict(old)
+            reused += 1
+        else:
+            entry = {
+                'video': video.name,
+                'bytes': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+                'sha256': file_sha256(video),
+                'duration_seconds': mp4_duration(video),
+            }
+        entry['image'] = item.get('image')
+        entry['prompt'] = item.get('prompt')
+        poster = poster_path(video)
+        entry['poster'] = poster.relative_to(folder).as_posix() if with_posters or poster.exists() else None
+        entries.append(entry)
+    if reused == len(entries) and len(entries) == len(previous) and out.exists():
+        return str(out), "cached"
+    durations = [e['duration_seconds'] for e in entries if e['duration_seconds']]
+    manifest = {
+        'folder': folder.name,
+        'videos': entries,
+        'count': len(entries),
+        'total_duration_seconds': round(sum(durations), 3),
+    }
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, out)
+    return str(out), "done"
+
+
+def make_reel(folder: str, videos: List[str], ffmpeg: str) -> Tuple[str, str]:
+    out = post_dir(Path(folder)) / "reel.mp4"
+    paths = [Path(v) for v in videos if Path(v).exists()]
+    if not paths:
+        return str(out), "skipped"
+    # The list of inputs is part of the result: a reel made from fewer videos is stale
+    listing = post_dir(Path(folder)) / "reel.txt"
+    lines = "".join(f"file '{p.resolve().as_posix()}'\n" for p in paths)
+    if is_fresh(out, paths) and listing.exists() and listing.read_text(encoding="utf-8") == lines:
+        return str(out), "cached"
+    listing.parent.mkdir(parents=True, exist_ok=True)
+    listing.write_text(lines, encoding="utf-8")
+    # Renders of one site share codec settings, so the streams are copied, not re-encoded
+    _ffmpeg(ffmpeg, ["-f", "concat", "-safe", "0", "-i", str(listing), "-c", "copy", "-movflags", "+faststart"], out)
+    return str(out), "done"
+
+
+class PostProcessor:
+    def __init__(self, steps: List[str], workers: int = DEFAULT_WORKERS,
+                 log: Optional[Callable[[str, str], None]] = None):
+        self.log = log or (lambda level, msg: None)
+        self.ffmpeg = shutil.which("ffmpeg")
+        unknown = [s for s in steps if s not in STEPS]
+        if unknown:
+            raise ValueError(f"Unknown post-processing step(s): {', '.join(unknown)} (use {', '.join(STEPS)})")
+        self.steps = [s for s in steps if s not in NEEDS_FFMPEG or self.ffmpeg]
+        missing = [s for s in steps if s not in self.steps]
+        if missing:
+            self.log("WARNING", f"ffmpeg not found: post-processing step(s) {', '.join(missing)} disabled")
+        self.executor = ProcessPoolExecutor(max_workers=workers) if self.steps else None
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.queued_posters = set()  # videos with a poster job in flight
+        self.counts: Dict[str, Dict[str, int]] = {s: {'done': 0, 'cached': 0, 'failed': 0} for s in self.steps}
+
+    def _submit(self, step: str, label: str, fn, *args):
+        with self.lock:
+            self.pending += 1
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda f: self._finished(step, label, f, args[0]))
+
+    def _finished(self, step: str, label: str, future: Future, target: str):
+        """Runs on the pool's result thread"""
+        with self.lock:
+            self.pending -= 1
+            self.queued_posters.discard(target)
+            try:
+                out, status = future.result()
+            except Exception as e:
+                self.counts[step]['failed'] += 1
+                out, status = None, None
+                error = e
+            else:
+                self.counts[step][status] = self.counts[step].get(status, 0) + 1
+        if status is None:
+            self.log("WARNING", f"Post-process {step} failed for {label}: {error}")
+        elif status == "done":
+            self.log("DEBUG", f"Post-process {step}: {out}")
+
+    def video_done(self, video: Path):
+        """A video was downloaded or reused (never blocks: the work is queued)"""
+        if POSTER not in self.steps or str(video) in self.queued_posters or is_fresh(poster_path(video), [video]):
+            return
+        with self.lock:
+            self.queued_posters.add(str(video))
+        self._submit(POSTER, video.name, make_poster, str(video), self.ffmpeg)
+
+    def folder_done(self, folder: Path, items: List[Dict]):
+        """Every job of the folder finished; items as for make_manifest()"""
+        if not items:
+            return
+        for item in items:
+            self.video_done(Path(item['video']))  # videos from earlier runs get their poster too
+        if MANIFEST in self.steps:
+            self._submit(MANIFEST, folder.name, make_manifest, str(folder), items, POSTER in self.steps)
+        if REEL in self.steps:
+            self._submit(REEL, folder.name, make_reel, str(folder), [item['video'] for item in items], self.ffmpeg)
+
+    def report(self) -> Dict:
+        with self.lock:
+            return {'pending': self.pending, 'steps': {s: dict(c) for s, c in self.counts.items()}}
+
+    def summary_lines(self) -> List[str]:
+        return [f"{step}: " + ", ".join(f"{n} {k}" for k, n in counts.items() if n) for step, counts in self.report()['steps'].items()
+                if any(counts.values())]
+
+    def shutdown(self, wait: bool = True):
+        if self.executor:
+            self.executor.shutdown(wait=wait, cancel_futures=not wait)
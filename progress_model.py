@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Run-wide progress: job counts per state, rolling throughput and ETA."""
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from job_planner import estimate_seconds, AVG_RENDER_SECONDS
+
+PENDING = "pending"
+RENDERING = "rendering"
+DOWNLOADING = "downloading"
+DONE = "done"
+FAILED = "failed"
+STATES = (PENDING, RENDERING, DOWNLOADING, DONE, FAILED)
+
+# Engine job status -> progress state
+STATUS_TO_STATE = {
+    'pending': PENDING,
+    'generating': RENDERING,
+    'downloading': DOWNLOADING,
+    'downloaded': DONE,
+    'failed': FAILED,
+}
+
+
+class ProgressTracker:
+    def __init__(self, max_concurrent: int = 2, window_seconds: float = 1800.0):
+        self.max_concurrent = max_concurrent
+        self.window_seconds = window_seconds
+        self.states: Dict[str, str] = {}  # job id -> state
+        self.counts = {s: 0 for s in STATES}
+        self.completions = deque()  # finish times of jobs completed in this run
+        self.started_at = time.time()
+        self.already_done = 0  # done before the run started (not part of throughput)
+        self.render_seconds = AVG_RENDER_SECONDS  # typical render time (from run history when known)
+
+    def add_job(self, job_id: str, status: str):
+        state = STATUS_TO_STATE[status]
+        if job_id in self.states:
+            return self.set_status(job_id, status)
+        self.states[job_id] = state
+        self.counts[state] += 1
+        if state == DONE:
+            self.already_done += 1
+
+    def set_status(self, job_id: str, status: str):
+        state = STATUS_TO_STATE[status]
+        old = self.states.get(job_id)
+        if old == state:
+            return
+        if old is not None:
+            self.counts[old] -= 1
+        self.states[job_id] = state
+        self.counts[state] += 1
+        if state == DONE:
+            self.completions.append(time.time())
+
+    def throughput_per_hour(self, now: Optional[float] = None) -> Optional[float]:
+        """Completions per hour over the rolling window; None until there is enough data"""
+        now = now or time.time()
+        while self.completions and self.completions[0] < now - self.window_seconds:
+            self.completions.popleft()
+        elapsed = min(self.window_seconds, now - self.started_at)
+        if not self.completions or elapsed < 60:
+            return None
+        return len(self.completions) * 3600.0 / elapsed
+
+    def snapshot(self) -> Dict:
+        now = time.time()
+        total = len(self.states)
+        remaining = self.counts[PENDING] + self.counts[RENDERING] + self.counts[DOWNLOADING]
+        rate = self.throughput_per_hour(now)
+        if remaining == 0:
+            eta = 0.0
+        elif rate:
+            eta = remaining * 3600.0 / rate
+        else:
+            eta = estimate_seconds(remaining, self.max_concurrent, self.render_seconds)
+        finished = self.counts[DONE] + self.counts[FAILED]
+        return {
+            'total': total,
+            'counts': dict(self.counts),
+            'percent': 100.0 * finished / total if total else 100.0,
+            'throughput_per_hour': rate,
+            'eta_seconds': eta,
+            'eta_from_throughput': rate is not None,
+            'elapsed_seconds': now - self.started_at,
+        }
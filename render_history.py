@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Per-job history across runs and a render-time predictor built on it.
+
+Every finished or failed job leaves one row in .kling_cache/history.sqlite:
+prompt length, image size, time spent waiting in the queue, render
+duration and outcome.  RenderPredictor groups past renders by prompt
+length and image size and gives early / typical / late finish estimates,
+so the engine can leave a job alone until it could plausibly be done and
+the ETA starts from real render times instead of a constant.
+"""
+import sqlite3
+import time
+from bisect import insort
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from kling_cache import cache_dir
+from stage_profiler import percentile
+
+HISTORY_FILE = "history.sqlite"
+MAX_ROWS = 50000  # oldest rows are pruned on open
+FIT_ROWS = 2000  # most recent renders the predictor learns from
+MIN_SAMPLES = 5  # below this a bucket falls back to a coarser one
+PROMPT_BUCKETS = (80, 200, 400)  # characters
+SIZE_BUCKETS = (500_000, 2_000_000)  # image bytes
+
+DOWNLOADED = "downloaded"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS renders (
+    finished_at REAL NOT NULL,
+    folder TEXT,
+    image TEXT,
+    prompt_len INTEGER,
+    image_bytes INTEGER,
+    queue_wait REAL,
+    render_seconds REAL,
+    outcome TEXT NOT NULL
+)
+"""
+
+
+class RunHistory:
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else cache_dir() / HISTORY_FILE
+        self.db = sqlite3.connect(str(self.path))
+        self.db.execute(SCHEMA)
+        self.db.execute("DELETE FROM renders WHERE rowid <= (SELECT MAX(rowid) FROM renders) - ?", (MAX_ROWS,))
+        self.db.commit()
+
+    def record(self, folder: str, image: str, prompt_len: int, image_bytes: int,
+               queue_wait: Optional[float], render_seconds: Optional[float], outcome: str):
+        self.db.execute(
+            "INSERT INTO renders VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), folder, image, prompt_len, image_bytes, queue_wait, render_seconds, outcome))
+        self.db.commit()
+
+    def render_samples(self, limit: int = FIT_ROWS) -> List[Tuple[int, int, float]]:
+        """(prompt_len, image_bytes, render_seconds) of the latest successful renders"""
+        return self.db.execute(
+            "SELECT prompt_len, image_bytes, render_seconds FROM renders "
+            "WHERE outcome = ? AND render_seconds > 0 ORDER BY rowid DESC LIMIT ?",
+            (DOWNLOADED, limit)).fetchall()
+
+    def outcome_counts(self) -> Dict[str, int]:
+        return dict(self.db.execute("SELECT outcome, COUNT(*) FROM renders GROUP BY outcome").fetchall())
+
+    def close(self):
+        self.db.close()
+
+
+def bucket_of(value: int, bounds: Tuple[int, ...]) -> int:
+    for i, bound in enumerate(bounds):
+        if value < bound:
+            return i
+    return len(bounds)
+
+
+class RenderPredictor:
+    def __init__(self, samples: List[Tuple[int, int, float]] = ()):
+        self.by_bucket: Dict[Tuple[int, int], List[float]] = {}
+        self.by_prompt: Dict[int, List[float]] = {}
+        self.all: List[float] = []
+        for prompt_len, image_bytes, seconds in samples:
+            self.add(prompt_len, image_bytes, seconds)
+
+    def add(self, prompt_len: int, image_bytes: int, seconds: float):
+        """Learn from a render finished during this run too"""
+        p = bucket_of(prompt_len or 0, PROMPT_BUCKETS)
+        s = bucket_of(image_bytes or 0, SIZE_BUCKETS)
+        insort(self.by_bucket.setdefault((p, s), []), seconds)
+        insort(self.by_prompt.setdefault(p, []), seconds)
+        insort(self.all, seconds)
+
+    def samples_for(self, prompt_len: int, image_bytes: int) -> List[float]:
+        p = bucket_of(prompt_len or 0, PROMPT_BUCKETS)
+        s = bucket_of(image_bytes or 0, SIZE_BUCKETS)
+        for values in (self.by_bucket.get((p, s), []), self.by_prompt.get(p, []), self.all):
+            if len(values) >= MIN_SAMPLES:
+                return values
+        return []
+
+    def estimate(self, prompt_len: int, image_bytes: int) -> Optional[Tuple[float, float, float]]:
+        """(early, typical, late) render seconds (p10 / p50 / p90), or None without enough history"""
+        values = self.samples_for(prompt_len, image_bytes)
+        if not values:
+            return None
+        return percentile(values, 10), percentile(values, 50), percentile(values, 90)
+
+    def typical(self) -> Optional[float]:
+        return percentile(self.all, 50) if len(self.all) >= MIN_SAMPLES else None
+
+    def __len__(self):
+        return len(self.all)
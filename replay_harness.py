@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""Record a live session once, then replay it offline to profile the engine.
+
+    python replay_harness.py record --root /videos --out recordings/run1
+    python replay_harness.py replay recordings/run1 --root /videos --time-scale 10
+
+Replay serves the page from a local server that steps through the recorded
+DOM snapshots on the recorded timeline (time_scale 1 = faithful, 10 = ten
+times faster).  Every other request is answered from the HAR and anything
+not in it is aborted, so a replay never touches the network.  Generate
+clicks have no effect on the replayed feed (they are taken as confirmed;
+the recorded timeline brings the new articles in) and downloads are
+synthetic, so a replay measures the engine's polling, matching and
+selector work against real page shapes and timings - not the site
+itself.  Replays run in a scratch directory (copied prompts, linked
+images) and never write into the real folders or caches.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import struct
+import bisect
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from kling_engine import KlingEngine
+from kling_cache import load_json
+from job_planner import IMAGE_EXTS
+from session_recorder import HAR_FILE, META_FILE, load_snapshot_index, read_snapshot
+
+SCRIPT_RE = re.compile(r"<script\b[^>]*>.*?</script>", re.IGNORECASE | re.DOTALL)
+BODY_RE = re.compile(r"<body\b[^>]*>(.*)</body>", re.IGNORECASE | re.DOTALL)
+HEAD_RE = re.compile(r"<head\b[^>]*>", re.IGNORECASE)
+NOT_LOCAL = re.compile(r"^(?!https?://127\.0\.0\.1[:/])")
+REPLAY_END_GRACE = 60.0  # recorded seconds to keep running after the last snapshot
+
+# Swaps in the current snapshot's body whenever the timeline moves on
+POLL_SCRIPT = """<script>
+(function () {
+  var current = %(current)d;
+  setInterval(function () {
+    fetch("%(server)s/__replay/current").then(function (r) { return r.json(); }).then(function (d) {
+      if (d.id === current) { return; }
+      current = d.id;
+      fetch("%(server)s/__replay/body/" + d.id).then(function (r) { return r.text(); })
+        .then(function (html) { document.body.innerHTML = html; });
+    });
+  }, 250);
+})();
+</script>"""
+
+
+def synthetic_mp4(size: int = 20 * 1024) -> bytes:
+    """Smallest file that passes validate_mp4: ftyp + moov(mvhd, 5 s) + free padding"""
+    ftyp = struct.pack(">I4s4sI4s4s", 24, b"ftyp", b"isom", 512, b"isom", b"mp41")
+    mvhd = struct.pack(">I4sB3xIIII", 108, b"mvhd", 0, 0, 0, 1000, 5000)
+    mvhd += struct.pack(">IH10x", 0x00010000, 0x0100) + b"\0" * 36 + b"\0" * 24 + struct.pack(">I", 2)
+    moov = struct.pack(">I4s", 8 + len(mvhd), b"moov") + mvhd
+    pad = size - len(ftyp) - len(moov)
+    return ftyp + moov + struct.pack(">I4s", pad, b"free") + b"\0" * (pad - 8)
+
+
+class ReplayTimeline:
+    def __init__(self, recording_dir: Path, time_scale: float = 1.0):
+        self.dir = Path(recording_dir)
+        self.index = load_snapshot_index(self.dir)
+        if not self.index:
+            raise ValueError(f"{recording_dir} has no DOM snapshots")
+        self.times = [t for t, _ in self.index]
+        self.time_scale = time_scale
+        self.started_at: Optional[float] = None
+        self._pages: Dict[int, str] = {}
+
+    def start(self):
+        self.started_at = time.time()
+
+    def elapsed(self) -> float:
+        """Recorded seconds reached so far"""
+        if self.started_at is None:
+            return 0.0
+        return (time.time() - self.started_at) * self.time_scale
+
+    def current(self) -> int:
+        return max(0, bisect.bisect_right(self.times, self.elapsed()) - 1)
+
+    def finished(self, grace: float = 0.0) -> bool:
+        return self.started_at is not None and self.elapsed() > self.times[-1] + grace
+
+    def page(self, idx: int) -> str:
+        """Snapshot HTML without the site's scripts (they would fight the snapshot swaps)"""
+        if idx not in self._pages:
+            self._pages[idx] = SCRIPT_RE.sub("", read_snapshot(self.dir, self.index[idx][1]))
+        return self._pages[idx]
+
+    def body(self, idx: int) -> str:
+        html = self.page(idx)
+        m = BODY_RE.search(html)
+        return m.group(1) if m else html
+
+
+class ReplayServer:
+    def __init__(self, timeline: ReplayTimeline, origin: str):
+        self.timeline = timeline
+        self.origin = origin  # recorded site, for relative asset URLs (answered from the HAR)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="replay-server", daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        if self.thread:  # shutdown() would wait forever for a loop that never started
+            self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def document(self) -> str:
+        idx = self.timeline.current()
+        html = self.timeline.page(idx)
+        origin = urlparse(self.origin)
+        base = f'<base href="{origin.scheme}://{origin.netloc}/">'
+        html = HEAD_RE.sub(lambda m: m.group(0) + base, html, count=1)
+        script = POLL_SCRIPT % {'current': idx, 'server': self.url}
+        if "</body>" in html:
+            return html.replace("</body>", script + "</body>", 1)
+        return html + script
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, body: str, content_type: str):
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/__replay/current":
+                    return self._send(json.dumps({'id': server.timeline.current()}), "application/json")
+                if self.path.startswith("/__replay/body/"):
+                    idx = int(self.path.rsplit("/", 1)[1])
+                    return self._send(server.timeline.body(idx), "text/html; charset=utf-8")
+                self._send(server.document(), "text/html; charset=utf-8")
+
+        return Handler
+
+
+class SyntheticDownload:
+    """Stands in for a Playwright Download: the replayed page cannot produce the real video"""
+    def save_as(self, path: str):
+        Path(path).write_bytes(synthetic_mp4())
+
+    def failure(self):
+        return None
+
+
+class ReplayEngine(KlingEngine):
+    def __init__(self, recording_dir: str, root_folder: str, time_scale: float = 1.0, **kwargs):
+        kwargs.setdefault('headless', True)
+        super().__init__(root_folder, **kwargs)
+        self.recording_dir = Path(recording_dir)
+        meta = load_json(self.recording_dir / META_FILE)
+        origin = meta.get('base_url', KlingEngine.BASE_URL)
+        self.time_scale = time_scale
+        self.timeline = ReplayTimeline(self.recording_dir, time_scale)
+        self.server = ReplayServer(self.timeline, origin)
+        self.BASE_URL = self.server.url + urlparse(origin).path
+        # Engine waits follow the compressed timeline (the fixed human delays do not)
+        self.poll_interval = self.poll_interval / time_scale
+        self.MAX_RENDER_AGE = self.MAX_RENDER_AGE / time_scale
+        self.upload_confirm_by_network = False  # nothing answers the upload request in a replay
+
+    def context_options(self, storage_state: Optional[str]) -> Dict:
+        return super().context_options(None)
+
+    def setup_context(self, context):
+        har = self.recording_dir / HAR_FILE
+        if har.exists():
+            context.route_from_har(str(har), url=NOT_LOCAL, not_found="abort")
+        else:
+            context.route(NOT_LOCAL, lambda route: route.abort())
+
+    def launch_browser(self, log_callback=None):
+        self.server.start()
+        super().launch_browser(log_callback)
+
+    def confirm_submission(self, prompt, feed_marked, notices_before, refusals):
+        # The replayed feed ignores the click, so waiting for a new article would reject every job
+        # and trip the submit backoff; the recording already shows when the article appeared
+        self.token.check()
+
+    def fetch_download(self, q, article_position, target):
+        if not self.find_article_download_button(article_position):
+            raise Exception("Download button not found")
+        self.emit_job_event(q, status='downloading')
+        return self.save_verified_download(SyntheticDownload(), target)
+
+    def watch_timeline(self):
+        """Stop once the recording has played out (plus a grace period)"""
+        while not self.is_stopped():
+            if self.timeline.finished(REPLAY_END_GRACE):
+                self.log("INFO", "Replay timeline finished")
+                self.stop()
+                return
+            time.sleep(0.2)
+
+    def run(self, log_callback=None, progress_callback=None, keep_alive: bool = False):
+        self.timeline.start()
+        threading.Thread(target=self.watch_timeline, name="replay-watch", daemon=True).start()
+        try:
+            super().run(log_callback, progress_callback, keep_alive)
+        finally:
+            self.server.shutdown()
+
+
+def prepare_scratch(root: Path, folders: Optional[list], scratch: Path) -> Path:
+    """Mirror the input tree (prompts copied, images linked, no outputs) so every job is pending"""
+    out_root = scratch / "root"
+    for sub in sorted(p for p in root.iterdir() if p.is_dir() and not p.name.startswith(".")):
+        if folders and sub.name not in folders:
+            continue
+        dst = out_root / sub.name
+        dst.mkdir(parents=True, exist_ok=True)
+        for f in sub.iterdir():
+            if f.name in ("prompts.txt", "schedule.json"):
+                shutil.copy2(f, dst / f.name)
+            elif f.suffix.lower() in IMAGE_EXTS:
+                try:
+                    os.symlink(f.resolve(), dst / f.name)
+                except OSError:
+                    shutil.copy2(f, dst / f.name)
+    if Path("selectors.json").exists():
+        shutil.copy2("selectors.json", scratch / "selectors.json")
+    return out_root
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record a live session or replay one offline with per-stage profiles")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    rec = sub.add_parser("record", help="Run normally while recording HAR + DOM snapshots")
+    rec.add_argument("--root", required=True)
+    rec.add_argument("--folders", nargs="*")
+    rec.add_argument("--out", required=True, help="Recording directory")
+    rec.add_argument("--concurrent", type=int, default=2)
+    rec.add_argument("--snapshot-interval", type=float, default=5.0)
+
+    rep = sub.add_parser("replay", help="Replay a recording offline and print the stage profile")
+    rep.add_argument("recording")
+    rep.add_argument("--root", required=True, help="The root folder the recording was made with")
+    rep.add_argument("--folders", nargs="*")
+    rep.add_argument("--concurrent", type=int, default=2)
+    rep.add_argument("--time-scale", type=float, default=1.0, help="1 = faithful timing, >1 = compressed")
+    rep.add_argument("--show-browser", action="store_true")
+    rep.add_argument("--profile-out", help="Write the stage profile as JSON")
+    rep.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        engine = KlingEngine(args.root, max_concurrent=args.concurrent, selected_folders=args.folders,
+                             record_dir=args.out)
+        engine.recorder.snapshot_interval = args.snapshot_interval
+        engine.launch_browser()
+        engine.run()
+        print(f"Recording saved to {args.out}")
+        return
+
+    recording = Path(args.recording).resolve()
+    root = Path(args.root).resolve()
+    profile_out = Path(args.profile_out).resolve() if args.profile_out else None
+    scratch = Path(tempfile.mkdtemp(prefix="kling-replay-"))
+    cwd = os.getcwd()
+    try:
+        scratch_root = prepare_scratch(root, args.folders, scratch)
+        os.chdir(scratch)  # caches, selector stats and state.json stay in the scratch dir
+        engine = ReplayEngine(recording, str(scratch_root), time_scale=args.time_scale,
+                              headless=not args.show_browser, max_concurrent=args.concurrent)
+        engine.launch_browser()
+        engine.run()
+        print("\nStage profile:")
+        for line in engine.profiler.report_lines():
+            print(f"  {line}")
+        if profile_out:
+            engine.profiler.save(profile_out)
+            print(f"Profile saved to {profile_out}")
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"Scratch directory: {scratch}", file=sys.stderr)
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Failure classification and per-class retry budgets for engine jobs.
+
+Every failure of a job is mapped to one of a few classes.  Each class has
+its own attempt budget and exponential backoff (with jitter); a job that
+exhausts its budget lands on the dead-letter list reported at the end of
+the run instead of being retried forever.
+"""
+import time
+import random
+from typing import Dict, List, Optional
+
+SELECTOR_MISSING = "selector_missing"
+TIMEOUT = "timeout"
+REJECTED = "rejected"
+THROTTLED = "throttled"
+DOWNLOAD_ERROR = "download_error"
+SESSION_EXPIRED = "session_expired"
+
+
+class JobFailure(Exception):
+    """Raised by engine steps that already know what kind of failure happened"""
+    def __init__(self, failure_class: str, message: str):
+        super().__init__(message)
+        self.failure_class = failure_class
+
+
+class RetryBudget:
+    def __init__(self, max_retries: int, base_delay: float, max_delay: float):
+        self.max_retries = max_retries  # retries after the first failure
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+
+DEFAULT_BUDGETS = {
+    SELECTOR_MISSING: RetryBudget(max_retries=3, base_delay=5.0, max_delay=60.0),
+    TIMEOUT: RetryBudget(max_retries=2, base_delay=10.0, max_delay=120.0),
+    REJECTED: RetryBudget(max_retries=2, base_delay=60.0, max_delay=600.0),
+    DOWNLOAD_ERROR: RetryBudget(max_retries=5, base_delay=10.0, max_delay=300.0),
+    # Not per-job problems: the engine pauses (session) or backs off globally (throttling)
+    SESSION_EXPIRED: RetryBudget(max_retries=0, base_delay=0.0, max_delay=0.0),
+    THROTTLED: RetryBudget(max_retries=0, base_delay=0.0, max_delay=0.0),
+}
+
+
+def classify_exception(exc: BaseException) -> str:
+    if isinstance(exc, JobFailure):
+        return exc.failure_class
+    # Playwright's TimeoutError, matched by name so this module stays import-free
+    if type(exc).__name__ == "TimeoutError" or "timeout" in str(exc).lower():
+        return TIMEOUT
+    msg = str(exc).lower()
+    if "429" in msg or "too many requests" in msg or "rate limit" in msg:
+        return THROTTLED
+    if "not found" in msg or "could not find" in msg or "no node" in msg:
+        return SELECTOR_MISSING
+    if "download" in msg:
+        return DOWNLOAD_ERROR
+    return TIMEOUT
+
+
+class RetryTracker:
+    def __init__(self, budgets: Optional[Dict[str, RetryBudget]] = None):
+        self.budgets = dict(DEFAULT_BUDGETS)
+        if budgets:
+            self.budgets.update(budgets)
+        self.failures: Dict[str, Dict[str, int]] = {}  # job id -> {class: count}
+        self.dead_letter: List[Dict] = []
+
+    def backoff(self, failure_class: str, attempt: int) -> float:
+        """Exponential delay for the n-th failure with equal jitter (half fixed, half random)"""
+        budget = self.budgets[failure_class]
+        delay = min(budget.max_delay, budget.base_delay * (2 ** (attempt - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def record_failure(self, job_id: str, failure_class: str, label: str, detail: str = "") -> Optional[float]:
+        """Count a failure. Returns the delay before the next attempt, or None when the job is dead-lettered."""
+        counts = self.failures.setdefault(job_id, {})
+        counts[failure_class] = counts.get(failure_class, 0) + 1
+        attempt = counts[failure_class]
+        max_retries = self.budgets[failure_class].max_retries
+        if attempt > max_retries:
+            if attempt > max_retries + 1:
+                return None  # already dead-lettered
+            self.dead_letter.append({
+                'job': label,
+                'failure_class': failure_class,
+                'attempts': attempt,
+                'detail': detail,
+                'at': time.time(),
+            })
+            return None
+        return self.backoff(failure_class, attempt)
+
+    def report_lines(self) -> List[str]:
+        return [f"{d['job']}: {d['failure_class']} x{d['attempts']} - {d['detail']}" for d in self.dead_letter]
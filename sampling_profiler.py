@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Low-overhead sampling profiler for the engine thread.
+
+A daemon thread reads the engine thread's Python stack every few
+milliseconds (sys._current_frames, no tracing hooks on the engine itself)
+and counts identical stacks.  The dump is in the collapsed "folded" format
+that flamegraph.pl, speedscope and inferno read directly:
+
+    kling_engine:run;kling_engine:process_jobs;kling_engine:idle_wait 412
+
+Playwright's sync API waits by switching from the engine's greenlet to
+its dispatcher greenlet, so during a wait the thread's current frames are
+the dispatcher's alone.  The sampler remembers the greenlet that called
+start() and, while that greenlet is suspended, puts its stack under the
+dispatcher's, so every wait is charged to the engine step that made it.
+
+Every sample is also put in one bucket - time in our own Python code,
+inside Playwright's client, or blocked waiting on the driver/page - which
+is the first question when the engine thread gets slow.  The sampler
+measures its own cost (time spent taking samples, which holds the GIL)
+so it can be left on.
+"""
+import sys
+import time
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import greenlet  # installed with Playwright
+except ImportError:
+    greenlet = None
+
+DEFAULT_INTERVAL = 0.01  # 100 Hz
+MAX_DEPTH = 64
+
+PYTHON = "python"
+PLAYWRIGHT = "playwright"
+WAITING = "waiting"  # event loop select(): the driver or the page has the ball
+WAIT_MODULES = ("selectors", "base_events", "selector_events")
+
+
+def frame_name(frame) -> str:
+    return f"{Path(frame.f_code.co_filename).stem}:{frame.f_code.co_name}"
+
+
+def classify(frame) -> str:
+    if Path(frame.f_code.co_filename).stem in WAIT_MODULES:
+        return WAITING
+    f = frame
+    while f is not None:
+        if "playwright" in f.f_code.co_filename:
+            return PLAYWRIGHT
+        f = f.f_back
+    return PYTHON
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.buckets: Counter = Counter()
+        self.samples = 0
+        self.overhead = 0.0  # seconds spent sampling
+        self.wall = 0.0  # seconds sampled, over all start/stop periods
+        self.thread_id: Optional[int] = None
+        self.greenlet = None  # the sampled code's greenlet, when start() ran on that thread
+        self._started_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, thread_id: Optional[int] = None):
+        """Sample thread_id (default: the calling thread) until stop()"""
+        if self.running:
+            return
+        self.thread_id = thread_id or threading.get_ident()
+        if greenlet is not None and self.thread_id == threading.get_ident():
+            self.greenlet = greenlet.getcurrent()
+        self._stop.clear()
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.greenlet = None
+        self.wall += time.perf_counter() - self._started_at
+
+    def reset(self):
+        self.stacks.clear()
+        self.buckets.clear()
+        self.samples = 0
+        self.overhead = 0.0
+        self.wall = 0.0
+        if self.running:
+            self._started_at = time.perf_counter()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            t0 = time.perf_counter()
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                # Not None only while the engine's greenlet is switched out (e.g. to Playwright's dispatcher)
+                suspended = self.greenlet.gr_frame if self.greenlet is not None else None
+                self.buckets[classify(frame)] += 1
+                self.stacks[self._stack(frame, suspended)] += 1
+                self.samples += 1
+            frame = suspended = None  # don't keep the engine's frames alive between samples
+            self.overhead += time.perf_counter() - t0
+
+    def _stack(self, frame, suspended=None) -> Tuple[str, ...]:
+        """Root-first names of frame's stack, placed under the suspended greenlet's stack if given"""
+        names = []
+        for f in (frame, suspended):
+            while f is not None and len(names) < MAX_DEPTH:
+                names.append(frame_name(f))
+                f = f.f_back
+        return tuple(reversed(names))
+
+    def elapsed(self) -> float:
+        return self.wall + (time.perf_counter() - self._started_at if self.running else 0.0)
+
+    def report(self) -> Dict:
+        elapsed = self.elapsed()
+        return {
+            'running': self.running,
+            'samples': self.samples,
+            'elapsed': round(elapsed, 1),
+            'buckets': {name: round(n / self.samples, 3) for name, n in self.buckets.most_common()} if self.samples else {},
+            'overhead_seconds': round(self.overhead, 3),
+            'overhead_pct': round(100.0 * self.overhead / elapsed, 2) if elapsed else 0.0,
+        }
+
+    def report_lines(self, top: int = 5) -> List[str]:
+        r = self.report()
+        lines = [f"{r['samples']} samples over {r['elapsed']:.0f}s, overhead {r['overhead_seconds']:.2f}s ({r['overhead_pct']:.2f}%)"]
+        if r['buckets']:
+            lines.append(" | ".join(f"{name} {share:.0%}" for name, share in r['buckets'].items()))
+        for stack, n in self.stacks.most_common(top):
+            lines.append(f"{n / self.samples:5.1%} {stack[-1]} <- {stack[-2] if len(stack) > 1 else '-'}")
+        return lines
+
+    def save_folded(self, path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {n}\n")
+        return path
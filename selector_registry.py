@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Logical page elements as ordered fallback chains of selectors.
+
+Each element (prompt box, generate button, ...) has a chain of locator
+strategies.  Lookups try the chain with instant queries instead of one long
+wait per selector, so a selector broken by a UI change costs one cheap miss.
+Per-strategy hits, misses and latency are recorded; the fastest strategy
+that currently works is tried first, and the stats survive restarts.
+
+Chains can be overridden without touching the code by a selectors.json next
+to state.json:
+
+    {"prompt_box": ["#prompt", "textarea[name=prompt]"]}
+"""
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from kling_cache import cache_dir, load_json, atomic_write_json
+
+CONFIG_FILE = "selectors.json"
+POLL_SECONDS = 0.25
+
+DEFAULT_CHAINS: Dict[str, List[str]] = {
+    # Page level
+    'upload_input': ["input[type=file]"],
+    'prompt_box': ["#prompt", "textarea[name='prompt']", "form textarea"],
+    'generate_button': ['button:has-text("Generate")', "form button[type='submit']"],
+    'delete_image_button': [
+        "form button[aria-label*='remove' i]",
+        "form button[aria-label*='delete' i]",
+        "xpath=/html/body/main/div/div[2]/div[1]/form/div[1]/div[1]/div/div[2]/button",
+    ],
+    'upload_overlay': ["div.rounded-lg.absolute.inset-0.size-full.flex.flex-col.items-center.justify-center"],
+    'feed_articles': ["article"],
+    'site_notices': ["[data-sonner-toast]", "[role='alert']", ".Toastify__toast"],
+    'feed_article': [
+        "article:nth-child({idx})",
+        r"#create-content .feed-container > article:nth-child({idx})",
+    ],
+    'feed_download_button': [
+        r"#create-content > div.space-y-4.pb-8.md\:pb-0.feed-container > article:nth-child({idx}) > div.flex-1.h-full.gap-2.my-auto > div > div > div:nth-child(1) > button:nth-child(1)",
+    ],
+    # Inside one feed article
+    'article_status': ["[data-sentry-component='StatusBadge']"],
+    'article_prompt': ["[data-sentry-component='ViewPromptInteractable']"],
+    'article_download_button': [
+        "button.button--fixed:has(svg[viewBox='0 0 24 24'])",
+        "button:has(svg[viewBox='0 0 24 24'])",
+    ],
+    'article_rendering': ["div.rounded-lg.absolute.inset-0.size-full.flex.flex-col.items-center.justify-center"],
+}
+
+
+class StrategyStats:
+    __slots__ = ('hits', 'misses', 'total_latency', 'last_hit')
+
+    def __init__(self, hits: int = 0, misses: int = 0, total_latency: float = 0.0, last_hit: Optional[bool] = None):
+        self.hits = hits
+        self.misses = misses
+        self.total_latency = total_latency  # seconds, over hits
+        self.last_hit = last_hit  # None = never tried while the element was present
+
+    @property
+    def avg_latency(self) -> float:
+        return self.total_latency / self.hits if self.hits else float("inf")
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        tried = self.hits + self.misses
+        return self.hits / tried if tried else None
+
+    def to_list(self) -> list:
+        return [self.hits, self.misses, round(self.total_latency, 4), self.last_hit]
+
+
+class SelectorRegistry:
+    def __init__(self, config_file: str = CONFIG_FILE, log: Optional[Callable[[str, str], None]] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.chains = {name: list(chain) for name, chain in DEFAULT_CHAINS.items()}
+        overrides = load_json(Path(config_file))
+        for name, chain in overrides.items():
+            if isinstance(chain, str):
+                chain = [chain]
+            self.chains[name] = list(chain)
+        self.log = log or (lambda level, msg: None)
+        self.sleep = sleep  # waits between polls (the engine's is interruptible by stop())
+        self.stats_file = cache_dir() / "selector_stats.json"
+        self.stats: Dict[str, Dict[str, StrategyStats]] = {}
+        for name, per_selector in load_json(self.stats_file).items():
+            self.stats[name] = {sel: StrategyStats(*values) for sel, values in per_selector.items()}
+        self.not_found: Dict[str, int] = {}  # element -> lookups where no strategy matched
+        self._order: Dict[str, List[str]] = {}
+
+    def _stats(self, name: str, selector: str) -> StrategyStats:
+        return self.stats.setdefault(name, {}).setdefault(selector, StrategyStats())
+
+    def order(self, name: str) -> List[str]:
+        """Chain in try order: working strategies by latency, then untried, then failing ones"""
+        if name not in self._order:
+            chain = self.chains[name]
+
+            def key(item):
+                pos, sel = item
+                s = self._stats(name, sel)
+                if s.last_hit:
+                    return (0, s.avg_latency, pos)
+                return (1 if s.last_hit is None else 2, 0.0, pos)
+            self._order[name] = [sel for _, sel in sorted(enumerate(chain), key=key)]
+        return self._order[name]
+
+    def best(self, name: str, **fmt) -> str:
+        sel = self.order(name)[0]
+        return sel.format(**fmt) if fmt else sel
+
+    def _record(self, name: str, selector: str, hit: bool, latency: float = 0.0):
+        s = self._stats(name, selector)
+        if hit:
+            s.hits += 1
+            s.total_latency += latency
+        else:
+            s.misses += 1
+        if s.last_hit != hit:
+            s.last_hit = hit
+            before = self.order(name)[0]
+            self._order.pop(name, None)
+            if self.order(name)[0] != before:
+                self.log("DEBUG", f"Selector '{name}': now trying {self.order(name)[0]!r} first")
+
+    def find(self, scope, name: str, timeout: float = 0.0, visible: bool = True, **fmt):
+        """Element handle for a logical element, or None after timeout seconds.
+        scope is the page or an element handle; fmt fills placeholders such as {idx}."""
+        deadline = time.time() + timeout
+        while True:
+            missed = []
+            for sel in self.order(name):
+                t0 = time.perf_counter()
+                try:
+                    el = scope.query_selector(sel.format(**fmt) if fmt else sel)
+                    if el and visible and not el.is_visible():
+                        el = None
+                except Exception:
+                    el = None
+                if el:
+                    # Strategies tried before this one missed an element that was there
+                    for m in missed:
+                        self._record(name, m, False)
+                    self._record(name, sel, True, time.perf_counter() - t0)
+                    return el
+                missed.append(sel)
+            if time.time() >= deadline:
+                if timeout:  # instant probes miss all the time by design (e.g. no badge yet)
+                    self.not_found[name] = self.not_found.get(name, 0) + 1
+                return None
+            self.sleep(POLL_SECONDS)
+
+    def find_all(self, scope, name: str, **fmt) -> list:
+        """All matches of the first strategy that matches anything (no visibility filter)"""
+        for i, sel in enumerate(self.order(name)):
+            try:
+                found = scope.query_selector_all(sel.format(**fmt) if fmt else sel)
+            except Exception:
+                found = []
+            if found:
+                for m in self.order(name)[:i]:
+                    self._record(name, m, False)
+                self._record(name, sel, True)
+                return found
+        return []
+
+    def summary_lines(self) -> List[str]:
+        lines = []
+        for name in self.chains:
+            per_selector = self.stats.get(name, {})
+            tried = [(sel, per_selector[sel]) for sel in self.order(name) if sel in per_selector and per_selector[sel].hit_rate is not None]
+            if not tried and not self.not_found.get(name):
+                continue
+            parts = [f"{sel[:40]} {s.hit_rate:.0%}/{s.avg_latency * 1000:.0f}ms" if s.hits else f"{sel[:40]} 0%" for sel, s in tried]
+            if self.not_found.get(name):
+                parts.append(f"not found x{self.not_found[name]}")
+            lines.append(f"{name}: " + " | ".join(parts))
+        return lines
+
+    def save(self):
+        data = {name: {sel: s.to_list() for sel, s in per_selector.items() if sel in self.chains.get(name, [])}
+                for name, per_selector in self.stats.items()}
+        atomic_write_json(self.stats_file, data)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Periodic login-state checks and automatic refresh of the saved session.
+
+The monitor never touches Playwright directly: it is given small callables
+(current URL, current cookies, save storage state) so the engine can run it
+on the browser thread and a test can drive it with a fake cookie jar and
+clock.
+"""
+import re
+import time
+from typing import Callable, Dict, List, Optional
+
+from kling_cache import atomic_write_json
+
+HEALTHY = "healthy"
+EXPIRING = "expiring"
+EXPIRED = "expired"
+UNKNOWN = "unknown"  # no auth cookie seen yet (not logged in so far)
+
+LOGIN_URL_PATTERN = re.compile(r"/(login|sign-?in|sign-?up|auth)\b", re.IGNORECASE)
+AUTH_COOKIE_PATTERN = re.compile(r"session|auth|token|__client", re.IGNORECASE)
+
+
+def auth_cookies(cookies: List[Dict]) -> List[Dict]:
+    return [c for c in cookies if AUTH_COOKIE_PATTERN.search(c.get('name', ''))]
+
+
+def earliest_expiry(cookies: List[Dict]) -> Optional[float]:
+    """Earliest expiry among cookies that have one (-1 / missing = session cookie, no expiry)"""
+    expiries = [c['expires'] for c in cookies if c.get('expires', -1) > 0]
+    return min(expiries) if expiries else None
+
+
+class SessionMonitor:
+    def __init__(self, get_url: Callable[[], str], get_cookies: Callable[[], List[Dict]],
+                 get_storage_state: Callable[[], Dict], state_file: str = "state.json",
+                 check_interval: float = 60.0, refresh_interval: float = 900.0,
+                 expiry_margin: float = 600.0, clock: Callable[[], float] = time.time):
+        self.get_url = get_url
+        self.get_cookies = get_cookies
+        self.get_storage_state = get_storage_state
+        self.state_file = state_file
+        self.check_interval = check_interval
+        self.refresh_interval = refresh_interval
+        self.expiry_margin = expiry_margin  # warn this long before the auth cookies expire
+        self.clock = clock
+
+        self.state = UNKNOWN
+        self.reason = ""
+        self.seen_auth = False  # an auth cookie was present at some point (we were logged in)
+        self.last_check = 0.0
+        self.last_refresh = 0.0
+
+    def probe(self) -> tuple:
+        """(state, reason) from the page URL and the cookie jar"""
+        now = self.clock()
+        url = self.get_url() or ""
+        if LOGIN_URL_PATTERN.search(url):
+            return EXPIRED, f"redirected to {url}"
+        cookies = auth_cookies(self.get_cookies())
+        live = [c for c in cookies if not (0 < c.get('expires', -1) <= now)]
+        if not live:
+            if self.seen_auth:
+                return EXPIRED, "auth cookies expired or removed"
+            return UNKNOWN, "no auth cookie yet"
+        self.seen_auth = True
+        expiry = earliest_expiry(live)
+        if expiry is not None and expiry - now <= self.expiry_margin:
+            return EXPIRING, f"auth cookie expires in {int(expiry - now)}s"
+        return HEALTHY, ""
+
+    def due(self) -> bool:
+        return self.clock() - self.last_check >= self.check_interval
+
+    def check(self, force: bool = False) -> Optional[str]:
+        """Run a probe when one is due (or forced). Returns the new state when it changed, else None."""
+        if not force and not self.due():
+            return None
+        self.last_check = self.clock()
+        state, self.reason = self.probe()
+        changed = state != self.state
+        self.state = state
+        if state in (HEALTHY, EXPIRING) and (changed or self.clock() - self.last_refresh >= self.refresh_interval):
+            self.refresh()  # right after (re)login, then periodically
+        return state if changed else None
+
+    def refresh(self) -> bool:
+        """Save the live storage state over state.json; only ever called while logged in"""
+        try:
+            atomic_write_json(self.state_file, self.get_storage_state())
+        except Exception:
+            return False
+        self.last_refresh = self.clock()
+        return True
+
+    def reset(self):
+        """Forget the last result (e.g. after the user logged in again); the next check probes immediately"""
+        self.state = UNKNOWN
+        self.reason = ""
+        self.last_check = 0.0
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Record a live session for offline replay (see replay_harness.py).
+
+A recording directory holds:
+    session.har         network traffic (Playwright HAR, bodies in side files)
+    dom/NNNNNN.html.gz  page snapshots, written only when the DOM changed
+    dom/index.json      [[seconds since start, file name], ...]
+    meta.json           base URL, start time, snapshot interval
+"""
+import gzip
+import time
+import hashlib
+from pathlib import Path
+from typing import Dict, List
+
+from kling_cache import atomic_write_json, load_json
+
+HAR_FILE = "session.har"
+DOM_DIR = "dom"
+INDEX_FILE = "index.json"
+META_FILE = "meta.json"
+
+
+def load_snapshot_index(recording_dir: Path) -> List[list]:
+    return load_json(Path(recording_dir) / DOM_DIR / INDEX_FILE, default=[])
+
+
+def read_snapshot(recording_dir: Path, name: str) -> str:
+    with gzip.open(Path(recording_dir) / DOM_DIR / name, "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+class Recorder:
+    def __init__(self, out_dir: str, base_url: str, snapshot_interval: float = 5.0):
+        self.dir = Path(out_dir)
+        self.dom_dir = self.dir / DOM_DIR
+        self.dom_dir.mkdir(parents=True, exist_ok=True)
+        self.base_url = base_url
+        self.snapshot_interval = snapshot_interval
+        self.started_at = time.time()
+        self.last_snapshot = 0.0
+        self.last_digest = None
+        self.index: List[list] = []
+
+    def context_options(self) -> Dict:
+        """Extra browser.new_context() options; the HAR is written when the context closes"""
+        return {
+            'record_har_path': str(self.dir / HAR_FILE),
+            'record_har_content': "attach",
+        }
+
+    def maybe_snapshot(self, page, force: bool = False) -> bool:
+        """Save the DOM if the interval elapsed and it changed (browser thread only)"""
+        now = time.time()
+        if not force and now - self.last_snapshot < self.snapshot_interval:
+            return False
+        self.last_snapshot = now
+        try:
+            html = page.content()
+        except Exception:
+            return False
+        digest = hashlib.sha1(html.encode("utf-8")).hexdigest()
+        if digest == self.last_digest:
+            return False
+        self.last_digest = digest
+        name = f"{len(self.index):06d}.html.gz"
+        with gzip.open(self.dom_dir / name, "wt", encoding="utf-8") as f:
+            f.write(html)
+        self.index.append([round(now - self.started_at, 3), name])
+        atomic_write_json(self.dom_dir / INDEX_FILE, self.index)
+        return True
+
+    def finish(self):
+        atomic_write_json(self.dir / META_FILE, {
+            'base_url': self.base_url,
+            'started_at': self.started_at,
+            'duration': round(time.time() - self.started_at, 3),
+            'snapshot_interval': self.snapshot_interval,
+            'snapshots': len(self.index),
+        })
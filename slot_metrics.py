@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Slot occupancy over time, render/download times and a short history for charts.
+
+The engine reports the number of rendering articles each time it counts
+them.  Between two observations the slots are assumed to stay as last
+seen, which gives slot-seconds spent busy, idle, and idle while jobs were
+waiting (the scheduler's fault, not the site's).  Counts above
+max_concurrent are kept, so oversubscription shows up instead of being
+clipped away.
+"""
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from stage_profiler import percentile
+
+MAX_SAMPLES = 2000  # render/download durations kept for percentiles
+SERIES_INTERVAL = 10.0  # seconds between chart points
+SERIES_POINTS = 360  # one hour at the default interval
+RATE_WINDOW = 600.0  # jobs/hour in the chart is measured over the last 10 minutes
+
+
+class SlotMeter:
+    def __init__(self, max_concurrent: int, clock=time.time):
+        self.max_concurrent = max_concurrent
+        self.clock = clock
+        self.started_at = clock()
+        self.last_at: Optional[float] = None
+        self.last_active = 0
+        self.last_pending = 0
+        self.busy = 0.0  # slot-seconds with a render in the slot
+        self.idle = 0.0  # slot-seconds empty
+        self.starved = 0.0  # slot-seconds empty while jobs were pending
+        self.oversubscribed = 0.0  # seconds with more renders than slots
+        self.peak_active = 0
+        self.completed = 0
+        self.render_times = deque(maxlen=MAX_SAMPLES)
+        self.download_times = deque(maxlen=MAX_SAMPLES)
+        self.series = deque(maxlen=SERIES_POINTS)  # (time, active, pending, completed)
+        self.next_point_at = self.started_at
+
+    def observe(self, active: int, pending: int):
+        """Slots seen in use right now and jobs waiting for one"""
+        now = self.clock()
+        if self.last_at is not None:
+            dt = now - self.last_at
+            used = min(self.last_active, self.max_concurrent)
+            free = self.max_concurrent - used
+            self.busy += used * dt
+            self.idle += free * dt
+            if self.last_pending:
+                self.starved += free * dt
+            if self.last_active > self.max_concurrent:
+                self.oversubscribed += dt
+        self.last_at = now
+        self.last_active = active
+        self.last_pending = pending
+        self.peak_active = max(self.peak_active, active)
+        if now >= self.next_point_at:
+            self.series.append((now, active, pending, self.completed))
+            self.next_point_at = now + SERIES_INTERVAL
+
+    def job_finished(self, render_seconds: Optional[float], download_seconds: Optional[float]):
+        self.completed += 1
+        if render_seconds is not None:
+            self.render_times.append(render_seconds)
+        if download_seconds is not None:
+            self.download_times.append(download_seconds)
+
+    def jobs_per_hour(self, now: Optional[float] = None) -> Optional[float]:
+        """Completions per hour since the start of the run; None in the first minute"""
+        elapsed = (now or self.clock()) - self.started_at
+        return self.completed * 3600.0 / elapsed if elapsed >= 60 else None
+
+    def rate_series(self):
+        """jobs/hour at each chart point, over the RATE_WINDOW before it"""
+        rates = []
+        points = list(self.series)
+        start = 0
+        for t, _, _, completed in points:
+            while points[start][0] < t - RATE_WINDOW:
+                start += 1
+            t0, c0 = points[start][0], points[start][3]
+            rates.append((completed - c0) * 3600.0 / (t - t0) if t > t0 else 0.0)
+        return rates
+
+    @staticmethod
+    def _percentiles(values) -> Dict[str, float]:
+        values = sorted(values)
+        if not values:
+            return {}
+        return {'p50': percentile(values, 50), 'p90': percentile(values, 90), 'p95': percentile(values, 95), 'max': values[-1]}
+
+    def snapshot(self, series: bool = True) -> Dict:
+        slot_seconds = self.busy + self.idle
+        snap = {
+            'max_concurrent': self.max_concurrent,
+            'active': self.last_active,
+            'peak_active': self.peak_active,
+            'utilization': self.busy / slot_seconds if slot_seconds else None,
+            'idle_share': self.idle / slot_seconds if slot_seconds else None,
+            'starved_share': self.starved / slot_seconds if slot_seconds else None,
+            'oversubscribed_seconds': round(self.oversubscribed, 1),
+            'jobs_per_hour': self.jobs_per_hour(),
+            'render_seconds': self._percentiles(self.render_times),
+            'download_seconds': self._percentiles(self.download_times),
+        }
+        if series:
+            t0 = self.started_at
+            snap['series'] = {
+                't': [round(t - t0, 1) for t, _, _, _ in self.series],
+                'active': [a for _, a, _, _ in self.series],
+                'pending': [p for _, _, p, _ in self.series],
+                'jobs_per_hour': [round(r, 1) for r in self.rate_series()],
+            }
+        return snap
+
+    def summary(self) -> str:
+        s = self.snapshot(series=False)
+        if s['utilization'] is None:
+            return "no slot data"
+        text = (f"slots busy {s['utilization']:.0%}, idle {s['idle_share']:.0%} "
+                f"(idle with jobs waiting {s['starved_share']:.0%}), peak {s['peak_active']}/{self.max_concurrent}")
+        if s['oversubscribed_seconds']:
+            text += f", oversubscribed {s['oversubscribed_seconds']:.0f}s"
+        if s['render_seconds']:
+            text += f" | render p50 {s['render_seconds']['p50']:.0f}s p95 {s['render_seconds']['p95']:.0f}s"
+        if s['download_seconds']:
+            text += f" | download p50 {s['download_seconds']['p50']:.1f}s"
+        return text
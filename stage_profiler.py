@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Wall-clock time per engine stage (upload, polling, matching, download, ...)."""
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+MAX_SAMPLES = 5000  # per stage, for the percentiles; count/total cover every sample
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+class StageProfiler:
+    def __init__(self):
+        self.samples: Dict[str, deque] = {}
+        self.counts: Dict[str, int] = {}
+        self.totals: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        if name not in self.samples:
+            self.samples[name] = deque(maxlen=MAX_SAMPLES)
+            self.counts[name] = 0
+            self.totals[name] = 0.0
+        self.samples[name].append(seconds)
+        self.counts[name] += 1
+        self.totals[name] += seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def reset(self):
+        self.samples.clear()
+        self.counts.clear()
+        self.totals.clear()
+
+    def report(self) -> Dict[str, Dict]:
+        out = {}
+        for name in sorted(self.samples, key=lambda n: -self.totals[n]):
+            values = sorted(self.samples[name])
+            out[name] = {
+                'count': self.counts[name],
+                'total': self.totals[name],
+                'mean': self.totals[name] / self.counts[name],
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'max': values[-1],
+            }
+        return out
+
+    def report_lines(self) -> List[str]:
+        return [f"{name:<16} n={s['count']:<6} total={s['total']:8.1f}s mean={s['mean'] * 1000:7.0f}ms "
+                f"p50={s['p50'] * 1000:6.0f}ms p95={s['p95'] * 1000:6.0f}ms max={s['max'] * 1000:6.0f}ms"
+                for name, s in self.report().items()]
+
+    def save(self, path):
+        Path(path).write_text(json.dumps(self.report(), indent=2), encoding="utf-8")
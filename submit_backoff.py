@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Site throttling / rejection signals and the global submission backoff.
+
+Clicking Generate is not proof that a render was queued: the site may
+answer with a rate-limit toast, an HTTP 429/4xx, or simply never add the
+article.  The engine classifies what it saw after the click:
+
+- THROTTLED: the site wants us to slow down (429, "too many requests",
+  "limit reached", ...).  Not the job's fault: it goes back to pending
+  without spending its retry budget.
+- REJECTED: this submission was refused (other 4xx, error toast, no new
+  article).  Spends the job's REJECTED budget.
+
+Either way no article position is assigned, and SubmitBackoff holds every
+further submission back, doubling the pause for each consecutive signal
+and resetting after the next confirmed submission.
+"""
+import random
+import re
+import time
+from typing import Optional
+
+from retry_policy import JobFailure, THROTTLED, REJECTED
+
+BASE_DELAY = 30.0
+MAX_DELAY = 900.0
+
+THROTTLE_TEXT = re.compile(
+    r"too many|rate.?limit|slow down|try again later|limit (reached|exceeded)|quota|"
+    r"high demand|busy|concurrent|at capacity", re.IGNORECASE)
+ERROR_TEXT = re.compile(r"error|failed|fail to|unable|rejected|not allowed|violat|insufficient|invalid", re.IGNORECASE)
+
+
+class SubmitRefused(JobFailure):
+    """The site refused a submission; article_added when a (failed) article still took a feed slot"""
+    def __init__(self, failure_class: str, message: str, article_added: bool = False):
+        super().__init__(failure_class, message)
+        self.article_added = article_added
+
+
+def classify_status(status: int) -> Optional[str]:
+    """Failure class for a submit response status (None when it is not a refusal)"""
+    if status == 429 or status == 503:
+        return THROTTLED
+    if 400 <= status < 500 and status not in (401, 403):
+        return REJECTED  # 401/403 are left to the session monitor
+    return None
+
+
+def classify_message(text: str) -> Optional[str]:
+    """Failure class for a toast / error badge text (None for unrelated notices)"""
+    if THROTTLE_TEXT.search(text):
+        return THROTTLED
+    if ERROR_TEXT.search(text):
+        return REJECTED
+    return None
+
+
+class SubmitBackoff:
+    def __init__(self, base_delay: float = BASE_DELAY, max_delay: float = MAX_DELAY):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.strikes = 0  # consecutive throttle/rejection signals
+        self.until = 0.0
+        self.reason = ""
+        self.total = 0
+
+    def record(self, reason: str) -> float:
+        """Another refusal: pause submissions for an exponentially growing, jittered delay"""
+        self.strikes += 1
+        self.total += 1
+        delay = min(self.max_delay, self.base_delay * (2 ** (self.strikes - 1)))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        self.until = max(self.until, time.time() + delay)
+        self.reason = reason
+        return delay
+
+    def record_success(self):
+        self.strikes = 0
+
+    def remaining(self) -> float:
+        return max(0.0, self.until - time.time())
+
+    def active(self) -> bool:
+        return self.until > time.time()
+
+    def report(self) -> dict:
+        return {'remaining': round(self.remaining(), 1), 'strikes': self.strikes,
+                'total': self.total, 'reason': self.reason}
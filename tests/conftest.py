@@ -0,0 +1,13 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The modules live flat at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(autouse=True)
+def scratch_cwd(tmp_path, monkeypatch):
+    """Caches (.kling_cache) and state files land in a per-test directory"""
+    monkeypatch.chdir(tmp_path)
@@ -0,0 +1,54 @@
+import json
+import urllib.request
+
+import pytest
+
+from control_server import ControlServer
+from kling_engine import KlingEngine
+
+
+@pytest.fixture
+def server(tmp_path):
+    engine = KlingEngine(str(tmp_path), headless=True)
+    server = ControlServer(engine, "127.0.0.1", 0)
+    server.start()
+    yield server
+    server.shutdown()
+
+
+def request(server, path, body=None):
+    host, port = server.address
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(f"http://{host}:{port}{path}", data=data, method="POST" if data is not None else "GET")
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return resp.status, json.loads(resp.read())
+
+
+def test_status_returns_snapshot(server):
+    status, body = request(server, "/status")
+    assert status == 200
+    assert body['state'] == "starting"  # no browser launched
+    assert body['total'] == 0
+    assert 'progress' in body and 'slots' in body
+
+
+def test_pause_and_resume(server):
+    assert request(server, "/pause", {}) == (200, {'state': 'paused'})
+    assert server.engine.is_paused()
+    assert request(server, "/status")[1]['state'] == "paused"
+    request(server, "/resume", {})
+    assert not server.engine.is_paused()
+
+
+def test_bad_requests(server):
+    with pytest.raises(urllib.error.HTTPError) as err:
+        request(server, "/policy", {'policy': 'nope'})
+    assert err.value.code == 400
+    with pytest.raises(urllib.error.HTTPError) as err:
+        request(server, "/nowhere", {})
+    assert err.value.code == 404
+
+
+def test_non_loopback_requires_token(tmp_path):
+    with pytest.raises(ValueError):
+        ControlServer(KlingEngine(str(tmp_path)), "0.0.0.0", 0)
@@ -0,0 +1,120 @@
+import threading
+
+import pytest
+
+import output_sinks
+from output_sinks import LocalSink, OutputSink, SinkWriter, build_sink
+
+
+@pytest.fixture
+def video(tmp_path):
+    src = tmp_path / "src" / "1.mp4"
+    src.parent.mkdir()
+    src.write_bytes(b"\0" * 4096)
+    return src
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(output_sinks, "RETRY_DELAY", 0)
+
+
+class FlakySink(OutputSink):
+    """Fails the first `failures` puts, then succeeds"""
+    def __init__(self, failures):
+        self.name = f"flaky{failures}"
+        self.failures = failures
+        self.puts = 0
+
+    def put(self, src, key):
+        self.puts += 1
+        if self.puts <= self.failures:
+            raise OSError("share unavailable")
+
+
+class BlockedSink(OutputSink):
+    name = "blocked"
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def put(self, src, key):
+        self.started.set()
+        self.release.wait(5)
+
+
+def test_build_sink_specs(tmp_path):
+    assert isinstance(build_sink(f"local:{tmp_path}"), LocalSink)
+    assert build_sink(f"mirror:{tmp_path}").durable
+    with pytest.raises(ValueError):
+        build_sink("ftp://host/dir")
+
+
+@pytest.mark.parametrize("durable", [False, True])
+def test_local_delivery_and_skip(tmp_path, video, durable):
+    sink = LocalSink(str(tmp_path / "out"), durable=durable)
+    writer = SinkWriter([sink])
+    writer.submit(video, "folder/1.mp4")
+    writer.close()
+    delivered = tmp_path / "out" / "folder" / "1.mp4"
+    assert delivered.read_bytes() == video.read_bytes()
+    assert not list(delivered.parent.glob("*.part"))
+
+    writer = SinkWriter([sink])
+    writer.submit(video, "folder/1.mp4")  # same size already there
+    writer.close()
+    report = writer.report()['sinks'][sink.name]
+    assert report['skipped'] == 1 and report['files'] == 0
+
+
+def test_retry_then_success(video):
+    sink = FlakySink(failures=output_sinks.ATTEMPTS - 1)
+    writer = SinkWriter([sink])
+    writer.submit(video, "a/1.mp4")
+    writer.close()
+    assert sink.puts == output_sinks.ATTEMPTS
+    assert writer.report()['sinks'][sink.name]['files'] == 1
+    assert not writer.failed
+
+
+def test_gives_up_after_attempts(video):
+    sink = FlakySink(failures=output_sinks.ATTEMPTS)
+    logs = []
+    writer = SinkWriter([sink], log=lambda level, msg: logs.append(level))
+    writer.submit(video, "a/1.mp4")
+    writer.close()
+    assert writer.report()['sinks'][sink.name]['failures'] == 1
+    assert writer.failed == [f"{sink.name}: a/1.mp4"]
+    assert logs.count("WARNING") == output_sinks.ATTEMPTS - 1 and "ERROR" in logs
+
+
+def test_submit_never_blocks_on_a_stuck_sink(video):
+    sink = BlockedSink()
+    writer = SinkWriter([sink], workers=1, max_queued=2)
+    done = threading.Event()
+
+    def submit_many():
+        for i in range(20):
+            writer.submit(video, f"a/{i}.mp4")
+        done.set()
+
+    threading.Thread(target=submit_many, daemon=True).start()
+    assert done.wait(2), "submit() blocked behind a stuck sink"
+    assert writer.report()['queued'] == 20
+    sink.release.set()
+    writer.close()
+    assert writer.report()['queued'] == 0
+
+
+def test_close_without_wait_lists_undelivered(video):
+    sink = BlockedSink()
+    writer = SinkWriter([sink], workers=1, max_queued=2)
+    for i in range(5):
+        writer.submit(video, f"a/{i}.mp4")
+    assert sink.started.wait(2)
+    writer.close(wait=False)
+    # One delivery is running; everything that had not started is dropped and listed
+    assert writer.report()['queued'] == 1
+    assert len(writer.dropped) == 4
+    sink.release.set()
@@ -0,0 +1,41 @@
+import threading
+import time
+
+import pytest
+
+from sampling_profiler import SamplingProfiler
+
+greenlet = pytest.importorskip("greenlet")
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def dispatcher():
+    busy(0.3)
+
+
+def engine_step():
+    # What Playwright's sync API does while it waits: run the dispatcher in another greenlet
+    greenlet.greenlet(dispatcher).switch()
+
+
+def test_waits_are_charged_to_the_engine_step():
+    profiler = SamplingProfiler(interval=0.005)
+
+    def engine():
+        profiler.start()
+        engine_step()
+        profiler.stop()
+
+    thread = threading.Thread(target=engine)
+    thread.start()
+    thread.join()
+
+    stack, _ = profiler.stacks.most_common(1)[0]
+    names = [name.split(":")[1] for name in stack]
+    assert names[-2:] == ["dispatcher", "busy"]
+    assert names.index("engine") < names.index("engine_step") < names.index("dispatcher")
@@ -0,0 +1,80 @@
+import json
+
+from kling_engine import KlingEngine
+from session_monitor import SessionMonitor, HEALTHY, EXPIRING, EXPIRED, UNKNOWN
+
+
+class FakeBrowser:
+    """Cookie jar, URL and clock the monitor reads instead of Playwright"""
+    def __init__(self):
+        self.now = 1000.0
+        self.url = "https://site/create/video"
+        self.cookies = []
+
+    def login(self, expires):
+        self.cookies = [{'name': 'session_token', 'value': 'x', 'expires': expires}]
+
+    def monitor(self, **kwargs):
+        return SessionMonitor(
+            get_url=lambda: self.url,
+            get_cookies=lambda: self.cookies,
+            get_storage_state=lambda: {'cookies': self.cookies},
+            clock=lambda: self.now,
+            **kwargs,
+        )
+
+
+def test_states_follow_the_cookie_jar():
+    browser = FakeBrowser()
+    monitor = browser.monitor(check_interval=60, expiry_margin=600)
+    assert monitor.check(force=True) is None and monitor.state == UNKNOWN  # not logged in yet
+
+    browser.login(expires=browser.now + 3600)
+    assert monitor.check(force=True) == HEALTHY
+
+    browser.now += 3000  # 600 s left
+    assert monitor.check() == EXPIRING
+    assert monitor.check() is None  # not due again yet
+
+    browser.now += 700
+    assert monitor.check() == EXPIRED
+    assert "expired" in monitor.reason
+
+
+def test_login_redirect_is_expired():
+    browser = FakeBrowser()
+    browser.login(expires=-1)  # session cookie, no expiry
+    monitor = browser.monitor()
+    assert monitor.check(force=True) == HEALTHY
+    browser.url = "https://site/login?next=/create"
+    assert monitor.check(force=True) == EXPIRED
+
+
+def test_refresh_saves_state_while_logged_in(tmp_path):
+    browser = FakeBrowser()
+    state_file = tmp_path / "state.json"
+    monitor = browser.monitor(state_file=str(state_file), refresh_interval=900)
+    monitor.check(force=True)
+    assert not state_file.exists()  # never saved while logged out
+
+    browser.login(expires=browser.now + 86400)
+    monitor.check(force=True)
+    assert json.loads(state_file.read_text())['cookies'][0]['name'] == "session_token"
+
+
+def test_expiry_pauses_the_engine(tmp_path):
+    browser = FakeBrowser()
+    browser.login(expires=browser.now + 3600)
+    engine = KlingEngine(str(tmp_path), headless=True)
+    engine.session_monitor = browser.monitor(state_file=str(tmp_path / "state.json"))
+    events = []
+    engine.add_event_listener(events.append)
+    log = lambda level, msg: None
+
+    assert engine.check_session(log, force=True)
+    assert not engine.is_paused()
+
+    browser.now += 3700  # auth cookie gone
+    assert not engine.check_session(log, force=True)
+    assert engine.is_paused()
+    assert [e['type'] for e in events if e['type'].startswith('session_')] == ["session_ok", "session_expired"]
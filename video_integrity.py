@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""MP4 download verification and the index of outputs already verified.
+
+A video counts as complete only when its top-level ISO-BMFF boxes parse,
+their sizes add up exactly to the file size, and both ftyp and moov are
+present.  Verified files are remembered by (size, mtime) so reruns skip the
+check entirely.
+"""
+import struct
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from kling_cache import cache_dir, load_json, atomic_write_json
+
+MIN_VIDEO_BYTES = 16 * 1024
+
+
+def read_top_level_boxes(path: Path) -> List[Tuple[str, int, int]]:
+    """Return [(type, offset, size)] for the top-level boxes; raises ValueError on bad layout"""
+    boxes = []
+    file_size = path.stat().st_size
+    with open(path, "rb") as f:
+        offset = 0
+        while offset < file_size:
+            if file_size - offset < 8:
+                raise ValueError(f"trailing {file_size - offset} bytes after last box")
+            f.seek(offset)
+            size, box_type = struct.unpack(">I4s", f.read(8))
+            header = 8
+            if size == 1:
+                large = f.read(8)
+                if len(large) < 8:
+                    raise ValueError("truncated 64-bit box header")
+                size = struct.unpack(">Q", large)[0]
+                header = 16
+            elif size == 0:
+                size = file_size - offset  # box runs to end of file
+            name = box_type.decode("latin-1")
+            if size < header:
+                raise ValueError(f"box '{name}' at {offset} has invalid size {size}")
+            if offset + size > file_size:
+                raise ValueError(f"box '{name}' at {offset} runs past end of file (truncated)")
+            boxes.append((name, offset, size))
+            offset += size
+    return boxes
+
+
+def validate_mp4(path: Path) -> Tuple[bool, str]:
+    try:
+        size = path.stat().st_size
+    except OSError as e:
+        return False, str(e)
+    if size < MIN_VIDEO_BYTES:
+        return False, f"file too small ({size} bytes)"
+    try:
+        boxes = read_top_level_boxes(path)
+    except (OSError, ValueError, struct.error) as e:
+        return False, str(e)
+    types = [b[0] for b in boxes]
+    if not types or types[0] != "ftyp":
+        return False, "missing ftyp box"
+    if "moov" not in types:
+        return False, "missing moov box"
+    return True, "ok"
+
+
+def mp4_duration(path: Path) -> Optional[float]:
+    """Duration in seconds from the movie header (moov/mvhd), without decoding anything"""
+    try:
+        moov = next((offset, size) for name, offset, size in read_top_level_boxes(path) if name == "moov")
+    except (OSError, ValueError, struct.error, StopIteration):
+        return None
+    with open(path, "rb") as f:
+        offset, end = moov[0] + 8, moov[0] + moov[1]
+        while offset + 8 <= end:
+            f.seek(offset)
+            size, box_type = struct.unpack(">I4s", f.read(8))
+            if size < 8:
+                return None
+            if box_type == b"mvhd":
+                version = f.read(4)[0]
+                if version == 1:
+                    _, _, timescale, duration = struct.unpack(">QQIQ", f.read(28))
+                else:
+                    _, _, timescale, duration = struct.unpack(">IIII", f.read(16))
+                return duration / timescale if timescale else None
+            offset += size
+    return None
+
+
+class VerifiedIndex:
+    """Outputs that passed validation, keyed by path and valid while (size, mtime) match"""
+    FILE = "verified.json"
+
+    def __init__(self):
+        self.path = cache_dir() / self.FILE
+        self.entries = load_json(self.path)
+        self.dirty = False
+
+    def is_verified(self, video: Path) -> bool:
+        entry = self.entries.get(str(video.resolve()))
+        if not entry:
+            return False
+        try:
+            st = video.stat()
+        except OSError:
+            return False
+        return entry[0] == st.st_size and entry[1] == st.st_mtime_ns
+
+    def add(self, video: Path, sha: Optional[str] = None):
+        st = video.stat()
+        self.entries[str(video.resolve())] = [st.st_size, st.st_mtime_ns, sha]
+        self.dirty = True
+
+    def check(self, video: Path) -> Tuple[bool, str]:
+        """Validate an existing output unless it is already indexed"""
+        if self.is_verified(video):
+            return True, "ok"
+        ok, reason = validate_mp4(video)
+        if ok:
+            self.add(video)
+        return ok, reason
+
+    def save(self):
+        if self.dirty:
+            atomic_write_json(self.path, self.entries)
+            self.dirty = False